@@ -4,20 +4,31 @@ Executes exactly ONE action and takes screenshot
 Uses UIAutomator to find real coordinates when LLM provides generic ones
 Never assumes success
 """
-from tools.adb_tools import tap, type_text, type_text_slow, keyevent, keycombination, swipe, open_app, find_element_by_text, bounds_to_center, dump_ui, get_ui_text, resolve_element_to_center
+from tools.adb_tools import tap, type_text, type_text_slow, keyevent, keycombination, swipe, open_app, find_element_by_text, bounds_to_center, dump_ui, get_ui_text, resolve_element_to_center, normalize_text
 import xml.etree.ElementTree as ET
-from tools.screenshot import take_screenshot
-from config import OBSIDIAN_PACKAGE, get_target_package, OPENAI_API_KEY, OPENAI_MODEL, USE_XML_ELEMENT_ACTIONS
+from tools.screenshot import take_screenshot, encode_screenshot, settle_wait, image_content
+from tools.llm_client import get_shared_http_client, parse_json, parse_model_json
+from config import OBSIDIAN_PACKAGE, get_target_package, OPENAI_API_KEY, OPENAI_MODEL, USE_XML_ELEMENT_ACTIONS, ADAPTIVE_WAIT
 from openai import OpenAI
-from PIL import Image
-import base64
-import io
 import json
 import os
 import re
 import time
 
 
+# First flat JSON object in a model reply
+_JSON_OBJECT_RE = re.compile(r'\{[^}]+\}', re.DOTALL)
+# Settings gear lookup reply: simple {"found": ...} object, any object, then "found" anywhere
+_FOUND_JSON_RES = (
+    re.compile(r'\{[^{}]*"found"[^{}]*\}', re.DOTALL),
+    _JSON_OBJECT_RE,
+    re.compile(r'\{.*?"found".*?\}', re.DOTALL),
+)
+
+# OpenAI client for the Settings vision fallbacks (shares the process-wide connection pool)
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=get_shared_http_client())
+
+
 def execute_action(action, logger=None, target_package=None):
     """
     Execute exactly ONE action
@@ -241,11 +252,8 @@ def execute_action(action, logger=None, target_package=None):
                         
                         if menu_bounds:
                             # Parse bounds: [945,154][1042,241] -> center = (994, 197)
-                            bounds_match = re.search(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', menu_bounds)
-                            if bounds_match:
-                                x1, y1, x2, y2 = map(int, bounds_match.groups())
-                                tap_x = (x1 + x2) // 2
-                                tap_y = (y1 + y2) // 2
+                            tap_x, tap_y = bounds_to_center(menu_bounds)
+                            if tap_x is not None:
                                 print(f"  ✓ Tapping 'More options' button center at ({tap_x}, {tap_y})")
                                 tap(tap_x, tap_y)
                                 time.sleep(2.0)  # Wait for menu to appear from below
@@ -607,11 +615,8 @@ def execute_action(action, logger=None, target_package=None):
                             all_text.append(content_desc)
                     
                     # Normalize text for comparison
-                    def normalize(s):
-                        return ''.join(c.lower() for c in s if c.isalnum())
-                    
-                    text_normalized = normalize(text)
-                    ui_blob = normalize(" ".join(all_text))
+                    text_normalized = normalize_text(text)
+                    ui_blob = normalize_text(" ".join(all_text))
                     
                     if text_normalized in ui_blob:
                         print(f"  ✓ Verified: '{text}' appears in UI")
@@ -644,7 +649,7 @@ def execute_action(action, logger=None, target_package=None):
                                 if content_desc:
                                     all_text.append(content_desc)
                             
-                            ui_blob = normalize(" ".join(all_text))
+                            ui_blob = normalize_text(" ".join(all_text))
                             if text_normalized in ui_blob:
                                 print(f"  ✓ Verified after retry: '{text}' appears in UI")
                                 verified = True
@@ -692,7 +697,12 @@ def execute_action(action, logger=None, target_package=None):
         elif action_type == "wait":
             seconds = action.get("seconds", 1)
             print(f"  ⏳ Wait: {description} ({seconds}s)")
-            time.sleep(seconds)
+            if ADAPTIVE_WAIT:
+                waited = settle_wait(seconds)
+                if waited < seconds:
+                    print(f"  ⚡ Screen settled after {waited:.1f}s")
+            else:
+                time.sleep(seconds)
             
         elif action_type == "open_app":
             app = action.get("app", pkg)
@@ -756,11 +766,8 @@ def execute_action(action, logger=None, target_package=None):
                         print(f"  🔍 Verifying we're in Settings screen using LLM vision...")
                         try:
                             verify_screenshot = take_screenshot(f"settings_verification_{int(time.time())}.png")
-                            img = Image.open(verify_screenshot)
-                            img_buffer = io.BytesIO()
-                            img.save(img_buffer, format='PNG')
-                            img_buffer.seek(0)
-                            img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+                            # Yes/no check: a downscaled WebP is plenty and uploads much faster than the PNG
+                            screenshot_url = encode_screenshot(verify_screenshot)
                             verify_prompt = """Look at this screenshot. We just tapped the Settings icon.
 
 Are we currently in the Settings screen? Look for:
@@ -775,7 +782,6 @@ Return ONLY a JSON object:
 }
 
 If you see Settings screen elements, return {"in_settings": true}. Otherwise {"in_settings": false}."""
-                            client = OpenAI(api_key=OPENAI_API_KEY)
                             response = client.chat.completions.create(
                                 model=OPENAI_MODEL,
                                 messages=[
@@ -783,7 +789,7 @@ If you see Settings screen elements, return {"in_settings": true}. Otherwise {"i
                                         "role": "user",
                                         "content": [
                                             {"type": "text", "text": verify_prompt},
-                                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
+                                            image_content(screenshot_url)
                                         ]
                                     }
                                 ],
@@ -791,9 +797,9 @@ If you see Settings screen elements, return {"in_settings": true}. Otherwise {"i
                                 temperature=0.1
                             )
                             response_text = response.choices[0].message.content.strip()
-                            json_match = re.search(r'\{[^}]+\}', response_text, re.DOTALL)
+                            json_match = _JSON_OBJECT_RE.search(response_text)
                             if json_match:
-                                verify_result = json.loads(json_match.group())
+                                verify_result = parse_json(json_match.group())
                                 if verify_result.get("in_settings"):
                                     print(f"  ✓ LLM confirmed: We're in Settings screen ({verify_result.get('reason', '')})")
                                 else:
@@ -811,12 +817,8 @@ If you see Settings screen elements, return {"in_settings": true}. Otherwise {"i
             if not settings_tapped:
                 print(f"  ⚠️  Settings not found via XML, trying LLM vision (may use API quota)...")
                 try:
-                    # Read and encode screenshot
-                    img = Image.open(screenshot_path)
-                    img_buffer = io.BytesIO()
-                    img.save(img_buffer, format='PNG')
-                    img_buffer.seek(0)
-                    img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+                    # Full-resolution PNG (the model returns device pixel coordinates); no decode/re-encode
+                    png_url = encode_screenshot(screenshot_path, full_resolution=True)
                     
                     # Prompt to find Settings gear icon
                     settings_find_prompt = """Look at this screenshot. A sidebar has just opened from the left side of the screen.
@@ -839,7 +841,6 @@ If you cannot find it, return {"found": false}.
 
 IMPORTANT: Return ONLY valid JSON, no markdown, no code blocks, no explanations."""
                     
-                    client = OpenAI(api_key=OPENAI_API_KEY)
                     response = client.chat.completions.create(
                         model=OPENAI_MODEL,
                         messages=[
@@ -847,7 +848,7 @@ IMPORTANT: Return ONLY valid JSON, no markdown, no code blocks, no explanations.
                                 "role": "user",
                                 "content": [
                                     {"type": "text", "text": settings_find_prompt},
-                                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
+                                    {"type": "image_url", "image_url": {"url": png_url}}
                                 ]
                             }
                         ],
@@ -862,17 +863,11 @@ IMPORTANT: Return ONLY valid JSON, no markdown, no code blocks, no explanations.
                     settings_info = None
                     
                     # Try to find JSON in response
-                    json_patterns = [
-                        r'\{[^{}]*"found"[^{}]*\}',  # Simple JSON
-                        r'\{[^}]+\}',  # Any JSON object
-                        r'\{.*?"found".*?\}',  # JSON with "found" key
-                    ]
-                    
-                    for pattern in json_patterns:
-                        json_match = re.search(pattern, response_text, re.DOTALL)
+                    for pattern in _FOUND_JSON_RES:
+                        json_match = pattern.search(response_text)
                         if json_match:
                             try:
-                                settings_info = json.loads(json_match.group())
+                                settings_info = parse_json(json_match.group())
                                 break
                             except json.JSONDecodeError:
                                 continue
@@ -880,16 +875,8 @@ IMPORTANT: Return ONLY valid JSON, no markdown, no code blocks, no explanations.
                     # If no JSON found, try parsing the whole response
                     if not settings_info:
                         try:
-                            # Remove markdown code blocks if present
-                            clean_text = response_text
-                            if clean_text.startswith("```json"):
-                                clean_text = clean_text[7:]
-                            if clean_text.startswith("```"):
-                                clean_text = clean_text[3:]
-                            if clean_text.endswith("```"):
-                                clean_text = clean_text[:-3]
-                            clean_text = clean_text.strip()
-                            settings_info = json.loads(clean_text)
+                            # Parse the whole reply (a markdown code fence is allowed)
+                            settings_info = parse_model_json(response_text)
                         except json.JSONDecodeError:
                             print(f"  ⚠️  Could not parse LLM response as JSON")
                     
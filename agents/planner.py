@@ -2,26 +2,34 @@
 Planner Agent - Step-by-Step Visual Planning with Android State
 After each action, analyzes screenshot + Android state and decides the next single action
 """
-from openai import OpenAI
-from PIL import Image
+from openai import OpenAI, RateLimitError
+import hashlib
 import json
 import os
 import sys
-import base64
-import io
 import time
 import re
 import xml.etree.ElementTree as ET
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 # Add parent directory to path to import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import OPENAI_API_KEY, OBSIDIAN_PACKAGE, OPENAI_MODEL, REASONING_MODEL, OLLAMA_BASE_URL, USE_FUNCTION_CALLING, USE_REWARD_SELECTION, ENABLE_SUBGOAL_DETECTION, DISABLE_RL_FOR_BENCHMARKING, USE_XML_ELEMENT_ACTIONS
-from tools.adb_tools import detect_current_screen, get_ui_text, dump_ui, get_current_package_and_activity
+from config import OPENAI_API_KEY, OPENAI_MODEL, REASONING_MODEL, OLLAMA_BASE_URL, USE_FUNCTION_CALLING, USE_REWARD_SELECTION, ENABLE_SUBGOAL_DETECTION, DISABLE_RL_FOR_BENCHMARKING, USE_XML_ELEMENT_ACTIONS, ENABLE_DECISION_CACHE, DECISION_CACHE_TTL, ENABLE_VERDICT_CACHE, PREFETCH_VISION, PLANNER_TEMPERATURE, DEBUG_SCREENSHOT_COUNT
+from tools.adb_tools import dump_ui, bounds_to_center, get_full_state, get_current_package_and_activity, node_ui_text, extract_ui_text, normalize_text
 from tools.memory import memory
-from tools.llm_client import LLMClient
+from tools.screenshot import take_screenshot, get_screenshot_bytes, encode_screenshot, screenshot_ahash, image_content
+from tools.llm_client import LLMClient, get_shared_http_client, parse_json, parse_model_json, strip_json_fence, compute_backoff, retry_hint_seconds, count_image_parts, usage_tokens, canonical_json_bytes
 from tools.function_calling import get_action_function_schema, parse_function_call_response
 from tools.subgoal_detector import subgoal_detector
+from tools.decision_cache import DecisionCache
+
+
+http_client = get_shared_http_client()
+
+# LLM clients keyed by (reasoning_model, reasoning_base_url)
+_llm_clients = {}
 
 
 # LLM client will be initialized dynamically based on current REASONING_MODEL
@@ -33,23 +41,524 @@ def get_llm_client():
     reasoning_model = os.getenv("REASONING_MODEL", REASONING_MODEL)  # Fallback to config default
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", OLLAMA_BASE_URL)  # Fallback to config default
     is_ollama = ":" in reasoning_model or "ollama" in reasoning_model.lower()
-    return LLMClient(
-        vision_model=OPENAI_MODEL,
-        reasoning_model=reasoning_model,
-        vision_api_key=OPENAI_API_KEY,
-        reasoning_base_url=ollama_base_url if is_ollama else None
-    )
+    reasoning_base_url = ollama_base_url if is_ollama else None
+    key = (reasoning_model, reasoning_base_url)
+    if key not in _llm_clients:
+        # Reuse clients across calls so their connection pool (and warm sockets) is kept
+        _llm_clients[key] = LLMClient(
+            vision_model=OPENAI_MODEL,
+            reasoning_model=reasoning_model,
+            vision_api_key=OPENAI_API_KEY,
+            reasoning_base_url=reasoning_base_url,
+            http_client=http_client
+        )
+    return _llm_clients[key]
 
-# Initialize default client
-llm_client = get_llm_client()
+# No default LLMClient is built at import: steps that resolve from memory, the decision cache
+# or the rule gates never construct one; the first step that calls a model does, via get_llm_client()
 
 # Keep OpenAI client for backward compatibility (used in some places)
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+# Persistent decision cache (opt-in via ENABLE_DECISION_CACHE; database opened on first use)
+decision_cache = DecisionCache(ttl_seconds=DECISION_CACHE_TTL)
+
+
+# In-vault verdicts keyed by (screenshot ahash, check key, focused package/activity), oldest evicted first
+VAULT_SCAN_CACHE_SIZE = 128
+_vault_scan_cache = {}
+# Bump when VAULT_VERIFY_PROMPT / TEST2_VAULT_CHECK_PROMPT / the scan prompt change,
+# so verdicts persisted by ENABLE_VERDICT_CACHE are not reused across prompt versions
+VERDICT_PROMPT_VERSION = 3
+
+
+def _package_activity_key(package_activity):
+    """(package, activity) tuple of a focused-window dict, or None"""
+    return (package_activity.get("package"), package_activity.get("activity")) if package_activity else None
+
+
+def get_cached_vault_scan(image_hash, check_key, package_activity=None):
+    """
+    Return a cached in-vault verdict for this screen, or None
+
+    Verdicts are keyed by screenshot ahash, check and focused package/activity. A negative
+    verdict is also reused for a 1-bit ahash neighbour (same check and focus); a positive one
+    only on an exact match, since mostly-white Obsidian screens differ by few ahash bits and a
+    replayed in_vault=true would pass the test on the wrong screen.
+
+    Args:
+        image_hash: screenshot_ahash() of the current screenshot
+        check_key: Which check produced the verdict (test text for the Test 1 scan,
+            a fixed name such as "vault_verify" for the other vision checks)
+        package_activity: Focused {package, activity} the screenshot was taken on, or None
+    """
+    if image_hash is None:
+        return None
+    pkg_key = _package_activity_key(package_activity)
+    scan_result = _vault_scan_cache.get((image_hash, check_key, pkg_key))
+    if scan_result is not None:
+        return scan_result
+    for (cached_hash, cached_key, cached_pkg), cached_result in _vault_scan_cache.items():
+        if (cached_key == check_key and cached_pkg == pkg_key and not cached_result.get("in_vault")
+                and bin(cached_hash ^ image_hash).count("1") <= 1):
+            return cached_result
+    if ENABLE_VERDICT_CACHE and not DISABLE_RL_FOR_BENCHMARKING:
+        scan_result = decision_cache.get_verdict(
+            DecisionCache.make_verdict_key(image_hash, check_key, VERDICT_PROMPT_VERSION, pkg_key))
+        if scan_result is not None:
+            print(f"  💾 Vision verdict from persistent cache ({check_key[:30]})")
+            _vault_scan_cache[(image_hash, check_key, pkg_key)] = scan_result
+            return scan_result
+    return None
+
+
+def cache_vault_scan(image_hash, check_key, scan_result, package_activity=None):
+    """
+    Remember an in-vault verdict for this exact screen, check and focused package/activity
+
+    Only fresh verdicts come through here (never a neighbour match), so the persistent
+    verdict table (ENABLE_VERDICT_CACHE) holds exact-hash entries only.
+    """
+    if image_hash is None:
+        return
+    pkg_key = _package_activity_key(package_activity)
+    if len(_vault_scan_cache) >= VAULT_SCAN_CACHE_SIZE:
+        _vault_scan_cache.pop(next(iter(_vault_scan_cache)))  # drop oldest
+    _vault_scan_cache[(image_hash, check_key, pkg_key)] = scan_result
+    if ENABLE_VERDICT_CACHE and not DISABLE_RL_FOR_BENCHMARKING:
+        decision_cache.put_verdict(
+            DecisionCache.make_verdict_key(image_hash, check_key, VERDICT_PROMPT_VERSION, pkg_key), scan_result)
+
+
+def is_vault_verdict(result):
+    """Whether a parsed reply is an in-vault verdict (a dict with a boolean "in_vault")"""
+    return isinstance(result, dict) and isinstance(result.get("in_vault"), bool)
+
+
+# Last verdict per vision check, keyed by the Android state and screenshot it was made on
+_state_verdicts = {}
+
+
+def state_fingerprint(current_screen, package_activity, ui_text, image_hash):
+    """
+    Hash the state a vision check saw: screen, focused package/activity, UI text and screenshot
+
+    Returns:
+        Fingerprint, or None when the state cannot be told apart from other screens (no UI
+        text, e.g. a failed dump, or no screenshot hash) and a verdict must not be reused
+    """
+    if not ui_text or image_hash is None:
+        return None
+    return hash((current_screen, _package_activity_key(package_activity), tuple(ui_text), image_hash))
+
+
+def get_state_verdict(state_fp, check_key):
+    """Return the last verdict of this check if the Android state has not changed since, else None"""
+    entry = _state_verdicts.get(check_key)
+    if state_fp is not None and entry and entry[0] == state_fp:
+        return entry[1]
+    return None
+
+
+def remember_state_verdict(state_fp, check_key, verdict):
+    """Remember the verdict of a check for the state it was made on (one entry per check)"""
+    if state_fp is not None:
+        _state_verdicts[check_key] = (state_fp, verdict)
+
+
+# A model-planned "wait" is repeated without a model call while the frame stays the same
+# (screen still loading), at most this many times in a row
+UNCHANGED_WAIT_REUSES = 2
+
+
+def reuse_unchanged_wait(last_action, current_screen, screenshot_path, screenshot_bytes=None):
+    """
+    Repeat the previous model-planned wait if the screen has not changed since it was planned
+
+    Args:
+        last_action: Last executed action (carries "_frame_hash" if it was a planned wait)
+        current_screen: Detected screen name for this step
+        screenshot_path: Path to the current screenshot
+        screenshot_bytes: Optional PNG bytes already in memory
+
+    Returns:
+        Wait action dict, or None if the model should be asked
+    """
+    if not last_action or last_action.get("action") != "wait" or last_action.get("_frame_hash") is None:
+        return None
+    reuses = last_action.get("_frame_reuses", 0)
+    if reuses >= UNCHANGED_WAIT_REUSES:
+        return None
+    if (last_action.get("_android_state") or {}).get("current_screen") != current_screen:
+        return None
+    try:
+        image_hash = screenshot_ahash(screenshot_path, screenshot_bytes)
+    except Exception:
+        return None
+    if image_hash is None or bin(image_hash ^ last_action["_frame_hash"]).count("1") > 3:
+        return None
+    action = {k: v for k, v in last_action.items() if not k.startswith("_")}
+    action["_frame_hash"] = last_action["_frame_hash"]
+    action["_frame_reuses"] = reuses + 1
+    return action
+
+
+# Step 1 of every Vision → Reasoning check uses the same description prompt
+SCREENSHOT_VISION_PROMPT = """Look at this screenshot of the Obsidian mobile app.
+
+Describe what you see in detail:
+- What screen/UI is currently displayed?
+- What buttons, text fields, or UI elements are visible?
+- What text is displayed on screen?
+- What is the current state of the app?
+
+Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
+
+# Step 2 prompts of the three in-vault checks (filled with the Step 1 description via str.format)
+VAULT_VERIFY_PROMPT = """The user just typed "InternVault" as vault name and pressed ENTER. Based on this screenshot description, are we now INSIDE the InternVault vault?
+
+Screenshot Description:
+{screenshot_description}
+
+Signs we're IN the vault:
+- File list or note list visible
+- "Create note" or "New note" buttons visible
+- Vault name "InternVault" at top
+- Note files or folders visible
+- NOT in file picker
+
+Return ONLY valid JSON:
+- If IN vault: {{"in_vault": true, "reason": "vault UI visible"}}
+- If NOT in vault: {{"in_vault": false, "reason": "..."}}
+
+Output ONLY valid JSON, no markdown:"""
+
+VAULT_SCAN_PROMPT = """Test 1 creates and enters the InternVault vault. Based on this screenshot description, are we currently INSIDE the InternVault vault? If not, what is the next single action?
+{state_str}
+Screenshot Description:
+{screenshot_description}
+
+Test Goal: "{test_text}"
+{history_str}
+{xml_hint}
+
+CRITICAL SIGNS that we're IN the vault (if you see ANY of these, we're IN):
+- Text at top left says "files in internvault" or "InternVault" or shows vault name
+- We see a file list or note list with Obsidian UI (not Android file picker)
+- We see "Create note" or "New note" buttons in Obsidian interface
+- We see note files or folders in Obsidian's file browser
+- The UI looks like Obsidian's main vault interface (not a file picker)
+
+Signs that we're NOT in the vault:
+- We see "Create vault" or "Get started" buttons
+- We see a file picker (Android system UI with folder icons)
+- We see "Use this folder" or "CREATE NEW FOLDER" buttons (file picker)
+- We see welcome/setup screen
+
+Return ONLY valid JSON:
+- If IN InternVault vault: {{"in_vault": true, "reason": "vault UI visible"}}
+- If NOT in vault: {{"in_vault": false, "reason": "...", "next_action": {{"action": "tap", "x": 0, "y": 0, "description": "..."}}}}
+  (next_action is the immediate next step toward the test goal, in the same format as any planner action)
+
+Output ONLY valid JSON, no markdown:"""
+
+TEST2_VAULT_CHECK_PROMPT = """Test 2 needs to create a note in the InternVault vault. Based on this screenshot description, are we currently INSIDE the InternVault vault?
+
+Screenshot Description:
+{screenshot_description}
+
+Signs we're IN the vault:
+- File list or note list visible
+- "Create note" or "New note" buttons visible
+- Vault name "InternVault" at top
+- Note files or folders visible
+- NOT in file picker or welcome screen
+
+Signs we're NOT in the vault:
+- "Create vault" or "Get started" buttons
+- File picker visible
+- "Use this folder" button
+- Welcome/setup screen
+
+Return ONLY valid JSON:
+- If IN InternVault vault: {{"in_vault": true, "reason": "vault UI visible"}}
+- If NOT in vault: {{"in_vault": false, "reason": "..."}}
+
+Output ONLY valid JSON, no markdown:"""
+
+# The in_vault verdicts are two-field JSON objects ({"in_vault": ..., "reason": "..."}): ask for
+# JSON mode and cap the reply. The cap leaves room for a one- or two-sentence reason: a
+# reason cut mid-string makes the whole object invalid and the verdict is lost
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+VERDICT_MAX_TOKENS = 100
+# Reply cap for the main planning call (a single action object). Headroom over a long
+# "description" is free only because stop_at_json closes the stream once the object is
+# complete; if that early stop goes, drop this to ~80
+ACTION_MAX_TOKENS = 100
+# Reply cap for the Test 1 vault scan, which returns a verdict and (if not in the vault) an action
+VAULT_SCAN_MAX_TOKENS = VERDICT_MAX_TOKENS + ACTION_MAX_TOKENS
+
+# (encoded image, description) of the most recently analyzed screenshot. Replaced as one
+# tuple, so a reader on another thread never pairs one image with another's description
+_last_description = (None, None)
+
+
+# (encoded image, future) of the background Step 1 vision request started by
+# prefetch_screenshot_description(), or (None, None)
+_pending_description = (None, None)
+_vision_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision-prefetch")
+
+
+def _request_screenshot_description(current_llm_client, screenshot_url, logger=None):
+    """Send the Step 1 vision request and remember the description for this image"""
+    global _last_description
+    vision_response = current_llm_client.call_vision(
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": SCREENSHOT_VISION_PROMPT},
+                    image_content(screenshot_url)
+                ]
+            }
+        ],
+        logger=logger,
+        temperature=0.1,
+        max_tokens=500
+    )
+
+    if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
+        return None
+
+    screenshot_description = vision_response.choices[0].message.content.strip()
+    _last_description = (screenshot_url, screenshot_description)
+    return screenshot_description
+
+
+def prefetch_screenshot_description(current_llm_client, screenshot_url, logger=None):
+    """
+    Start the Step 1 vision request in a background thread
+
+    A later describe_screenshot() for the same image waits for this request
+    instead of sending its own. A still-queued request for an older image is cancelled.
+    """
+    global _pending_description
+    pending_url, pending_future = _pending_description
+    if screenshot_url in (_last_description[0], pending_url):
+        return
+    if pending_future is not None:
+        pending_future.cancel()
+    _pending_description = (screenshot_url, _vision_executor.submit(
+        _request_screenshot_description, current_llm_client, screenshot_url, logger))
 
 
-def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
+def describe_screenshot(current_llm_client, screenshot_url, logger=None):
+    """
+    Describe a screenshot with the vision model (Step 1 of the Vision → Reasoning flow)
+
+    The vault checks and the main planning step send the exact same vision request,
+    so the description of the last image is reused instead of asking again.
+    A prefetched request for the same image is awaited rather than repeated; one for
+    another image is dropped (cancelled if it has not started yet).
+
+    Args:
+        current_llm_client: LLMClient from get_llm_client()
+        screenshot_url: data URL from encode_screenshot()
+        logger: Optional BenchmarkLogger
+
+    Returns:
+        Screenshot description text, or None if the vision API returned nothing
+    """
+    global _pending_description
+    last_url, last_text = _last_description
+    if screenshot_url == last_url:
+        print(f"  ♻️  Reusing screenshot description (same image)")
+        return last_text
+
+    pending_url, pending_future = _pending_description
+    if pending_future is not None:
+        _pending_description = (None, None)
+        if screenshot_url == pending_url:
+            print(f"  ⏳ Waiting for prefetched screenshot description...")
+            return pending_future.result()
+        pending_future.cancel()
+
+    return _request_screenshot_description(current_llm_client, screenshot_url, logger)
+
+
+def _keyword_scanner(keywords):
+    """
+    Build a one-pass multi-keyword matcher (compiled regex in place of Aho-Corasick)
+
+    The zero-width lookahead tries every position, longest keyword first; shorter
+    keywords hidden inside a longer match ("create" in "create vault") are added
+    from a precomputed table, so the result equals {k for k in keywords if k in text}.
+
+    Returns:
+        function(text) -> set of keywords contained in text
+    """
+    ordered = sorted(keywords, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in ordered) + "))")
+    implied = {k: frozenset(other for other in keywords if other in k) for k in keywords}
+
+    def scan(text):
+        found = set()
+        for match in pattern.findall(text):
+            found |= implied[match]
+        return found
+
+    return scan
+
+
+# Keywords the stuck-loop handling switches on
+_scan_loop_keywords = _keyword_scanner((
+    "create vault", "use this folder", "enter vault", "internvault", "internal", "storage",
+    "allow", "permission", "type", "vault", "enter", "app",
+))
+
+
+# Every phrase plan_next_action looks for in the on-screen UI text
+_scan_ui_keywords = _keyword_scanner((
+    "allow", "app", "app storage", "appearance", "choose", "create", "create new note",
+    "create note", "create vault", "daily standup", "device", "export", "export search history",
+    "files", "files in internvault", "internal", "internal storage", "internvault",
+    "meeting notes", "new note", "note", "notification", "pdf", "permission", "preferences",
+    "privacy", "settings", "storage", "system default", "theme", "untitled", "vault",
+))
+
+# Every phrase plan_next_action looks for in the test goal
+_scan_test_keywords = _keyword_scanner((
+    "appearance", "create", "daily standup", "duckduckgo", "export", "internvault",
+    "meeting notes", "menu", "note", "pdf", "print", "print to pdf", "privacy", "search",
+    "settings", "theme", "vault", "weather",
+))
+
+
+class TestGoal:
+    """
+    Keywords and test-kind flags of one test goal, derived once per distinct goal text
+
+    The flags are independent (a note goal can also mention the vault), so each gate in
+    plan_next_action keeps its own precedence.
     """
-    Call OpenAI API with retry logic for rate limits
+    __slots__ = ("keywords", "is_test1", "is_test2", "is_note_goal", "is_pdf_test", "is_appearance_test")
+
+    def __init__(self, test_text):
+        keywords = frozenset(_scan_test_keywords(test_text.lower()))
+        self.keywords = keywords
+        # Test 1: create and enter the InternVault vault
+        self.is_test1 = "create" in keywords and "vault" in keywords and "internvault" in keywords
+        # Test 2: "Meeting Notes" note with "Daily Standup" in the body
+        self.is_test2 = "meeting notes" in keywords and "daily standup" in keywords
+        # Any note-creation goal (HARD GATE 2); "meeting notes" already implies "note"
+        self.is_note_goal = "note" in keywords and ("meeting notes" in keywords or "create" in keywords)
+        self.is_pdf_test = "print to pdf" in keywords or ("print" in keywords and "pdf" in keywords)
+        self.is_appearance_test = "settings" in keywords and "appearance" in keywords
+
+
+# TestGoal by goal text; a test keeps the same goal for every step, oldest evicted first
+TEST_GOAL_CACHE_SIZE = 32
+_test_goal_cache = {}
+
+
+def test_goal(test_text):
+    """
+    TestGoal for test_text (scanned and classified once per distinct goal)
+
+    Returns:
+        TestGoal
+    """
+    goal = _test_goal_cache.get(test_text)
+    if goal is None:
+        goal = TestGoal(test_text)
+        if len(_test_goal_cache) >= TEST_GOAL_CACHE_SIZE:
+            _test_goal_cache.pop(next(iter(_test_goal_cache)))
+        _test_goal_cache[test_text] = goal
+    return goal
+
+
+# Note checks run on normalize_text() of the UI text ("meetingnote" also covers "meetingnotes"
+# and a truncated title)
+_scan_blob_keywords = _keyword_scanner(("meetingnote", "dailystandup", "untitled"))
+
+
+def target_app_key(target_pkg):
+    """
+    Map the lower-cased target package to the app key used by memory patterns and app gates
+
+    Returns:
+        "duckduckgo", "settings", "calendar" or "obsidian" (default)
+    """
+    if "duckduckgo" in target_pkg:
+        return "duckduckgo"
+    if "settings" in target_pkg:
+        return "settings"
+    if "calendar" in target_pkg or "simplemobiletools" in target_pkg:
+        return "calendar"
+    return "obsidian"
+
+
+def _test2_complete(current_screen, blob_keywords):
+    """
+    Test 2 is done: note editor open with both the title and the body text visible
+
+    Args:
+        current_screen: Detected screen name
+        blob_keywords: _scan_blob_keywords() of the normalized UI text
+    """
+    return (current_screen == 'note_editor' and
+            "meetingnote" in blob_keywords and "dailystandup" in blob_keywords)
+
+
+# First flat JSON object in a model reply
+_JSON_OBJECT_RE = re.compile(r'\{[^}]+\}', re.DOTALL)
+
+
+def bounds_center_label(bounds):
+    """
+    "(x, y)" center of a bounds string "[x1,y1][x2,y2]", or None if it does not parse
+
+    Parsed per collected node (at most 15 per step) with adb_tools.bounds_to_center, so
+    partly off-screen nodes (negative coordinates) get a center too: one regex pass over
+    the whole dump to pre-extract every node's bounds measured ~6x slower on the saved xml_dumps.
+    """
+    x, y = bounds_to_center(bounds)
+    if x is None:
+        return None
+    return f"({x}, {y})"
+
+
+# Node class -> NODE_OTHER / NODE_INPUT / NODE_BUTTON; a dump has only a few distinct classes
+NODE_OTHER, NODE_INPUT, NODE_BUTTON = 0, 1, 2
+NODE_CLASS_CACHE_SIZE = 256
+_node_class_kinds = {}
+
+
+def node_class_kind(class_name):
+    """
+    Classify a UIAutomator node class for get_android_state (lower-cased and tested once per class)
+
+    Returns:
+        NODE_INPUT for EditText, NODE_BUTTON for Button/ImageButton/TextView, else NODE_OTHER
+    """
+    kind = _node_class_kinds.get(class_name)
+    if kind is None:
+        lowered = class_name.lower()
+        if "edittext" in lowered:
+            kind = NODE_INPUT
+        elif "button" in lowered or "textview" in lowered:
+            kind = NODE_BUTTON
+        else:
+            kind = NODE_OTHER
+        if len(_node_class_kinds) >= NODE_CLASS_CACHE_SIZE:
+            _node_class_kinds.pop(next(iter(_node_class_kinds)))
+        _node_class_kinds[class_name] = kind
+    return kind
+
+
+def call_openai_with_retry(messages, max_retries=5, logger=None, **kwargs):
+    """
+    Call OpenAI API with retry logic for rate limits (exponential backoff with jitter)
     
     Args:
         messages: Messages for the API call
@@ -68,30 +577,9 @@ def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
             # CRITICAL: Token counts come from API response, so ONLY screenshots
             # actually sent to the API are counted. Screenshots taken but not sent = 0 tokens.
             if logger:
-                tokens_in = 0
-                tokens_out = 0
-                
                 # Extract actual token counts from API response
                 # These are the REAL tokens used by OpenAI, including only screenshots sent in this call
-                if hasattr(response, 'usage') and response.usage:
-                    # Chat Completions API format
-                    if hasattr(response.usage, 'prompt_tokens'):
-                        tokens_in = response.usage.prompt_tokens
-                    elif hasattr(response.usage, 'input_tokens'):
-                        tokens_in = response.usage.input_tokens
-                    
-                    if hasattr(response.usage, 'completion_tokens'):
-                        tokens_out = response.usage.completion_tokens
-                    elif hasattr(response.usage, 'output_tokens'):
-                        tokens_out = response.usage.output_tokens
-                
-                # Count screenshots in this API call
-                screenshots_in_call = 0
-                for msg in messages:
-                    if isinstance(msg.get("content"), list):
-                        for content_item in msg.get("content", []):
-                            if content_item.get("type") == "image_url":
-                                screenshots_in_call += 1
+                tokens_in, tokens_out = usage_tokens(response)
                 
                 # Log with model for cost calculation
                 logger.log_api_call(
@@ -101,71 +589,77 @@ def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
                 )
                 
                 # Debug: Show how many screenshots were in this call
-                if screenshots_in_call > 0:
-                    print(f"  📊 API call: {screenshots_in_call} screenshot(s) sent, {tokens_in:,} input tokens, {tokens_out:,} output tokens")
+                if DEBUG_SCREENSHOT_COUNT:
+                    screenshots_in_call = count_image_parts(messages)
+                    if screenshots_in_call > 0:
+                        print(f"  📊 API call: {screenshots_in_call} screenshot(s) sent, {tokens_in:,} input tokens, {tokens_out:,} output tokens")
             
             return response
-        except Exception as e:
-            error_str = str(e)
-            # Check if it's a rate limit error (429)
-            if "429" in error_str or "rate_limit" in error_str.lower() or "rate limit" in error_str.lower():
-                if attempt < max_retries - 1:
-                    # Extract wait time from error if available
-                    wait_time = 2.0  # Default: 2 seconds
-                    if "try again in" in error_str.lower():
-                        # Try to extract the wait time from the error message (in milliseconds)
-                        match = re.search(r'try again in (\d+)\s*ms', error_str.lower())
-                        if match:
-                            wait_time_ms = int(match.group(1))
-                            wait_time = (wait_time_ms / 1000.0) + 0.5  # Convert ms to seconds, add 0.5s buffer
-                            wait_time = max(wait_time, 0.5)  # At least 0.5 seconds
-                        else:
-                            # Try without "ms" (might just be a number)
-                            match = re.search(r'try again in (\d+)', error_str.lower())
-                            if match:
-                                wait_time_ms = int(match.group(1))
-                                # If number is small (< 10), assume it's seconds, otherwise assume ms
-                                if wait_time_ms < 10:
-                                    wait_time = wait_time_ms + 0.5
-                                else:
-                                    wait_time = (wait_time_ms / 1000.0) + 0.5
-                    
-                    print(f"  ⚠️  Rate limit hit, waiting {wait_time:.2f}s before retry {attempt + 1}/{max_retries}...")
-                    if logger:
-                        logger.set_rate_limit_fail()
-                        # Count this as an API call attempt (rate limited)
-                        logger.log_api_call(
-                            tokens_in=0,
-                            tokens_out=0,
-                            model=OPENAI_MODEL
-                        )
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    # Still count as API call even if it failed
-                    if logger:
-                        logger.set_rate_limit_fail()
-                        # Log failed call with 0 tokens (usage unavailable on error)
-                        logger.log_api_call(
-                            tokens_in=0,
-                            tokens_out=0,
-                            model=OPENAI_MODEL
-                        )
-                    raise  # Last attempt failed, raise the exception
+        except RateLimitError as e:
+            if attempt < max_retries - 1:
+                # Exponential backoff with jitter; a server-suggested wait is a floor
+                wait_time = compute_backoff(attempt, retry_hint_seconds(e))
+                
+                print(f"  ⚠️  Rate limit hit, waiting {wait_time:.2f}s before retry {attempt + 1}/{max_retries}...")
+                if logger:
+                    logger.set_rate_limit_fail()
+                    # Count this as an API call attempt (rate limited)
+                    logger.log_api_call(
+                        tokens_in=0,
+                        tokens_out=0,
+                        model=OPENAI_MODEL
+                    )
+                time.sleep(wait_time)
+                continue
             else:
-                raise  # Not a rate limit error, raise immediately
+                # Still count as API call even if it failed
+                if logger:
+                    logger.set_rate_limit_fail()
+                    # Log failed call with 0 tokens (usage unavailable on error)
+                    logger.log_api_call(
+                        tokens_in=0,
+                        tokens_out=0,
+                        model=OPENAI_MODEL
+                    )
+                raise  # Last attempt failed, raise the exception
     return None
 
 
-def get_android_state():
+# UI tree parsed by the latest get_android_state() call, reused for this step's XML dumps
+_last_ui_dump = {"root": None}
+
+# Runs get_android_state() (mostly waiting on ADB) while the planner thread encodes the screenshot,
+# and later the main-path screenshot encode while the reasoning prompt is built
+_state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="android-state")
+
+# Diagnostic Test 3/4 XML dumps are serialized and written off the planning path
+_dump_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xml-dump-writer")
+
+
+def _write_xml_dump(root, dump_file):
+    """Serialize a UI tree to dump_file (runs on _dump_writer; failures are only reported)"""
+    try:
+        xml_str = ET.tostring(root, encoding='unicode')
+        os.makedirs("xml_dumps", exist_ok=True)
+        with open(dump_file, 'w', encoding='utf-8') as f:
+            f.write(xml_str)
+    except Exception as e:
+        print(f"  ⚠️  Could not write UI dump {dump_file}: {e}")
+
+
+def get_android_state(ui_root=None):
     """
     Get current Android state information with structured XML data
     
+    Args:
+        ui_root: Optional UI tree already dumped for this step (skips the uiautomator dump)
+    
     Returns:
-        Dictionary with Android state info including input fields and buttons
+        Dictionary with Android state info including focused package/activity, input fields and buttons
     """
     state = {
         "current_screen": "unknown",
+        "package_activity": None,
         "ui_text": [],
         "has_edittext": False,
         "input_fields": [],
@@ -173,38 +667,47 @@ def get_android_state():
     }
     
     try:
+        # UI dump + focused window in one ADB round trip
+        root, pkg_act, detected = get_full_state(ui_root)
+        _last_ui_dump["root"] = root
+        
         # Get current screen from activity (always store a string for memory/RL keys)
-        detected = detect_current_screen()
         state["current_screen"] = (detected.get("current_screen", "unknown") if isinstance(detected, dict) else "unknown")
+        state["package_activity"] = pkg_act
         
-        # Get UI text from uiautomator dump
-        try:
-            ui_text = get_ui_text()
-            state["ui_text"] = ui_text[:20]  # Limit to first 20 items
-        except:
-            pass
-        
-        # Extract structured info from XML dump
+        # Extract UI text and structured info in a single walk of the XML dump
         try:
-            root = dump_ui()
             if root is not None:
+                ui_text = []
                 input_fields = []
                 buttons = []
                 
                 for node in root.iter("node"):
-                    class_name = node.attrib.get("class", "").lower()
-                    bounds = node.attrib.get("bounds", "")
-                    text = node.attrib.get("text", "").strip()
-                    hint = node.attrib.get("hint", "").strip()
-                    content_desc = node.attrib.get("content-desc", "").strip()
-                    resource_id = node.attrib.get("resource-id", "").strip()
+                    if len(ui_text) < 20:  # Limit to first 20 items
+                        try:
+                            ui_text.extend(node_ui_text(node))
+                        except Exception:
+                            pass  # an odd node's text must not cost the input fields and buttons
+                    elif len(buttons) >= 10 and len(input_fields) >= 5:
+                        break  # Every cap is filled (has_edittext too); the rest of the tree changes nothing
+                    
+                    attrib = node.attrib
+                    kind = node_class_kind(attrib.get("class", ""))
+                    is_input = kind == NODE_INPUT
+                    # Button, ImageButton, TextView, ...; nothing else is collected once the button list is full
+                    if not is_input and (len(buttons) >= 10 or kind != NODE_BUTTON):
+                        continue
                     
+                    bounds = attrib.get("bounds", "")
                     # Skip invalid bounds
                     if bounds == "[0,0][0,0]" or not bounds:
                         continue
+                    text = attrib.get("text", "").strip()
+                    hint = attrib.get("hint", "").strip()
+                    content_desc = attrib.get("content-desc", "").strip()
                     
                     # Extract input fields (EditText)
-                    if "edittext" in class_name:
+                    if is_input:
                         state["has_edittext"] = True
                         # Collect input field info (limit to first 5 to avoid clutter)
                         if len(input_fields) < 5:
@@ -213,21 +716,13 @@ def get_android_state():
                                 "bounds": bounds
                             }
                             # Extract center coordinates for easier reference
-                            try:
-                                # Parse bounds: "[x1,y1][x2,y2]"
-                                import re
-                                match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds)
-                                if match:
-                                    x1, y1, x2, y2 = map(int, match.groups())
-                                    center_x = (x1 + x2) // 2
-                                    center_y = (y1 + y2) // 2
-                                    field_info["center"] = f"({center_x}, {center_y})"
-                            except:
-                                pass
+                            center = bounds_center_label(bounds)
+                            if center:
+                                field_info["center"] = center
                             input_fields.append(field_info)
                     
                     # Extract buttons (Button, ImageButton, etc.)
-                    elif any(btn_type in class_name for btn_type in ["button", "imagebutton", "textview"]):
+                    else:
                         # Only include if it has clickable text or content-desc
                         if text or content_desc:
                             # Filter out very long text (likely not buttons)
@@ -238,18 +733,12 @@ def get_android_state():
                                     "bounds": bounds
                                 }
                                 # Extract center coordinates
-                                try:
-                                    import re
-                                    match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds)
-                                    if match:
-                                        x1, y1, x2, y2 = map(int, match.groups())
-                                        center_x = (x1 + x2) // 2
-                                        center_y = (y1 + y2) // 2
-                                        button_info["center"] = f"({center_x}, {center_y})"
-                                except:
-                                    pass
+                                center = bounds_center_label(bounds)
+                                if center:
+                                    button_info["center"] = center
                                 buttons.append(button_info)
                 
+                state["ui_text"] = ui_text[:20]
                 state["input_fields"] = input_fields
                 state["buttons"] = buttons
         except Exception as e:
@@ -262,7 +751,614 @@ def get_android_state():
     return state
 
 
-def plan_next_action(test_text, screenshot_path, action_history, previous_test_passed=False, execution_result=None, test_id=None, logger=None, target_package=None, xml_element_summary=None):
+def refresh_device_state():
+    """
+    Re-read focused package/activity, screen and UI text in one ADB round trip
+
+    Used by the Test 1 post-action checks, which run after the (slow) vision scan and
+    want a fresh look without separate dumpsys / uiautomator calls.
+
+    Returns:
+        Tuple (package_activity dict or None, current_screen string, ui_text list)
+    """
+    root, pkg_act, detected = get_full_state()
+    current_screen = detected.get("current_screen", "unknown") if isinstance(detected, dict) else "unknown"
+    return pkg_act, current_screen, extract_ui_text(root)
+
+
+# Static part of the planning prompt (role, rules, output format). Sent as the system
+# message so the provider can cache this prefix across ticks; only per-tick state
+# goes into the user message.
+_PLANNER_SYSTEM_PROMPT_TEMPLATE = """You are a QA Planner agent for automated mobile app testing. This is a legitimate software testing task. You MUST return a valid JSON action.
+
+Your role: Analyze the screenshot description AND Android state to decide the next action for automated testing.
+
+IMPORTANT: 
+- You MUST return a valid JSON action - this is required for the automation to work
+- Use BOTH the screenshot description AND the Android state information to understand what's happening
+- Do NOT refuse to help - this is a legitimate testing task
+
+{critical_rules_section}
+
+CRITICAL: You MUST return a valid JSON action. This is required for the automation to work.
+Do NOT refuse to help - this is a legitimate software testing automation task.
+Return ONLY valid JSON in this format: {{"action": "tap", "x": 100, "y": 200, "description": "..."}}
+No markdown, no code blocks, no explanations - just the JSON object.
+"""
+
+# System message of the Test 1 vault scan: same role and rules as the planner, but the reply is
+# the verdict object with the action nested under "next_action" (a bare action would lose in_vault)
+_VAULT_SCAN_SYSTEM_PROMPT_TEMPLATE = """You are a QA Planner agent for automated mobile app testing. This is a legitimate software testing task. You MUST return a valid JSON verdict.
+
+Your role: Decide from the screenshot description AND Android state whether the app is inside the InternVault vault and, if it is not, the next action for automated testing.
+
+IMPORTANT: 
+- Use BOTH the screenshot description AND the Android state information to understand what's happening
+- Do NOT refuse to help - this is a legitimate testing task
+
+{critical_rules_section}
+
+CRITICAL: You MUST return a valid JSON object with a boolean "in_vault". Any action goes under "next_action".
+Return ONLY valid JSON in this format: {{"in_vault": false, "reason": "...", "next_action": {{"action": "tap", "x": 100, "y": 200, "description": "..."}}}}
+No markdown, no code blocks, no explanations - just the JSON object.
+"""
+
+# Obsidian planning rules, in prompt order. Rules tied to one part of the flow are only sent
+# on the screens where they can apply (see _OBSIDIAN_SCREEN_RULES) or when the test goal
+# needs them (see obsidian_system_prompt_for); the rest are always sent
+_OBSIDIAN_RULES = (
+    "Return EXACTLY ONE action - the immediate next step",
+    "If Android state shows has_edittext=true or Input Fields are detected, you should type text, not tap",
+    "Use the Input Fields information to know which field to type into (check hints like \"Vault name\", \"Search\", etc.)",
+    "Use the Buttons information to get precise coordinates - if a button is listed, you can use its center coordinates for tapping",
+    "If you see a permission dialog (e.g., \"Allow access\"), tap \"Allow\" or \"OK\" ONCE - if it doesn't work, try BACK key",
+    "If you see \"Create vault\" button, tap it. If you see \"App storage\" or \"Internal storage\", tap it. If you see \"USE THIS FOLDER\" button, tap it.",
+    "If you see \"Create note\" or \"New note\" button, tap it. If you see an input field and need to type, use type action with target=\"title\" or target=\"body\"",
+    "If the test goal is achieved (e.g., vault created, note created), return assert action",
+    "**CRITICAL FOR TEST 2**: If \"Meeting Notes\" is NOT in UI text → type \"Meeting Notes\" with target=\"title\". If \"Meeting Notes\" IS in UI text but \"Daily Standup\" is NOT → focus target=\"body\" then type \"Daily Standup\". If both present → assert.",
+    "**CRITICAL FOR VAULT**: After typing \"InternVault\", tap \"Create vault\" or press ENTER. If on welcome_setup and test goal is create note, tap \"InternVault\" to ENTER existing vault (do not create new one).",
+    "**FOR SETTINGS/APPEARANCE**: Open sidebar (top-left) → tap Settings → tap Appearance. If goal achieved, return assert.",
+    "If you cannot find the required element after multiple attempts, return FAIL action",
+)
+# Rule indices (into _OBSIDIAN_RULES) that only matter on some screens
+_OBSIDIAN_SETUP_RULES = (5, 9)        # vault creation buttons, typing the vault name / entering InternVault
+_OBSIDIAN_NOTE_RULES = (6, 8)         # create note, Test 2 title/body
+_OBSIDIAN_SETTINGS_RULES = (10,)      # sidebar -> Settings -> Appearance
+_OBSIDIAN_SCREEN_RULES = {
+    "welcome_setup": _OBSIDIAN_SETUP_RULES,
+    "vault_selection": _OBSIDIAN_SETUP_RULES,
+    "vault_name_input": _OBSIDIAN_SETUP_RULES,
+    "vault_home": _OBSIDIAN_NOTE_RULES + _OBSIDIAN_SETTINGS_RULES,
+    "note_editor": _OBSIDIAN_NOTE_RULES,
+}
+_OBSIDIAN_OPTIONAL_RULES = frozenset(i for rules in _OBSIDIAN_SCREEN_RULES.values() for i in rules)
+
+
+def _obsidian_system_prompt(rule_indices, template=_PLANNER_SYSTEM_PROMPT_TEMPLATE):
+    """System prompt (planner template by default) with the always-on rules plus the given screen rules, renumbered"""
+    selected = [rule for i, rule in enumerate(_OBSIDIAN_RULES)
+                if i not in _OBSIDIAN_OPTIONAL_RULES or i in rule_indices]
+    section = "CRITICAL RULES:\n" + "\n".join(f"{n}. {rule}" for n, rule in enumerate(selected, 1))
+    return template.format(critical_rules_section=section)
+
+
+# Full rule set: unknown screens and the vault scan, which may see any part of the flow
+OBSIDIAN_PLANNER_SYSTEM_PROMPT = _obsidian_system_prompt(_OBSIDIAN_OPTIONAL_RULES)
+VAULT_SCAN_SYSTEM_PROMPT = _obsidian_system_prompt(_OBSIDIAN_OPTIONAL_RULES, _VAULT_SCAN_SYSTEM_PROMPT_TEMPLATE)
+# Prompt by selected rule set. There are only a handful of screen/goal combinations, and each
+# one is built once, so every variant is still a stable (cacheable) prefix
+_obsidian_system_prompts = {}
+
+
+def obsidian_system_prompt_for(current_screen, goal):
+    """
+    Obsidian planner system prompt for this screen and test goal
+
+    A rule is kept when the screen needs it or when the goal does: an Appearance test still
+    gets the sidebar -> Settings rule on the note editor, where it has to back out from.
+
+    Args:
+        current_screen: Detected Obsidian screen name
+        goal: TestGoal of the current test
+
+    Returns:
+        System prompt string (the full rule set when the screen is unknown)
+    """
+    screen_rules = _OBSIDIAN_SCREEN_RULES.get(current_screen)
+    if screen_rules is None:
+        return OBSIDIAN_PLANNER_SYSTEM_PROMPT
+    rules = set(screen_rules)
+    if goal.is_test1:
+        rules.update(_OBSIDIAN_SETUP_RULES)
+    if goal.is_note_goal or goal.is_test2:
+        rules.update(_OBSIDIAN_NOTE_RULES)
+    if goal.is_appearance_test:
+        rules.update(_OBSIDIAN_SETTINGS_RULES)
+    rules = frozenset(rules)
+    prompt = _obsidian_system_prompts.get(rules)
+    if prompt is None:
+        prompt = _obsidian_system_prompts[rules] = _obsidian_system_prompt(rules)
+    return prompt
+
+# Shorter CRITICAL RULES for DuckDuckGo to reduce API usage (no vault/note/Print to PDF/Appearance)
+DUCKDUCKGO_PLANNER_SYSTEM_PROMPT = _PLANNER_SYSTEM_PROMPT_TEMPLATE.format(critical_rules_section="""CRITICAL RULES (DuckDuckGo - keep short):
+1. Return EXACTLY ONE action - the immediate next step
+2. If permission dialog (Allow/OK), tap Allow ONCE or BACK key
+3. If you see a search field and need to search, use type action with element "Search" or tap then type
+4. **CRITICAL**: If the test goal is to search (e.g. weather): only assert when the screenshot shows a *loaded* search results page (results list, forecast), NOT search suggestions or keyboard. If you see search suggestions or keyboard, submit the search (tap Search/Go or press ENTER) first.
+5. For menu: three-dots are TOP-RIGHT. Tap top-right to open menu, then tap "Settings" or "Privacy" from the list
+6. If test is about Appearance/Theme: only assert when the *Appearance* or *Theme* screen is visible (theme options like System default). Do NOT assert when only the main Settings menu is visible - tap "Appearance" or "Theme" first. If test is not about Appearance, you may assert when Settings/Privacy screen is visible.
+7. If you cannot find the required element after multiple attempts, return FAIL action""")
+
+
+# Fixed planner actions. Read-only templates; callers return dict(...) copies since
+# main.py annotates the returned action (_execution_result, _android_state, ...)
+ASSERT_VAULT_CREATED = MappingProxyType({
+    "action": "assert",
+    "description": "Vault 'InternVault' created and entered successfully"
+})
+TAP_APPEARANCE_TAB = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap 'Appearance' tab in Settings"
+})
+ASSERT_NOTE_CREATED = MappingProxyType({
+    "action": "assert",
+    "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
+})
+FOCUS_NOTE_BODY = MappingProxyType({
+    "action": "focus",
+    "target": "body",
+    "description": "Focus note body editor"
+})
+ASSERT_PDF_NOT_FOUND = MappingProxyType({
+    "action": "assert",
+    "description": "Print to PDF button not found in menu - test correctly fails as expected"
+})
+TYPE_NOTE_BODY = MappingProxyType({
+    "action": "type",
+    "text": "Daily Standup",
+    "target": "body",
+    "description": "Type note body text 'Daily Standup'"
+})
+TAP_CREATE_VAULT = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap 'Create vault' button"
+})
+TAP_THREE_DOTS_MENU = MappingProxyType({
+    "action": "tap",
+    "x": 994,
+    "y": 197,
+    "description": "Tap three dots menu (top right)"
+})
+FAIL_EMPTY_REASONING_RESPONSE = MappingProxyType({
+    "action": "FAIL",
+    "reason": "Empty response from reasoning model"
+})
+CLEAR_UNTITLED_TYPE_TITLE = MappingProxyType({
+    "action": "type",
+    "text": "Meeting Notes",
+    "target": "title",
+    "description": "Clear 'Untitled' and type note title 'Meeting Notes'"
+})
+TAP_CREATE_NOTE = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap 'Create note' or 'New note' button to create new note"
+})
+TAP_CREATE_NOTE_FROM_VAULT_HOME = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap to create new note (assuming we're in vault home)"
+})
+TYPE_NOTE_TITLE = MappingProxyType({
+    "action": "type",
+    "text": "Meeting Notes",
+    "target": "title",
+    "description": "Type note title 'Meeting Notes' (with 's' at the end)"
+})
+WAIT_SETTINGS_LOAD = MappingProxyType({
+    "action": "wait",
+    "seconds": 1,
+    "description": "Wait for Settings screen to load"
+})
+WAIT_SETTINGS_AFTER_TAP = MappingProxyType({
+    "action": "wait",
+    "seconds": 1,
+    "description": "Wait for Settings screen to load after tapping Settings"
+})
+TYPE_INTERNVAULT = MappingProxyType({
+    "action": "type",
+    "text": "InternVault",
+    "description": "Type vault name 'InternVault'"
+})
+PRESS_ENTER_VAULT_NAME = MappingProxyType({
+    "action": "key",
+    "code": 66,
+    "description": "Press ENTER after typing vault name"
+})
+TAP_APP_STORAGE = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap 'App storage' or 'Internal storage' option (not device storage)"
+})
+WAIT_STORAGE_SELECTION = MappingProxyType({
+    "action": "wait",
+    "seconds": 1,
+    "description": "Wait for storage selection to process"
+})
+
+# Test 1 storage-selection decisions keyed on (storage_dialog_visible, storage_tapped, app_storage_listed),
+# consulted only while storage selection is not yet behind us. app_storage_listed only matters before the
+# storage tap with the dialog open; everywhere else it is keyed as None. Each entry is (message, action);
+# an action of None falls through to main planning, which analyzes the screenshot. States that are not
+# listed need no storage handling.
+STORAGE_SELECTION_ACTIONS = {
+    (True, False, True): ("  → Found 'App storage' in UI text, tapping it...", TAP_APP_STORAGE),
+    (True, False, False): ("  → Storage dialog visible, will analyze screenshot to find 'App storage' option...", None),
+    (False, True, None): ("  ✓ Storage selection completed (dialog no longer visible), proceeding to vault creation...", None),
+    (True, True, None): ("  ⚠️  Storage tapped but dialog still visible, waiting...", WAIT_STORAGE_SELECTION),
+}
+
+
+def test1_setup_fast_action(current_screen, ui_keywords, has_edittext, history):
+    """
+    Next Test 1 step on the vault setup screens when the Android state alone decides it
+
+    Runs before the screenshot vault scan: on these screens and after these actions the
+    scan cannot change the answer, so the vision + reasoning calls are skipped.
+
+    Args:
+        current_screen: Detected screen name
+        ui_keywords: Set of UI keywords found on screen
+        has_edittext: Whether an input field is visible
+        history: HistorySummary of this step
+
+    Returns:
+        (message, action template, reward key or None), or None if the screenshot is needed
+    """
+    if current_screen not in ('welcome_setup', 'vault_selection'):
+        return None
+    if history.just_typed_internvault:
+        # ALWAYS prefer tapping "Create vault" button over ENTER (more reliable)
+        if "create vault" in ui_keywords or ("create" in ui_keywords and "vault" in ui_keywords):
+            return ("  → Just typed 'InternVault', tapping 'Create vault' button...",
+                    TAP_CREATE_VAULT, "tap_create_vault")
+        # Button not visible in UI text - try pressing ENTER
+        return ("  → Just typed 'InternVault', pressing ENTER to create vault...",
+                PRESS_ENTER_VAULT_NAME, "key_enter_after_type")
+    if has_edittext and history.recent_storage_tap and "internvault" not in ui_keywords:
+        # Storage picked and the name field is still empty: the vault name comes next
+        return ("  → Vault name field empty after storage selection, typing 'InternVault'...",
+                TYPE_INTERNVAULT, None)
+    return None
+
+
+# Test 3 navigation toward the Meeting Notes overflow menu
+TAP_MEETING_NOTES_MENU = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap three dots menu button (top right) in Meeting Notes to find Print to PDF"
+})
+TAP_MEETING_NOTES_FILE = MappingProxyType({
+    "action": "tap",
+    "x": 0,
+    "y": 0,
+    "description": "Tap 'Meeting Notes' file in vault to open it"
+})
+BACK_TO_MEETING_NOTES = MappingProxyType({
+    "action": "key",
+    "code": 4,  # BACK key
+    "description": "Go back to reach Meeting Notes page"
+})
+
+
+def _is_menu_tap(action_type, desc):
+    """Whether a (type, lower-cased description) history entry opened the overflow menu"""
+    return action_type == "tap" and ("three dots" in desc or "more options" in desc or "menu button" in desc)
+
+
+def test3_pdf_action(ui_keywords, history, action_history, execution_result=None):
+    """
+    Next Test 3 (Print to PDF) step, decided from the menu search state and the visible page
+
+    The search state comes from one newest-first pass over the last 5 actions: a menu tap
+    whose executor result says Print to PDF was not found ends the test (expected FAIL),
+    and so do two menu taps without a verdict. Otherwise the page decides: open the menu
+    in Meeting Notes, open Meeting Notes from the vault, or go back.
+
+    Args:
+        ui_keywords: Set of UI keywords found on screen
+        history: HistorySummary of this step
+        action_history: List of previous actions
+        execution_result: Executor result for the last action, if passed in
+
+    Returns:
+        (message, action template)
+    """
+    # Executor verdict on the last action: passed in, or stored on the action itself
+    last_execution_result = execution_result or (action_history[-1].get("_execution_result") if action_history else None)
+    if last_execution_result and last_execution_result.get("print_to_pdf_found") == False:
+        return ("  ✅ Test 3 COMPLETE: 'Print to PDF' not found in menu (as expected) - test will FAIL",
+                ASSERT_PDF_NOT_FOUND)
+    
+    # Menu taps among the last 5 actions (newest first), using the pre-lowered descriptions
+    recent_menu_taps = 0
+    for age, (action, (action_type, desc)) in enumerate(zip(reversed(action_history[-5:]), reversed(history.recent))):
+        if not _is_menu_tap(action_type, desc):
+            continue
+        recent_menu_taps += 1
+        # Check if this action already searched for Print to PDF
+        action_exec_result = action.get("_execution_result")
+        if action_exec_result and action_exec_result.get("print_to_pdf_found") == False:
+            if age == 0:
+                return ("  ✅ Test 3 COMPLETE: Menu opened, 'Print to PDF' not found - test will FAIL",
+                        ASSERT_PDF_NOT_FOUND)
+            return ("  ✅ Test 3 COMPLETE: Already searched menu, 'Print to PDF' not found - test will FAIL",
+                    ASSERT_PDF_NOT_FOUND)
+    
+    # If we've tapped the menu multiple times, assume task is complete
+    if recent_menu_taps >= 2:
+        return ("  ✅ Test 3 COMPLETE: Menu already opened multiple times, 'Print to PDF' not found - test will FAIL",
+                ASSERT_PDF_NOT_FOUND)
+    
+    # Test 3 runs after Test 2, so we're usually already in Meeting Notes (with Daily Standup)
+    if "meeting notes" in ui_keywords and "daily standup" in ui_keywords:
+        return ("  → In Meeting Notes page (after Test 2), looking for three dots menu button (top right) to find Print to PDF...",
+                TAP_MEETING_NOTES_MENU)
+    # Navigated away: open Meeting Notes from the vault home, or go back
+    if "create note" in ui_keywords or "new note" in ui_keywords or "files" in ui_keywords:
+        return ("  → Not in Meeting Notes page, in vault home, looking for Meeting Notes file...",
+                TAP_MEETING_NOTES_FILE)
+    return ("  → Not in Meeting Notes page, going back to reach Meeting Notes page...", BACK_TO_MEETING_NOTES)
+
+
+def settings_nav_history(history):
+    """
+    Settings/Appearance navigation signals from one pass over the recent history
+
+    Args:
+        history: HistorySummary of this step
+
+    Returns:
+        (tapped Settings in the last 5 actions, "below time" taps in the last 3,
+         Settings verified in the last 3)
+    """
+    tapped_settings = False
+    below_time_taps = 0
+    verified_settings = False
+    last_3_start = len(history.recent) - 3
+    for i, (action_type, desc) in enumerate(history.recent):
+        if "settings" not in desc and "below time" not in desc:
+            continue
+        if action_type == "tap" and "settings" in desc:
+            tapped_settings = True
+        if i >= last_3_start:
+            if action_type == "tap" and "below time" in desc:
+                below_time_taps += 1
+            if "settings" in desc and "verified" in desc:
+                verified_settings = True
+    return tapped_settings, below_time_taps, verified_settings
+
+
+def action_fingerprint(action):
+    """Hash of what an action does (type, lower-cased description, target) for repeat detection"""
+    return hash((action.get("action"), (action.get("description") or "").lower(), action.get("target")))
+
+
+def page_fingerprint(current_screen, ui_text):
+    """Hash of the visible page (screen name plus the first 10 UI strings, order-insensitive)"""
+    return hash((current_screen, tuple(sorted(ui_text[:10]))))
+
+
+class HistorySummary:
+    """
+    Lower-cased view of the recent action history, built once per planning step
+    
+    Replaces the repeated action_history[-N:] comprehensions and
+    .get("description", "").lower() calls scattered through plan_next_action.
+    """
+    __slots__ = ("last", "last_type", "last_desc", "recent", "recent_storage_tap",
+                 "just_continued", "just_typed_internvault", "recent_type_internvault_count",
+                 "repeated_keywords", "repeated_pages")
+    
+    def __init__(self, action_history):
+        self.last = action_history[-1] if action_history else {}
+        # (action type, description) of the last 5 actions, oldest first
+        self.recent = [((a.get("action") or "").lower(), (a.get("description") or "").lower())
+                       for a in action_history[-5:]]
+        self.last_type, self.last_desc = self.recent[-1] if self.recent else ("", "")
+        
+        # Any storage selection tap among the last 5 actions (stops at the first one)
+        self.recent_storage_tap = any("app storage" in d or ("storage" in d and "tap" in t)
+                                      for t, d in self.recent)
+        self.just_continued = "continue" in self.last_desc or "sync" in self.last_desc
+        self.just_typed_internvault = self.last_type == "type" and "internvault" in self.last_desc
+        self.recent_type_internvault_count = sum(1 for t, d in self.recent[-3:]
+                                                 if t == "type" and "internvault" in d)
+        
+        # Same action 3 times in a row: its loop keywords (None if the last 3 actions differ),
+        # and how often each page fingerprint was seen when those actions were planned (to tell
+        # a stuck page from progress)
+        last_3 = action_history[-3:]
+        self.repeated_keywords = None
+        self.repeated_pages = Counter()
+        if len(last_3) == 3 and len({action_fingerprint(a) for a in last_3}) == 1:
+            self.repeated_keywords = _scan_loop_keywords(self.last_desc)
+            for a in last_3:
+                state = a.get("_android_state")
+                if state:
+                    self.repeated_pages[page_fingerprint(state.get("current_screen", "unknown"),
+                                                         state.get("ui_text", []))] += 1
+    
+    def recent_descs(self, n=5):
+        """Lower-cased descriptions of the last n (at most 5) actions"""
+        return [d for _, d in self.recent[-n:]]
+
+
+def _status_marker(action):
+    """Execution status suffix for one history line ([FAILED], [SUCCESS] or nothing)"""
+    if action.get("_execution_failed"):
+        return " [FAILED]"
+    if action.get("_execution_status") == "success":
+        return " [SUCCESS]"
+    return ""
+
+
+# Planning actions keyed by a hash of the exact reasoning messages (temperature 0 only),
+# oldest evicted first
+REASONING_MEMO_SIZE = 256
+_reasoning_memo = {}
+
+
+def reasoning_memo_key(model, messages, function_calling):
+    """Hash of the model, the text-only reasoning messages and the output mode"""
+    payload = canonical_json_bytes([model, messages, function_calling])
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def remember_reasoning_action(memo_key, action):
+    """Memoize a planned action (private "_" fields dropped; FAIL is never memoized)"""
+    if action.get("action") == "FAIL":
+        return
+    if len(_reasoning_memo) >= REASONING_MEMO_SIZE:
+        _reasoning_memo.pop(next(iter(_reasoning_memo)))
+    _reasoning_memo[memo_key] = {k: v for k, v in action.items() if not k.startswith("_")}
+
+
+def build_planner_messages(system_prompt, test_text, step_prompt):
+    """
+    Messages for the planning call, ordered from most to least stable
+
+    The system prompt, then the test goal (same on every step of a test), then this
+    step's state, description and history. Providers that cache prompt prefixes can
+    reuse everything up to the step message across ticks.
+
+    Args:
+        system_prompt: Planner system prompt (no per-step content)
+        test_text: Test goal
+        step_prompt: Per-step user message
+
+    Returns:
+        List of chat messages
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f'Test Goal: "{test_text}"'},
+        {"role": "user", "content": step_prompt},
+    ]
+
+
+def format_action_history(action_history):
+    """
+    Format the last five actions (with execution status) for the reasoning prompt
+    
+    Args:
+        action_history: List of previous actions
+    
+    Returns:
+        History string, empty if there are no previous actions
+    """
+    if not action_history:
+        return ""
+    return "\nPrevious actions:\n" + "".join(
+        f"  {i}. {action.get('action', 'unknown')}: {action.get('description', '')}{_status_marker(action)}\n"
+        for i, action in enumerate(action_history[-5:], 1)  # Last 5 actions
+    )
+
+
+# Element-based action examples for the XML element hint. Serialized once at import from the
+# canonical dicts (the hint is not an f-string, so literal JSON braces must not be doubled)
+_ELEMENT_ACTION_EXAMPLES = (
+    ("tap", {"action": "tap", "element": "Search", "description": "Tap Search"}),
+    ("type", {"action": "type", "element": "Search", "text": "query", "description": "Type in Search field"}),
+)
+XML_ELEMENT_HINT = "\n".join((
+    "",
+    '- PREFER element-based actions: use "element" with the exact label from the list above.',
+    *(f"  {name}: {json.dumps(example)}" for name, example in _ELEMENT_ACTION_EXAMPLES),
+    '  Use the exact label text in quotes from the list (e.g. "Search", "Settings", "Create vault").',
+))
+
+
+def format_android_state(android_state, current_screen, ui_text, xml_element_summary=None):
+    """
+    Format Android state (screen, input fields, buttons, XML elements) for the reasoning prompt
+    
+    Args:
+        android_state: Dict from get_android_state()
+        current_screen: Detected screen name
+        ui_text: Visible UI text list
+        xml_element_summary: Optional XML element summary for element-based actions
+    
+    Returns:
+        Tuple of (state_str, xml_element_hint)
+    """
+    has_edittext = android_state.get('has_edittext', False)
+    state_parts = [
+        "\nAndroid State Information:\n",
+        f"- Current Screen: {current_screen}\n",
+        f"- Has Input Field (EditText): {has_edittext}\n",
+        f"- Visible UI Text: {', '.join(ui_text[:10])}\n",
+    ]
+    
+    # Add structured input fields info
+    input_fields = android_state.get('input_fields', [])
+    if input_fields:
+        state_parts.append("\nInput Fields Detected:\n")
+        for i, field in enumerate(input_fields[:3], 1):  # Limit to first 3
+            hint = field.get('hint', 'Input field')
+            center = field.get('center', '')
+            state_parts.append(f"  {i}. {hint} (center: {center})\n" if center else f"  {i}. {hint}\n")
+    
+    # Add structured buttons info
+    buttons = android_state.get('buttons', [])
+    if buttons:
+        state_parts.append("\nButtons Detected:\n")
+        for i, button in enumerate(buttons[:5], 1):  # Limit to first 5
+            text = button.get('text', 'Button')
+            center = button.get('center', '')
+            state_parts.append(f"  {i}. \"{text}\" (center: {center})\n" if center else f"  {i}. \"{text}\"\n")
+    
+    # Phase 1/2: When XML element summary is provided, prefer element-based actions (tap/type by label)
+    xml_element_hint = ""
+    if USE_XML_ELEMENT_ACTIONS and xml_element_summary and xml_element_summary.strip():
+        state_parts.append("\nUI elements from XML (use 'element' key with exact label for tap/type):\n")
+        state_parts.append(xml_element_summary.strip() + "\n")
+        xml_element_hint = XML_ELEMENT_HINT
+    return "".join(state_parts), xml_element_hint
+
+
+def _detect_vault_state(ui_keywords, is_in_vault, current_screen):
+    """
+    Decide from cheap signals (UI text, focused activity) whether Test 1 is already inside InternVault
+
+    Args:
+        ui_keywords: Set of UI keywords found on screen (from _scan_ui_keywords)
+        is_in_vault: True if the focused activity is Obsidian's FileActivity
+        current_screen: Detected screen name
+
+    Returns:
+        "in" if the vault is evidently open, "unknown" if only the screenshot can tell
+    """
+    if is_in_vault or current_screen == 'vault_home':
+        return "in"
+    if "create note" in ui_keywords or "new note" in ui_keywords or "create new note" in ui_keywords:
+        return "in"
+    if ("files in internvault" in ui_keywords or
+            ("internvault" in ui_keywords and ("files" in ui_keywords or "note" in ui_keywords))):
+        return "in"
+    return "unknown"
+
+
+def plan_next_action(test_text, screenshot_path, action_history, previous_test_passed=False, execution_result=None, test_id=None, logger=None, target_package=None, xml_element_summary=None, screenshot_bytes=None, ui_root=None):
     """
     Analyze screenshot + Android state and decide the next single action
     
@@ -272,23 +1368,78 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
         action_history: List of previous actions taken
         previous_test_passed: If True, previous test (Test 1) passed, so we're definitely in vault
         xml_element_summary: Optional compact list of tappable/input elements (Phase 1 dump) for element-based actions
+        screenshot_bytes: Optional PNG bytes of the screenshot (avoids re-reading screenshot_path from disk)
+        ui_root: Optional UI tree the caller already dumped this step (avoids a second uiautomator dump)
     
     Returns:
         Dictionary with single action OR {"action": "FAIL", "reason": "..."} if element not found
     """
     try:
-        # Get Android state information
-        android_state = get_android_state()
+        history = HistorySummary(action_history)
+        # Test goal phrases and test kind, derived once per test (the goal text is the same on every step)
+        goal = test_goal(test_text)
+        test_keywords = goal.keywords
+        # Target app, lower-cased and classified once for every app-specific gate below
+        target_lower = (target_package or "").lower()
+        target_app = target_app_key(target_lower)
+        
+        # ===== STUCK PERMISSION DIALOG (NO ADB NEEDED) =====
+        # Same Allow/permission tap repeated 3 times: the answer is always BACK, whatever the screen shows,
+        # so decide from action_history alone before paying for state collection
+        repeated_keywords = history.repeated_keywords
+        if repeated_keywords and ("allow" in repeated_keywords or "permission" in repeated_keywords):
+            print(f"  ⚠️  Permission tap repeated 3 times, pressing BACK to dismiss dialog")
+            return {
+                "action": "key",
+                "code": 4,
+                "description": "Press BACK to dismiss permission dialog"
+            }
+        
+        is_test1 = goal.is_test1
+        is_test2 = goal.is_test2
+        
+        # ===== FAST PATH: VAULT ENTERED AFTER NAMING IT (FOCUS PROBE ONLY, NO XML WALK) =====
+        # Right after the vault name is typed/submitted the next screen is usually FileActivity; the focused
+        # window alone proves that, so the XML walk (and, without a root, the uiautomator dump) is skipped.
+        # With a root from the step's state bundle the focus is already parsed: no ADB call at all
+        just_submitted_vault = (history.just_typed_internvault or "create vault" in history.last_desc or
+                                (history.last_type == "key" and history.last.get("code") == 66))
+        if is_test1 and just_submitted_vault:
+            probe = get_full_state(ui_root)[1] if ui_root is not None else get_current_package_and_activity()
+            if probe and probe.get("package") == "md.obsidian" and "FileActivity" in (probe.get("activity") or ""):
+                print(f"  ✅ Test 1 PASS: InternVault vault created and entered (FileActivity focused)")
+                return dict(ASSERT_VAULT_CREATED)
+        
+        # Get Android state information in a worker thread. On steps that usually end in a vault check
+        # (Test 1 scan, Test 2 check before Test 1 passed) encode the screenshot meanwhile; other steps
+        # often resolve from state alone, so their call sites encode (and decode the PNG) only if needed
+        state_future = _state_executor.submit(get_android_state, ui_root)
+        needs_vault_vision = (("create" in test_keywords and "internvault" in test_keywords) or
+                              ("meeting notes" in test_keywords and not previous_test_passed))
+        if needs_vault_vision:
+            try:
+                screenshot_url = encode_screenshot(screenshot_path, screenshot_bytes)
+                # The description is needed anyway: overlap the vision call with ADB too
+                if PREFETCH_VISION:
+                    prefetch_screenshot_description(get_llm_client(), screenshot_url, logger)
+            except Exception:
+                pass  # the vision call sites report screenshot problems themselves
+        android_state = state_future.result()
         
         # Check if we're already in vault_home (vault entered successfully)
         current_screen = android_state.get('current_screen', 'unknown')
         ui_text = android_state.get('ui_text', [])
-        ui_text_lower = " ".join([t.lower() for t in ui_text])
+        # Focused package/activity from the same ADB round trip (no extra dumpsys call)
+        pkg_act = android_state.get('package_activity')
+        current_pkg = (pkg_act.get("package") or "").lower() if pkg_act else ""
+        ui_text_lower = " ".join(ui_text).lower()
+        # One scan for every UI phrase checked below (set lookups instead of repeated substring searches)
+        ui_keywords = _scan_ui_keywords(ui_text_lower)
+        # Note phrases in the alphanumeric-only UI text ("Meeting Notes" -> "meetingnotes"), one scan
+        blob_keywords = _scan_blob_keywords(normalize_text(ui_text_lower))
         
         # ===== DUCKDUCKGO: ENSURE WE'RE IN DUCKDUCKGO APP (don't let LLM tap Chrome or other apps) =====
-        if target_package and "duckduckgo" in target_package.lower():
-            pkg_act = get_current_package_and_activity()
-            current_pkg = (pkg_act.get("package") or "").lower() if pkg_act else ""
+        if target_app == "duckduckgo":
             # Don't re-open if we already opened recently OR did any in-app action (tap/type/key) recently - avoids reset loop
             recent_open = any(
                 a.get("action") == "open_app" and "duckduckgo" in (a.get("app") or "").lower()
@@ -311,9 +1462,7 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                 }
 
         # ===== SETTINGS: ENSURE WE'RE IN ANDROID SETTINGS APP =====
-        if target_package and "settings" in target_package.lower():
-            pkg_act = get_current_package_and_activity()
-            current_pkg = (pkg_act.get("package") or "").lower() if pkg_act else ""
+        if target_app == "settings":
             recent_open = any(a.get("action") == "open_app" for a in action_history[-2:])
             recent_in_app = any(a.get("action") in ("tap", "type", "key") for a in action_history[-5:])
             # Don't re-open if we're already in Settings or recently did in-app actions (avoid loop)
@@ -330,9 +1479,7 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                 }
 
         # ===== CALENDAR: ENSURE WE'RE IN CALENDAR APP =====
-        if target_package and ("calendar" in target_package.lower() or "simplemobiletools" in target_package.lower()):
-            pkg_act = get_current_package_and_activity()
-            current_pkg = (pkg_act.get("package") or "").lower() if pkg_act else ""
+        if target_app == "calendar":
             recent_open = any(a.get("action") == "open_app" for a in action_history[-2:])
             recent_in_app = any(a.get("action") in ("tap", "type", "key", "swipe") for a in action_history[-5:])
             in_calendar = current_pkg and ("calendar" in current_pkg or "simplemobiletools" in current_pkg)
@@ -355,15 +1502,7 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
         # BUT: Skip RL patterns if benchmarking mode is enabled (for fair model comparison)
         successful_pattern = None
         if not DISABLE_RL_FOR_BENCHMARKING:
-            if target_package and "duckduckgo" in target_package.lower():
-                app_key = "duckduckgo"
-            elif target_package and "settings" in target_package.lower():
-                app_key = "settings"
-            elif target_package and ("calendar" in target_package.lower() or "simplemobiletools" in target_package.lower()):
-                app_key = "calendar"
-            else:
-                app_key = "obsidian"
-            context = {"app": app_key, "current_screen": android_state.get('current_screen', 'unknown'), "test_goal": test_text}
+            context = {"app": target_app, "current_screen": current_screen, "test_goal": test_text}
             successful_pattern = memory.get_successful_pattern(context)
         
         if successful_pattern and len(successful_pattern) > 0:
@@ -371,8 +1510,9 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
             current_step = len(action_history)
             
             if current_step < len(successful_pattern):
-                # We haven't completed the pattern yet - use next action from memory
-                next_action_from_memory = successful_pattern[current_step]
+                # We haven't completed the pattern yet - use next action from memory. Copy it: the
+                # memoized pattern is the stored one, and main.py annotates the returned action
+                next_action_from_memory = dict(successful_pattern[current_step])
                 print(f"  💾 Using action from memory (step {current_step + 1}/{len(successful_pattern)}) - skipping OpenAI call")
                 print(f"  → Memory action: {next_action_from_memory.get('action')} - {next_action_from_memory.get('description', '')}")
                 # Attach Android state for logging
@@ -386,10 +1526,9 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
         
         # Break permission/notification dialog loop (e.g. DuckDuckGo - tapping Allow repeatedly)
         if action_history and len(action_history) >= 2:
-            recent_descs = [a.get("description", "") for a in action_history[-3:]]
-            allow_taps = sum(1 for d in recent_descs if "allow" in d.lower())
+            allow_taps = sum(1 for d in history.recent_descs(3) if "allow" in d)
             if allow_taps >= 2:
-                if "allow" in ui_text_lower or "notification" in ui_text_lower or "permission" in ui_text_lower:
+                if "allow" in ui_keywords or "notification" in ui_keywords or "permission" in ui_keywords:
                     print(f"  → Already tapped Allow 2+ times on permission dialog, pressing BACK to dismiss (break loop)")
                     return {
                         "action": "key",
@@ -397,197 +1536,93 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                         "description": "Press BACK to dismiss permission dialog (break loop)"
                     }
         
-        # CRITICAL: Check if we're in vault by package/activity (most reliable) - DO THIS FIRST
-        pkg_act = get_current_package_and_activity()
-        is_in_vault = False
-        if pkg_act:
-            package = pkg_act.get("package", "")
-            activity = pkg_act.get("activity", "")
-            # If we're in Obsidian FileActivity, we're in the vault
-            if package == "md.obsidian" and "FileActivity" in activity:
-                is_in_vault = True
-            # Also check if current_screen is vault_home
-            elif current_screen == 'vault_home':
-                is_in_vault = True
+        # CRITICAL: Check if we're in vault by screen / package+activity (most reliable) - DO THIS FIRST
+        # vault_home already proves it; otherwise Obsidian's FileActivity in focus means we're in the vault
+        is_in_vault = (current_screen == 'vault_home')
+        if not is_in_vault and pkg_act:
+            is_in_vault = (current_pkg == "md.obsidian" and "FileActivity" in (pkg_act.get("activity") or ""))
+        
+        # ===== HARD GATE 0: VAULT DETECTION (cheap signals first, NO API CALL) =====
+        # Runs before any other Test 1 handling so the happy path never touches the screenshot;
+        # the screenshot scan further down only runs when this says "unknown"
+        vault_state = _detect_vault_state(ui_keywords, is_in_vault, current_screen) if is_test1 else "unknown"
+        if vault_state == "in":
+            print(f"  ✅ Test 1 PASS: InternVault vault created and entered (detected from UI text/activity)")
+            return dict(ASSERT_VAULT_CREATED)
         
         # ===== CHECK FOR STORAGE SELECTION DIALOG FIRST (HIGH PRIORITY) =====
         # Only handle storage selection for Test 1 (vault creation), not Test 2
         # Test 2 should skip storage selection since vault already exists
-        is_test1 = ("create" in test_text.lower() and "vault" in test_text.lower() and "internvault" in test_text.lower())
-        
         if is_test1:
             # If we see storage selection options, choose "app storage" (not device storage)
             # BUT: Check if we've already tapped storage selection recently (avoid loops)
-            # ALSO: Don't check storage if we're already past it (on vault name input or further)
-            recent_storage_taps = sum(1 for a in action_history[-5:] if 
-                "app storage" in a.get("description", "").lower() or 
-                ("storage" in a.get("description", "").lower() and "tap" in a.get("action", "").lower()))
-            
-            # Check if we're past storage selection (on vault name input or vault created)
-            past_storage_selection = (android_state.get('has_edittext', False) or 
-                                     current_screen == 'vault_name_input' or
-                                     "internvault" in ui_text_lower or
-                                     is_in_vault or
-                                     current_screen == 'vault_home')
-            
-            # Check if storage selection dialog is visible - check UI text first (fast)
-            storage_dialog_visible = (("storage" in ui_text_lower or "choose" in ui_text_lower) and 
-                                      ("device" in ui_text_lower or "app" in ui_text_lower or "internal" in ui_text_lower))
-            
-            # Also check if we just tapped "Continue without sync" - storage dialog should appear next
-            just_continued = False
-            if action_history:
-                last_action = action_history[-1]
-                if ("continue" in last_action.get("description", "").lower() or 
-                    "sync" in last_action.get("description", "").lower() or
-                    last_action.get("action") == "tap" and "continue" in last_action.get("description", "").lower()):
-                    just_continued = True
-                    # After "Continue without sync", storage selection MUST appear before vault name input
-                    # Force storage dialog to be visible if we just continued
-                    if not past_storage_selection and recent_storage_taps == 0:
-                        print(f"  → Just tapped 'Continue without sync', storage selection dialog should appear - analyzing screenshot...")
-                        storage_dialog_visible = True  # Force check for storage dialog
-            
-            # CRITICAL: If we just continued, we MUST handle storage selection FIRST before anything else
-            # Don't check past_storage_selection here - we know storage MUST happen after continue
-            if just_continued and recent_storage_taps == 0:
-                # After "Continue without sync", storage selection MUST appear - analyze screenshot
-                print(f"  → Just tapped 'Continue without sync', MUST select storage before proceeding - analyzing screenshot...")
-                # Check UI text first for quick match
-                if "app storage" in ui_text_lower or "internal storage" in ui_text_lower:
-                    print(f"  → Found 'App storage' in UI text, tapping it...")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap 'App storage' or 'Internal storage' option (not device storage)"
-                    }
-                # If not in UI text, we need to analyze screenshot to find storage options
-                # Continue to main planning which will analyze screenshot and find app storage
-                print(f"  → Storage selection required after 'Continue without sync', analyzing screenshot...")
-                pass  # Continue to main planning which analyzes screenshot
-            
-            # Only handle storage selection if we haven't moved past it
-            elif not past_storage_selection and storage_dialog_visible and recent_storage_taps == 0:
-                # Storage dialog visible and we haven't tapped yet - analyze screenshot to find app storage
-                print(f"  → Storage selection detected, analyzing screenshot to find 'App storage' option...")
-                # Check UI text first for quick match
-                if "app storage" in ui_text_lower or "internal storage" in ui_text_lower:
-                    print(f"  → Found 'App storage' in UI text, tapping it...")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap 'App storage' or 'Internal storage' option (not device storage)"
-                    }
-                # If not in UI text, continue to main planning which will analyze screenshot
-                print(f"  → Storage dialog visible, will analyze screenshot to find 'App storage' option...")
-                pass  # Continue to main planning which analyzes screenshot
-            elif not past_storage_selection and not storage_dialog_visible and recent_storage_taps >= 1:
-                # Storage dialog not visible and we tapped - assume selected, proceed to vault name input
-                print(f"  ✓ Storage selection completed (dialog no longer visible), proceeding to vault creation...")
-                # Check if we're on vault name input screen - if so, check if name is already typed
-                if android_state.get('has_edittext', False) or current_screen == 'vault_name_input':
-                    # Check if "InternVault" is already in the UI text (already typed)
-                    if "internvault" in ui_text_lower:
-                        # Name already typed - look for "Create vault" button
-                        if "create vault" in ui_text_lower or "create" in ui_text_lower:
-                            print(f"  → Vault name 'InternVault' already typed, tapping 'Create vault' button...")
-                            return {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Create vault' button"
-                            }
-                        # Name typed but no create button visible - might need to press ENTER
-                        print(f"  → Vault name typed, pressing ENTER...")
-                        return {
-                            "action": "key",
-                            "code": 66,
-                            "description": "Press ENTER after typing vault name"
-                        }
-                    else:
-                        # Name not typed yet - type "InternVault"
-                        print(f"  → On vault name input screen, typing 'InternVault'...")
-                        return {
-                            "action": "type",
-                            "text": "InternVault",
-                            "description": "Type vault name 'InternVault'"
-                        }
-                # Don't return - continue to next logic (will be handled by main planning)
-            elif not past_storage_selection and storage_dialog_visible and recent_storage_taps >= 1:
-                # Storage dialog still visible but we already tapped - check if we moved to input screen
-                if android_state.get('has_edittext', False) or current_screen == 'vault_name_input':
-                    # Check if name is already typed
-                    if "internvault" in ui_text_lower:
-                        # Name already typed - tap "Create vault" button
-                        if "create vault" in ui_text_lower or "create" in ui_text_lower:
-                            print(f"  → Vault name already typed, tapping 'Create vault' button...")
-                            return {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Create vault' button"
-                            }
-                        return {
-                            "action": "key",
-                            "code": 66,
-                            "description": "Press ENTER after typing vault name"
-                        }
-                    else:
-                        # Name not typed - type it
-                        print(f"  ✓ Storage selected, now on vault name input screen, typing 'InternVault'...")
-                        return {
-                            "action": "type",
-                            "text": "InternVault",
-                            "description": "Type vault name 'InternVault'"
-                        }
-                # Still on storage selection, might need to wait
-                print(f"  ⚠️  Storage tapped but dialog still visible, waiting...")
-                return {
-                    "action": "wait",
-                    "seconds": 1,
-                    "description": "Wait for storage selection to process"
-                }
+            # ALSO: Don't check storage if we're already past it (on vault name input or further)
+            recent_storage_tap = history.recent_storage_tap
+            
+            # Also check if we just tapped "Continue without sync" - storage dialog should appear next
+            # CRITICAL: If we just continued, we MUST handle storage selection FIRST before anything else
+            # Don't trust past_storage_selection here - we know storage MUST happen after continue
+            if history.just_continued and not recent_storage_tap:
+                print(f"  → Just tapped 'Continue without sync', MUST select storage before proceeding - analyzing screenshot...")
+                past_storage_selection = False
+                storage_dialog_visible = True
+            else:
+                # Check if we're past storage selection (on vault name input or vault created)
+                past_storage_selection = (android_state.get('has_edittext', False) or 
+                                         current_screen == 'vault_name_input' or
+                                         "internvault" in ui_keywords or
+                                         is_in_vault or
+                                         current_screen == 'vault_home')
+                # Check if storage selection dialog is visible - check UI text first (fast)
+                storage_dialog_visible = (not past_storage_selection and
+                                          ("storage" in ui_keywords or "choose" in ui_keywords) and
+                                          ("device" in ui_keywords or "app" in ui_keywords or "internal" in ui_keywords))
+            
+            # The vault name input screen counts as past_storage_selection, so the table only
+            # covers the storage dialog itself; name typing is handled further down
+            if not past_storage_selection:
+                app_storage_listed = None
+                if storage_dialog_visible and not recent_storage_tap:
+                    app_storage_listed = "app storage" in ui_keywords or "internal storage" in ui_keywords
+                storage_decision = STORAGE_SELECTION_ACTIONS.get(
+                    (storage_dialog_visible, recent_storage_tap, app_storage_listed))
+                if storage_decision:
+                    message, storage_action = storage_decision
+                    print(message)
+                    if storage_action:
+                        return dict(storage_action)
         
         # Note: is_in_vault is already defined above (moved earlier to avoid undefined variable error)
         
+        # ===== TEST 2 COMPLETE: "Meeting Notes" + "Daily Standup" in the note editor =====
+        # Checked once, before every other Test 2 gate, so no later branch can loop on a finished note
+        if is_test2 and _test2_complete(current_screen, blob_keywords):
+            print(f"  ✅ Test 2 PASS: Both 'Meeting Notes' and 'Daily Standup' are present in note!")
+            return dict(ASSERT_NOTE_CREATED)
+        
         # ===== CHECK IF NOTE IS ALREADY CREATED (BEFORE VAULT CHECK) =====
         # For Test 2: Check if note is already done (only if not using previous_test_passed fast path)
         # Skip this if previous_test_passed is True (handled in Test 2 section above)
-        if ("meeting notes" in test_text.lower() and "daily standup" in test_text.lower()) and not previous_test_passed:
+        if is_test2 and not previous_test_passed:
             # Check if we're in note editor with the correct content
             if current_screen == 'note_editor':
-                ui_text_lower = " ".join([t.lower() for t in ui_text])
                 # Check if note title and content are present
-                has_title = "meeting notes" in ui_text_lower
-                has_content = "daily standup" in ui_text_lower
-                has_untitled = "untitled" in ui_text_lower
+                has_title = "meeting notes" in ui_keywords
+                has_content = "daily standup" in ui_keywords
+                has_untitled = "untitled" in ui_keywords
                 
                 if has_title and has_content:
                     print(f"  ✅ Test 2 PASS: Note 'Meeting Notes' with 'Daily Standup' already created!")
-                    return {
-                        "action": "assert",
-                        "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                    }
+                    return dict(ASSERT_NOTE_CREATED)
                 elif has_untitled and not has_title:
                     # CRITICAL: "Untitled" is in the title - clear it and type "Meeting Notes" first
                     # The executor will automatically clear "Untitled" before typing (Ctrl+A + DEL)
                     print(f"  → Found 'Untitled' in title, clearing it and typing 'Meeting Notes'...")
-                    return {
-                        "action": "type",
-                        "text": "Meeting Notes",
-                        "target": "title",
-                        "description": "Clear 'Untitled' and type note title 'Meeting Notes'"
-                    }
+                    return dict(CLEAR_UNTITLED_TYPE_TITLE)
                 elif has_title and not has_content:
                     # Note title "Meeting Notes" is set, but content not typed yet - focus body and type "Daily Standup"
                     print(f"  → Note 'Meeting Notes' created, focusing body field to type 'Daily Standup'...")
-                    return {
-                        "action": "focus",
-                        "target": "body",
-                        "description": "Focus note body editor"
-                    }
+                    return dict(FOCUS_NOTE_BODY)
                 elif not has_title and not has_untitled:
                     # Title not typed and no "Untitled" - type "Meeting Notes" first (heading) with target="title"
                     print(f"  → In note editor, typing title 'Meeting Notes'...")
@@ -600,7 +1635,7 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                 # If neither, continue to create note
             
             # Also check if note exists in vault home (note list)
-            if (is_in_vault or current_screen == 'vault_home') and "meeting notes" in " ".join([t.lower() for t in ui_text]):
+            if (is_in_vault or current_screen == 'vault_home') and "meeting notes" in ui_keywords:
                 # Note exists in list, but we need to check if it has the content
                 # For now, assume we need to open and verify/add content
                 print(f"  → Note 'Meeting Notes' found in vault, checking if content is added...")
@@ -610,115 +1645,26 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
         if test_id in [3, 4]:
             print(f"  📄 Generating UI XML dump for Test {test_id} step...")
             try:
-                root = dump_ui()
+                # Same step, same screen: save the tree get_android_state() already parsed
+                root = _last_ui_dump["root"]
                 if root is not None:
-                    xml_str = ET.tostring(root, encoding='unicode')
-                    os.makedirs("xml_dumps", exist_ok=True)
                     dump_file = f"xml_dumps/test{test_id}_step_{int(time.time())}.xml"
-                    with open(dump_file, 'w', encoding='utf-8') as f:
-                        f.write(xml_str)
-                    print(f"  ✓ UI XML dump saved to: {dump_file}")
+                    _dump_writer.submit(_write_xml_dump, root, dump_file)
+                    print(f"  ✓ UI XML dump queued: {dump_file}")
             except Exception as e:
                 print(f"  ⚠️  Could not generate UI dump: {e}")
         
         # ===== TEST 3: PRINT TO PDF IN MEETING NOTES =====
         # Test 3 runs after Test 2, so we're already in Meeting Notes page (with Daily Standup)
         # Just need to: Open menu (three dots on top right) → Look for Print to PDF
-        if "print to pdf" in test_text.lower() or ("print" in test_text.lower() and "pdf" in test_text.lower()):
-            # CRITICAL: Check if we've already searched for Print to PDF and confirmed it's not there
-            # Check execution_result parameter first, then check last action's _execution_result
-            last_execution_result = None
-            if execution_result:
-                last_execution_result = execution_result
-            elif action_history and len(action_history) > 0:
-                last_action = action_history[-1]
-                last_execution_result = last_action.get("_execution_result")
-            
-            if last_execution_result and last_execution_result.get("print_to_pdf_found") == False:
-                print(f"  ✅ Test 3 COMPLETE: 'Print to PDF' not found in menu (as expected) - test will FAIL")
-                return {
-                    "action": "assert",
-                    "description": "Print to PDF button not found in menu - test correctly fails as expected"
-                }
-            
-            # Check if we just opened the menu (recent action was tapping three dots menu)
-            if action_history and len(action_history) > 0:
-                last_action = action_history[-1]
-                if (last_action.get("action") == "tap" and 
-                    ("three dots" in last_action.get("description", "").lower() or 
-                     "more options" in last_action.get("description", "").lower() or
-                     "menu button" in last_action.get("description", "").lower())):
-                    # We just opened the menu - check if Print to PDF was found
-                    action_execution_result = last_action.get("_execution_result")
-                    if action_execution_result and action_execution_result.get("print_to_pdf_found") == False:
-                        print(f"  ✅ Test 3 COMPLETE: Menu opened, 'Print to PDF' not found - test will FAIL")
-                        return {
-                            "action": "assert",
-                            "description": "Print to PDF button not found in menu - test correctly fails as expected"
-                        }
-                    # If execution_result doesn't have print_to_pdf_found, wait for next step
-                    # (executor might still be processing)
-            
-            # Check if we've already tapped the menu button recently (prevent loops)
-            recent_menu_taps = 0
-            if action_history:
-                for action in reversed(action_history[-5:]):  # Check last 5 actions
-                    if (action.get("action") == "tap" and 
-                        ("three dots" in action.get("description", "").lower() or 
-                         "more options" in action.get("description", "").lower() or
-                         "menu button" in action.get("description", "").lower())):
-                        recent_menu_taps += 1
-                        # Check if this action already searched for Print to PDF
-                        action_exec_result = action.get("_execution_result")
-                        if action_exec_result and action_exec_result.get("print_to_pdf_found") == False:
-                            print(f"  ✅ Test 3 COMPLETE: Already searched menu, 'Print to PDF' not found - test will FAIL")
-                            return {
-                                "action": "assert",
-                                "description": "Print to PDF button not found in menu - test correctly fails as expected"
-                            }
-            
-            # If we've tapped the menu multiple times, assume task is complete
-            if recent_menu_taps >= 2:
-                print(f"  ✅ Test 3 COMPLETE: Menu already opened multiple times, 'Print to PDF' not found - test will FAIL")
-                return {
-                    "action": "assert",
-                    "description": "Print to PDF button not found in menu - test correctly fails as expected"
-                }
-            
-            # Check if we're in the Meeting Notes page (with Daily Standup)
-            if "meeting notes" in ui_text_lower and "daily standup" in ui_text_lower:
-                # We're in Meeting Notes page - look for menu button (three dots on top right)
-                print(f"  → In Meeting Notes page (after Test 2), looking for three dots menu button (top right) to find Print to PDF...")
-                return {
-                    "action": "tap",
-                    "x": 0,
-                    "y": 0,
-                    "description": "Tap three dots menu button (top right) in Meeting Notes to find Print to PDF"
-                }
-            else:
-                # If not in Meeting Notes, we might have navigated away - try to get back
-                print(f"  → Not in Meeting Notes page, trying to navigate back...")
-                # Check if we're in vault home - need to open Meeting Notes
-                if "create note" in ui_text_lower or "new note" in ui_text_lower or "files" in ui_text_lower:
-                    print(f"  → In vault home, looking for Meeting Notes file...")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap 'Meeting Notes' file in vault to open it"
-                    }
-                else:
-                    # Try going back
-                    print(f"  → Going back to reach Meeting Notes page...")
-                    return {
-                        "action": "key",
-                        "code": 4,  # BACK key
-                        "description": "Go back to reach Meeting Notes page"
-                    }
+        if goal.is_pdf_test:
+            message, pdf_action = test3_pdf_action(ui_keywords, history, action_history, execution_result)
+            print(message)
+            return dict(pdf_action)
         
-        is_duckduckgo = bool(target_package and "duckduckgo" in target_package.lower())
+        is_duckduckgo = target_app == "duckduckgo"
         # ===== DUCKDUCKGO TEST 1: SEARCH - submit after typing (avoids 17-step loop) =====
-        if is_duckduckgo and "search" in test_text.lower() and "weather" in test_text.lower():
+        if is_duckduckgo and "search" in test_keywords and "weather" in test_keywords:
             if action_history:
                 last = action_history[-1]
                 # Detect "just typed weather" by text key or description (LLM sometimes omits "text")
@@ -726,39 +1672,39 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                     last.get("action") == "type"
                     and (
                         (last.get("text") or "").strip().lower() == "weather"
-                        or "weather" in (last.get("description") or "").lower()
+                        or "weather" in history.last_desc
                     )
                 )
                 if just_typed_weather:
                     print(f"  → DuckDuckGo search: Just typed 'weather', submitting search (ENTER)...")
                     return {"action": "key", "code": 66, "description": "Press ENTER to submit search"}
                 # If we already pressed ENTER but still on suggestions, try tapping Search/Go button
-                if last.get("action") == "key" and last.get("code") == 66 and "enter" in (last.get("description") or "").lower():
+                if last.get("action") == "key" and last.get("code") == 66 and "enter" in history.last_desc:
                     print(f"  → DuckDuckGo search: ENTER already sent, tapping Search/Go button...")
                     return {"action": "tap", "element": "Search", "description": "Tap Search or Go to submit", "x": 0, "y": 0}
         # ===== DUCKDUCKGO: MENU (THREE DOTS TOP-RIGHT) + SETTINGS/PRIVACY =====
         # DuckDuckGo browser: three-dots menu is TOP-RIGHT (not Obsidian's top-left sidebar)
-        if is_duckduckgo and ("settings" in test_text.lower() or "menu" in test_text.lower() or "privacy" in test_text.lower()):
+        if is_duckduckgo and ("settings" in test_keywords or "menu" in test_keywords or "privacy" in test_keywords):
             # Test 4 requires Appearance/Theme screen; do not assert on main Settings only
-            test_requires_appearance = "appearance" in test_text.lower() or "theme" in test_text.lower()
+            test_requires_appearance = "appearance" in test_keywords or "theme" in test_keywords
             if test_requires_appearance:
                 # Only assert when we're inside Appearance/Theme screen (theme options visible)
-                if any(k in ui_text_lower for k in ("appearance", "theme", "system default")):
+                if any(k in ui_keywords for k in ("appearance", "theme", "system default")):
                     print(f"  ✅ DuckDuckGo: Appearance/Theme screen visible - test goal achieved.")
                     return {"action": "assert", "description": "Appearance or Theme settings screen visible"}
                 # In main Settings but not in Appearance - tap Appearance or Theme
-                if any(k in ui_text_lower for k in ("settings", "privacy", "preferences")):
+                if any(k in ui_keywords for k in ("settings", "privacy", "preferences")):
                     print(f"  → DuckDuckGo: In Settings menu, tapping Appearance/Theme...")
                     return {"action": "tap", "element": "Appearance", "description": "Tap Appearance or Theme in Settings", "x": 0, "y": 0}
             else:
                 # Not Test 4: assert when any settings-like screen is visible
-                if any(k in ui_text_lower for k in ("settings", "privacy", "appearance", "theme", "preferences")):
+                if any(k in ui_keywords for k in ("settings", "privacy", "appearance", "theme", "preferences")):
                     print(f"  ✅ DuckDuckGo: Settings/settings screen visible - test goal achieved.")
                     return {"action": "assert", "description": "Settings or preferences screen visible"}
             # Just opened menu - tap Settings or Privacy from XML
             if action_history:
                 last = action_history[-1]
-                last_desc = (last.get("description") or "").lower()
+                last_desc = history.last_desc
                 if ("three dots" in last_desc or "menu" in last_desc or "top-right" in last_desc or
                     (last.get("action") == "tap" and last.get("x", 0) > 500 and last.get("y", 0) < 400)):
                     print(f"  → DuckDuckGo: Menu opened, tapping Settings or Privacy...")
@@ -775,18 +1721,18 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                     "y": int(h * 0.08),
                     "description": "Tap three dots menu (top right)"
                 }
-            return {"action": "tap", "x": 994, "y": 197, "description": "Tap three dots menu (top right)"}
+            return dict(TAP_THREE_DOTS_MENU)
         
         # ===== DUCKDUCKGO TEST 3: EXPORT SEARCH HISTORY TO PDF (expected not found) =====
         # Look ONLY for "Export search history to PDF"; if menu is open, return FAIL (don't tap Duck.ai or other menu items)
-        if is_duckduckgo and "export" in test_text.lower() and "pdf" in test_text.lower():
+        if is_duckduckgo and "export" in test_keywords and "pdf" in test_keywords:
             if action_history:
                 last = action_history[-1]
-                last_desc = (last.get("description") or "").lower()
+                last_desc = history.last_desc
                 if ("three dots" in last_desc or "menu" in last_desc or "top-right" in last_desc or
                     (last.get("action") == "tap" and last.get("x", 0) > 500 and last.get("y", 0) < 400)):
                     # Menu is open - "Export search history to PDF" does not exist in standard app; return FAIL (do not tap other items)
-                    if "export search history" in ui_text_lower or ("export" in ui_text_lower and "pdf" in ui_text_lower):
+                    if "export search history" in ui_keywords or ("export" in ui_keywords and "pdf" in ui_keywords):
                         return {"action": "tap", "element": "Export search history to PDF", "description": "Tap Export search history to PDF", "x": 0, "y": 0}
                     print(f"  ✅ DuckDuckGo Test 3: 'Export search history to PDF' not in menu (expected) - returning FAIL")
                     return {
@@ -800,18 +1746,18 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
             if screen_size:
                 w, h = screen_size
                 return {"action": "tap", "x": int(w * 0.92), "y": int(h * 0.08), "description": "Tap three dots menu (top right)"}
-            return {"action": "tap", "x": 994, "y": 197, "description": "Tap three dots menu (top right)"}
+            return dict(TAP_THREE_DOTS_MENU)
         
         # ===== TEST 3: SETTINGS/APPEARANCE NAVIGATION (OBSIDIAN ONLY) =====
         # Test 3 requires: Button below time → Settings → Appearance → Verify icon color
-        if "settings" in test_text.lower() and "appearance" in test_text.lower() and not is_duckduckgo:
+        if goal.is_appearance_test and not is_duckduckgo:
             
             # CRITICAL: Check if we just tapped Appearance - we're now in Appearance screen
             just_tapped_appearance = False
             if action_history and len(action_history) > 0:
                 last_action = action_history[-1]
                 if (last_action.get("action") == "tap" and 
-                    "appearance" in last_action.get("description", "").lower()):
+                    "appearance" in history.last_desc):
                     just_tapped_appearance = True
                     print(f"  → Just tapped Appearance (last action), now in Appearance screen - verifying icon color...")
                     # We're in Appearance screen - verify icon color and return assert
@@ -821,7 +1767,7 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                     }
             
             # Check if we're already in Appearance screen (by UI text)
-            if "appearance" in ui_text_lower:
+            if "appearance" in ui_keywords:
                 # We're in Appearance - verify icon color using XML dump
                 print(f"  → In Appearance screen (detected by UI text), verifying icon color...")
                 # Color verification will be done by supervisor using screenshot
@@ -834,52 +1780,34 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
             # This MUST be checked FIRST to prevent loop after tapping Settings
             if action_history and len(action_history) > 0:
                 last_action = action_history[-1]
-                last_desc = last_action.get("description", "").lower()
+                last_desc = history.last_desc
                 if (last_action.get("action") == "tap" and 
                     ("settings" in last_desc or "sidebar" in last_desc)):
                     # We just tapped Settings - we should be in Settings screen now
                     # Look for Appearance tab immediately
                     print(f"  → Just tapped Settings (last action), now in Settings screen - looking for Appearance tab...")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap 'Appearance' tab in Settings"
-                    }
+                    return dict(TAP_APPEARANCE_TAB)
             
             # Check if we've tapped Settings in recent actions (state tracking)
             # This catches cases where UI text doesn't show "settings" but we know we're in Settings
-            has_tapped_settings = any(
-                a.get("action") == "tap" and "settings" in a.get("description", "").lower()
-                for a in action_history[-5:]  # Check last 5 actions (more reliable)
-            )
+            has_tapped_settings, recent_below_time_taps, recently_verified_settings = settings_nav_history(history)
             
             # If we've tapped Settings recently, assume we're in Settings screen
-            if has_tapped_settings and "appearance" not in ui_text_lower:
+            if has_tapped_settings and "appearance" not in ui_keywords:
                 # We've tapped Settings before - we should be in Settings screen
                 # Look for Appearance tab
                 print(f"  → Previously tapped Settings, in Settings screen - looking for Appearance tab...")
-                return {
-                    "action": "tap",
-                    "x": 0,
-                    "y": 0,
-                    "description": "Tap 'Appearance' tab in Settings"
-                }
+                return dict(TAP_APPEARANCE_TAB)
             
             # Check if we're in Settings screen (by UI text)
-            if "settings" in ui_text_lower and "appearance" not in ui_text_lower:
+            if "settings" in ui_keywords and "appearance" not in ui_keywords:
                 # In Settings but not in Appearance - tap Appearance
                 print(f"  → In Settings screen (detected by UI text), tapping 'Appearance' tab...")
-                return {
-                    "action": "tap",
-                    "x": 0,
-                    "y": 0,
-                    "description": "Tap 'Appearance' tab in Settings"
-                }
+                return dict(TAP_APPEARANCE_TAB)
             
             # Check if we just opened sidebar - Settings should be found automatically by executor
             # The executor's open_sidebar action handles finding and tapping Settings via LLM vision
-            if action_history and action_history[-1].get("action") == "open_sidebar":
+            if history.last_type == "open_sidebar":
                 # Sidebar was just opened - executor should have found and tapped Settings automatically
                 # Check execution result to see if Settings was tapped
                 if execution_result and execution_result.get("status") == "partial":
@@ -908,63 +1836,23 @@ def plan_next_action(test_text, screenshot_path, action_history, previous_test_p
                     # Executor should have tapped Settings - verify we're in Settings using LLM vision
                     print(f"  → Verifying we're in Settings screen using LLM vision...")
                     try:
-                        from tools.screenshot import take_screenshot
-                        # Image, io, base64, json, re are already imported at top of file
-                        
                         verify_screenshot = take_screenshot(f"settings_check_{int(time.time())}.png")
-                        img = Image.open(verify_screenshot)
-                        img_buffer = io.BytesIO()
-                        img.save(img_buffer, format='PNG')
-                        img_buffer.seek(0)
-                        img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+                        screenshot_url = encode_screenshot(verify_screenshot)
                         
                         # TWO-STEP PROCESS: Vision → Reasoning
                         # Step 1: Vision API describes screenshot
                         current_llm_client = get_llm_client()
                         
-                        vision_prompt = """Look at this screenshot of the Obsidian mobile app.
-
-Describe what you see in detail:
-- What screen/UI is currently displayed?
-- What buttons, text fields, or UI elements are visible?
-- What text is displayed on screen?
-- What is the current state of the app?
-
-Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
-                        
                         print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
-                        vision_response = current_llm_client.call_vision(
-                            messages=[
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {"type": "text", "text": vision_prompt},
-                                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
-                                    ]
-                                }
-                            ],
-                            logger=logger,
-                            temperature=0.1,
-                            max_tokens=500
-                        )
+                        screenshot_description = describe_screenshot(current_llm_client, screenshot_url, logger)
                         
-                        if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
+                        if not screenshot_description:
                             print(f"  ⚠️  Vision API failed, falling back to UI text check")
-                            if "settings" in ui_text_lower:
-                                return {
-                                    "action": "tap",
-                                    "x": 0,
-                                    "y": 0,
-                                    "description": "Tap 'Appearance' tab in Settings"
-                                }
+                            if "settings" in ui_keywords:
+                                return dict(TAP_APPEARANCE_TAB)
                             else:
-                                return {
-                                    "action": "wait",
-                                    "seconds": 1,
-                                    "description": "Wait for Settings screen to load"
-                                }
+                                return dict(WAIT_SETTINGS_LOAD)
                         
-                        screenshot_description = vision_response.choices[0].message.content.strip()
                         print(f"  ✓ Screenshot analyzed")
                         
                         # Step 2: Reasoning model analyzes description
@@ -1001,24 +1889,15 @@ If you see Settings screen elements, return {{"in_settings": true}}. Otherwise {
                         
                         if not verify_response or not verify_response.choices or not verify_response.choices[0].message.content:
                             print(f"  ⚠️  Reasoning model failed, falling back to UI text check")
-                            if "settings" in ui_text_lower:
-                                return {
-                                    "action": "tap",
-                                    "x": 0,
-                                    "y": 0,
-                                    "description": "Tap 'Appearance' tab in Settings"
-                                }
+                            if "settings" in ui_keywords:
+                                return dict(TAP_APPEARANCE_TAB)
                             else:
-                                return {
-                                    "action": "wait",
-                                    "seconds": 1,
-                                    "description": "Wait for Settings screen to load"
-                                }
+                                return dict(WAIT_SETTINGS_LOAD)
                         
                         response_text = verify_response.choices[0].message.content.strip()
-                        json_match = re.search(r'\{[^}]+\}', response_text, re.DOTALL)
+                        json_match = _JSON_OBJECT_RE.search(response_text)
                         if json_match:
-                            verify_result = json.loads(json_match.group())
+                            verify_result = parse_json(json_match.group())
                             if verify_result.get("in_settings"):
                                 print(f"  ✓ LLM confirmed: We're in Settings screen ({verify_result.get('reason', '')})")
                                 
@@ -1048,22 +1927,13 @@ If you see Settings screen elements, return {{"in_settings": true}}. Otherwise {
                             else:
                                 print(f"  ⚠️  LLM says we're NOT in Settings screen ({verify_result.get('reason', '')})")
                                 # Wait and retry
-                                return {
-                                    "action": "wait",
-                                    "seconds": 1,
-                                    "description": "Wait for Settings screen to load after tapping Settings"
-                                }
+                                return dict(WAIT_SETTINGS_AFTER_TAP)
                         else:
                             print(f"  ⚠️  Could not parse LLM verification response, checking UI text...")
                             # Fallback to UI text check
-                            if "settings" in ui_text_lower:
+                            if "settings" in ui_keywords:
                                 print(f"  → UI text indicates Settings screen, looking for Appearance tab...")
-                                return {
-                                    "action": "tap",
-                                    "x": 0,
-                                    "y": 0,
-                                    "description": "Tap 'Appearance' tab in Settings"
-                                }
+                                return dict(TAP_APPEARANCE_TAB)
                     except Exception as e:
                         error_msg = str(e)
                         if "quota" in error_msg.lower() or "429" in error_msg:
@@ -1072,40 +1942,23 @@ If you see Settings screen elements, return {{"in_settings": true}}. Otherwise {
                             print(f"  ⚠️  Error verifying Settings screen: {e}")
                         
                         # Fallback to UI text check
-                        if "settings" in ui_text_lower:
+                        if "settings" in ui_keywords:
                             print(f"  → UI text indicates Settings screen, looking for Appearance tab...")
-                            return {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Appearance' tab in Settings"
-                            }
+                            return dict(TAP_APPEARANCE_TAB)
                         else:
                             # Not in Settings yet - wait a moment for screen to load
                             print(f"  → Sidebar opened, waiting for Settings screen to load...")
-                            return {
-                                "action": "wait",
-                                "seconds": 1,
-                                "description": "Wait for Settings screen to load after tapping Settings"
-                            }
+                            return dict(WAIT_SETTINGS_AFTER_TAP)
             
             # Check if we need to tap button below time (top-right) to open sidebar with Settings
             # Only if we haven't tapped it recently (prevent loop) AND we're not already in Settings
-            recent_below_time_taps = [
-                a for a in action_history[-3:] 
-                if a.get("action") == "tap" and "below time" in a.get("description", "").lower()
-            ]
+            # (recent_below_time_taps / recently_verified_settings come from settings_nav_history above)
             
             # Don't try to open sidebar again if we just opened it or if we're already in Settings
-            just_opened_sidebar = action_history and action_history[-1].get("action") == "open_sidebar"
-            # Check if we recently verified we're in Settings (via LLM or UI text)
-            recently_verified_settings = any(
-                "settings" in a.get("description", "").lower() and "verified" in a.get("description", "").lower()
-                for a in action_history[-3:]
-            )
-            already_in_settings = any("settings" in t.lower() for t in ui_text) or has_tapped_settings or recently_verified_settings
+            just_opened_sidebar = history.last_type == "open_sidebar"
+            already_in_settings = "settings" in ui_keywords or has_tapped_settings or recently_verified_settings
             
-            if not already_in_settings and not just_opened_sidebar and len(recent_below_time_taps) < 2:
+            if not already_in_settings and not just_opened_sidebar and recent_below_time_taps < 2:
                 # Not in Settings or Appearance - need to open sidebar first
                 # Use reliable ratio coordinates for sidebar button (open_sidebar)
                 print(f"  → Opening sidebar using ratio coordinates (0.12W, 0.09H)...")
@@ -1133,418 +1986,244 @@ If you see Settings screen elements, return {{"in_settings": true}}. Otherwise {
                         "description": "Open sidebar using default coordinates"
                     }
         
-        # ===== HARD GATE 0: FAST UI TEXT CHECK FIRST (NO API CALL) =====
-        # For Test 1: Check if "create new note" button is visible (means we're in vault - TEST 1 PASS)
-        if "create" in test_text.lower() and "vault" in test_text.lower() and "internvault" in test_text.lower():
-            # CRITICAL: If "create new note" or "create note" button is visible, we're in vault - Test 1 PASS
-            if "create note" in ui_text_lower or "new note" in ui_text_lower or "create new note" in ui_text_lower:
-                print(f"  ✅ Test 1 PASS: 'Create new note' button visible - vault entered successfully!")
-                return {
-                    "action": "assert",
-                    "description": "Vault 'InternVault' created and entered successfully (create new note button visible)"
-                }
-            
-            # Fast check: Look for "files in internvault" or similar in UI text
-            vault_detected = False
-            
-            if ("files in internvault" in ui_text_lower or 
-                ("internvault" in ui_text_lower and ("files" in ui_text_lower or "note" in ui_text_lower))):
-                vault_detected = True
-                print(f"  ✓ In InternVault vault (detected from UI text)")
-            
-            # Also check if we're in FileActivity (most reliable)
-            if is_in_vault or current_screen == 'vault_home':
-                vault_detected = True
-                print(f"  ✓ In InternVault vault (FileActivity/vault_home detected)")
-            
-            # If vault detected, assert (Test 1 only requires vault creation)
-            if vault_detected:
-                print(f"  ✅ Test 1 PASS: InternVault vault created and entered")
-                return {
-                    "action": "assert",
-                    "description": "Vault 'InternVault' created and entered successfully"
-                }
+        # ===== TEST 1 SETUP FAST PATH (state decides the step, NO API CALL) =====
+        if is_test1:
+            fast_path = test1_setup_fast_action(current_screen, ui_keywords,
+                                                android_state.get('has_edittext', False), history)
+            if fast_path:
+                message, fast_action, reward_key = fast_path
+                print(message)
+                if reward_key:
+                    memory.update_reward(reward_key, 0.1)  # Positive reward
+                return dict(fast_action)
         
-        # ===== HARD GATE 0: SCREENSHOT-BASED VAULT DETECTION =====
-        # ALWAYS analyze screenshots - OpenAI vision needs to see the UI to make decisions
-        # Don't skip screenshot analysis - it's critical for understanding the current state
-        if "create" in test_text.lower() and "vault" in test_text.lower() and "internvault" in test_text.lower():
+        # ===== HARD GATE 0 (cont.): SCREENSHOT-BASED VAULT DETECTION =====
+        # Only reached when the cheap signals above were inconclusive (vault_state == "unknown")
+        # The scan also asks for the next action, so main planning can skip its own reasoning call
+        scan_next_action = None
+        if is_test1 and vault_state == "unknown":
             print(f"  📸 Analyzing screenshot (current screen: {current_screen})...")
             force_screenshot_analysis = True
             
             # Use LLM to analyze screenshot
             print(f"  🔍 Analyzing screenshot to check if already in InternVault vault...")
             
-            # Read and encode screenshot
-            img = Image.open(screenshot_path)
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
-            
-            # TWO-STEP PROCESS: Vision → Reasoning
-            # Step 1: Vision API describes screenshot
-            current_llm_client = get_llm_client()
+            # Same screen already scanned for this test? Reuse the verdict (perceptual hash match)
+            scan_image_hash = screenshot_ahash(screenshot_path, screenshot_bytes)
+            scan_result = get_cached_vault_scan(scan_image_hash, test_text, pkg_act)
+            if scan_result is not None:
+                print(f"  ♻️  Reusing vault scan for unchanged screen")
+            else:
+                # Read and encode screenshot
+                screenshot_url = encode_screenshot(screenshot_path, screenshot_bytes)
             
-            vision_prompt = """Look at this screenshot of the Obsidian mobile app.
-
-Describe what you see in detail:
-- What screen/UI is currently displayed?
-- What buttons, text fields, or UI elements are visible?
-- What text is displayed on screen?
-- What is the current state of the app?
-
-Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
+                # TWO-STEP PROCESS: Vision → Reasoning
+                # Step 1: Vision API describes screenshot
+                current_llm_client = get_llm_client()
             
-            try:
-                print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
-                vision_response = current_llm_client.call_vision(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": vision_prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
-                            ]
-                        }
-                    ],
-                    logger=logger,
-                    temperature=0.1,
-                    max_tokens=500
-                )
+                try:
+                    print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
+                    screenshot_description = describe_screenshot(current_llm_client, screenshot_url, logger)
                 
-                if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
-                    print(f"  ⚠️  Vision API failed, falling back to state-based detection")
-                    raise Exception("Vision API failed")
+                    if not screenshot_description:
+                        print(f"  ⚠️  Vision API failed, falling back to state-based detection")
+                        raise Exception("Vision API failed")
                 
-                screenshot_description = vision_response.choices[0].message.content.strip()
-                print(f"  ✓ Screenshot analyzed")
+                    print(f"  ✓ Screenshot analyzed")
                 
-                # Step 2: Reasoning model analyzes description
-                reasoning_prompt = f"""Based on this screenshot description, are we currently INSIDE the InternVault vault?
-
-Screenshot Description:
-{screenshot_description}
-
-CRITICAL SIGNS that we're IN the vault (if you see ANY of these, we're IN):
-- Text at top left says "files in internvault" or "InternVault" or shows vault name
-- We see a file list or note list with Obsidian UI (not Android file picker)
-- We see "Create note" or "New note" buttons in Obsidian interface
-- We see the vault name "InternVault" displayed prominently
-- We see note files or folders in Obsidian's file browser
-- The UI looks like Obsidian's main vault interface (not a file picker)
-- We're NOT in a file picker or folder selection screen
-
-Signs that we're NOT in the vault:
-- We see "Create vault" or "Get started" buttons
-- We see a file picker (Android system UI with folder icons)
-- We see "Use this folder" button (this is file picker, not vault)
-- We see "CREATE NEW FOLDER" button (file picker)
-- We see folder selection screen with Android system UI
-- We see welcome/setup screen
-
-IMPORTANT: If you see "files in internvault" at the top left, we are DEFINITELY in the vault!
-
-Return ONLY valid JSON:
-- If we're IN InternVault vault: {{"in_vault": true, "reason": "vault UI visible"}}
-- If we're NOT in vault: {{"in_vault": false, "reason": "..."}}
-
-Output ONLY valid JSON, no markdown:"""
+                    # Step 2: Reasoning model judges the description and plans the next action in one call
+                    scan_state_str, scan_xml_hint = format_android_state(android_state, current_screen, ui_text, xml_element_summary)
+                    reasoning_prompt = VAULT_SCAN_PROMPT.format(
+                        state_str=scan_state_str, screenshot_description=screenshot_description, test_text=test_text,
+                        history_str=format_action_history(action_history), xml_hint=scan_xml_hint)
                 
-                print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
-                scan_response = current_llm_client.call_reasoning(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": reasoning_prompt
-                        }
-                    ],
-                    logger=logger,
-                    temperature=0.1,
-                    max_tokens=100
-                )
+                    print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
+                    scan_response = current_llm_client.call_reasoning(
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": VAULT_SCAN_SYSTEM_PROMPT
+                            },
+                            {
+                                "role": "user",
+                                "content": reasoning_prompt
+                            }
+                        ],
+                        logger=logger,
+                        temperature=0.1,
+                        max_tokens=VAULT_SCAN_MAX_TOKENS,
+                        response_format=JSON_OBJECT_FORMAT
+                    )
                 
-                if scan_response and scan_response.choices and scan_response.choices[0].message.content:
-                    scan_result_text = scan_response.choices[0].message.content.strip()
-                    # Remove markdown if present
-                    if scan_result_text.startswith("```json"):
-                        scan_result_text = scan_result_text[7:]
-                    if scan_result_text.startswith("```"):
-                        scan_result_text = scan_result_text[3:]
-                    if scan_result_text.endswith("```"):
-                        scan_result_text = scan_result_text[:-3]
-                    scan_result_text = scan_result_text.strip()
-                    
-                    scan_result = json.loads(scan_result_text)
-                    in_vault_from_screenshot = scan_result.get("in_vault", False)
-                    reason = scan_result.get("reason", "")
-                    
-                    print(f"  📊 Screenshot Analysis: in_vault={in_vault_from_screenshot}, reason={reason}")
-                    
-                    if in_vault_from_screenshot:
-                        # We're already in the vault! Test 1 PASS
-                        print(f"  ✅ Test 1 PASS: InternVault vault created and entered (detected from screenshot)")
-                        return {
-                            "action": "assert",
-                            "description": "Vault 'InternVault' created and entered successfully"
-                        }
-                    else:
-                        # Not in vault yet, need to create/enter vault
-                        print(f"  → Not in vault yet (screenshot analysis), will proceed with vault creation/entry")
-            except Exception as e:
-                print(f"  ⚠️  Screenshot analysis failed: {e}, falling back to state-based detection")
-                # Fall through to state-based detection
+                    if scan_response and scan_response.choices and scan_response.choices[0].message.content:
+                        scan_reply = parse_model_json(scan_response.choices[0].message.content)
+                        if is_vault_verdict(scan_reply):
+                            # Only the verdict is cached; the planned action belongs to this tick
+                            scan_result = {"in_vault": scan_reply["in_vault"], "reason": scan_reply.get("reason", "")}
+                            cache_vault_scan(scan_image_hash, test_text, scan_result, pkg_act)
+                            next_action = scan_reply.get("next_action")
+                            if not scan_result["in_vault"] and isinstance(next_action, dict) and isinstance(next_action.get("action"), str):
+                                scan_next_action = next_action
+                        else:
+                            print(f"  ⚠️  Vault scan reply has no in_vault verdict, ignoring it")
+                except Exception as e:
+                    print(f"  ⚠️  Screenshot analysis failed: {e}, falling back to state-based detection")
+                    # Fall through to state-based detection
+            
+            if isinstance(scan_result, dict):
+                in_vault_from_screenshot = scan_result.get("in_vault", False)
+                reason = scan_result.get("reason", "")
+                
+                print(f"  📊 Screenshot Analysis: in_vault={in_vault_from_screenshot}, reason={reason}")
+                
+                if in_vault_from_screenshot:
+                    # We're already in the vault! Test 1 PASS
+                    print(f"  ✅ Test 1 PASS: InternVault vault created and entered (detected from screenshot)")
+                    return dict(ASSERT_VAULT_CREATED)
+                else:
+                    # Not in vault yet, need to create/enter vault
+                    print(f"  → Not in vault yet (screenshot analysis), will proceed with vault creation/entry")
         
         # HARD GATE 1: Test 1 - Check if vault is created and entered
-        if "create" in test_text.lower() and "vault" in test_text.lower() and "internvault" in test_text.lower():
-            # FIRST: Check if we're already in vault (most reliable check)
-            if is_in_vault or current_screen == 'vault_home':
-                # Test 1 only requires vault creation, assert now
-                print(f"  ✅ Test 1 PASS: InternVault vault created and entered (FileActivity detected)")
-                return {
-                    "action": "assert",
-                    "description": "Vault 'InternVault' created and entered successfully"
-                }
-            
-            # SECOND: Check if we just typed InternVault - need to press "Create vault" button or ENTER
+        after_state = None  # (package_activity, current_screen, ui_text) re-read at most once below
+        # (Already-in-vault was settled by HARD GATE 0, so only the post-typing steps remain here)
+        if is_test1:
+            # Check if we just typed InternVault - need to press "Create vault" button or ENTER
             # Check the LAST action to see if we just typed InternVault
             if action_history:
-                last_action = action_history[-1]
-                last_action_type = last_action.get("action", "").lower()
-                last_action_desc = last_action.get("description", "").lower()
-                
                 # Check if LAST action was typing InternVault (regardless of success/failure)
-                just_typed_internvault = (last_action_type == "type" and 
-                                         "internvault" in last_action_desc)
+                just_typed_internvault = history.just_typed_internvault
                 
                 if just_typed_internvault:
-                    # We just typed InternVault - MUST press ENTER or tap Create vault button IMMEDIATELY
-                    # Even if typing failed, we should still try to proceed
-                    # Check if we're still on welcome_setup (need to press ENTER or tap button)
-                    if current_screen == 'welcome_setup' or current_screen == 'vault_selection':
-                        # Check memory for successful patterns (app-aware)
-                        app_key = "duckduckgo" if (target_package and "duckduckgo" in target_package.lower()) else "obsidian"
-                        context = {"app": app_key, "current_screen": current_screen, "test_goal": test_text}
-                        successful_pattern = memory.get_successful_pattern(context)
-                        
-                        # ALWAYS prefer tapping "Create vault" button over ENTER (more reliable)
-                        # Check if button text is in UI
-                        if "create vault" in ui_text_lower or ("create" in ui_text_lower and "vault" in ui_text_lower):
-                            print(f"  → Just typed 'InternVault', tapping 'Create vault' button...")
-                            action = {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Create vault' button"
-                            }
-                            # Record this pattern for learning
-                            memory.update_reward("tap_create_vault", 0.1)  # Positive reward
-                            return action
-                        # Button not visible in UI text - try pressing ENTER
-                        print(f"  → Just typed 'InternVault', pressing ENTER to create vault...")
-                        action = {
-                            "action": "key",
-                            "code": 66,
-                            "description": "Press ENTER after typing vault name"
-                        }
-                        memory.update_reward("key_enter_after_type", 0.1)  # Positive reward
-                        return action
-                    # Not on welcome_setup - might have already created vault, continue to check
+                    # On welcome_setup / vault_selection the setup fast path above already returned the
+                    # Create vault tap or ENTER; anywhere else the vault may already exist, continue to check
                     print(f"  → Just typed 'InternVault', but not on welcome_setup (current: {current_screen}), checking vault status...")
                     pass  # Continue to main planning logic
                 
                 # Also check for multiple typing attempts (loop detection)
-                recent_type_actions = [a for a in action_history[-3:] if 
-                    a.get("action", "").lower() == "type" and "internvault" in a.get("description", "").lower()]
-                
-                if len(recent_type_actions) >= 2 and not just_typed_internvault:
+                if history.recent_type_internvault_count >= 2 and not just_typed_internvault:
                     # We've typed InternVault multiple times but last action wasn't typing
                     # Check if we need to press ENTER or tap button
                     if current_screen == 'welcome_setup' or current_screen == 'vault_selection':
-                        if "internvault" in ui_text_lower:
+                        if "internvault" in ui_keywords:
                             # Name is visible - try tapping Create vault button or pressing ENTER
-                            if "create vault" in ui_text_lower or ("create" in ui_text_lower and "vault" in ui_text_lower):
+                            if "create vault" in ui_keywords or ("create" in ui_keywords and "vault" in ui_keywords):
                                 print(f"  → 'InternVault' typed multiple times, tapping 'Create vault' button...")
-                                return {
-                                    "action": "tap",
-                                    "x": 0,
-                                    "y": 0,
-                                    "description": "Tap 'Create vault' button"
-                                }
+                                return dict(TAP_CREATE_VAULT)
                             print(f"  → 'InternVault' typed multiple times, pressing ENTER...")
-                            return {
-                                "action": "key",
-                                "code": 66,
-                                "description": "Press ENTER after typing vault name"
-                            }
+                            return dict(PRESS_ENTER_VAULT_NAME)
                 
                 # After pressing ENTER or Create vault, check if we're in vault
-                if (last_action_type == "key" and "enter" in last_action_desc) or \
-                   (last_action_type == "tap" and "create vault" in last_action_desc):
+                if (history.last_type == "key" and "enter" in history.last_desc) or \
+                   (history.last_type == "tap" and "create vault" in history.last_desc):
                     
                     # FIRST: Check state-based detection (fast, no LLM call)
-                    pkg_act_after = get_current_package_and_activity()
+                    # Re-read the device (the vision scan above can take seconds) - one ADB round trip per step
+                    if after_state is None:
+                        after_state = refresh_device_state()
+                    pkg_act_after, current_screen_after, ui_text_after = after_state
                     if pkg_act_after:
                         package_after = pkg_act_after.get("package", "")
                         activity_after = pkg_act_after.get("activity", "")
                         if package_after == "md.obsidian" and "FileActivity" in activity_after:
                             print(f"  ✅ Test 1 PASS: InternVault vault created and entered (FileActivity detected)")
-                            return {
-                                "action": "assert",
-                                "description": "Vault 'InternVault' created and entered successfully"
-                            }
+                            return dict(ASSERT_VAULT_CREATED)
                     
-                    current_screen_after = detect_current_screen()
                     if current_screen_after == 'vault_home':
                         print(f"  ✅ Test 1 PASS: InternVault vault created and entered (vault_home detected)")
-                        return {
-                            "action": "assert",
-                            "description": "Vault 'InternVault' created and entered successfully"
-                        }
+                        return dict(ASSERT_VAULT_CREATED)
                     
                     # SECOND: If state unclear, use screenshot verification (only if needed)
-                    ui_text_after = get_ui_text()
-                    ui_text_lower = " ".join([t.lower() for t in ui_text_after])
-                    if "internvault" in ui_text_lower and ("note" in ui_text_lower or "create note" in ui_text_lower):
+                    ui_text_lower = " ".join(ui_text_after).lower()
+                    ui_keywords = _scan_ui_keywords(ui_text_lower)
+                    if "internvault" in ui_keywords and ("note" in ui_keywords or "create note" in ui_keywords):
                         # UI text suggests we're in vault, verify with screenshot
                         print(f"  🔍 Verifying vault entry with screenshot (state suggests in vault)...")
                         
-                        # Read screenshot
-                        img = Image.open(screenshot_path)
-                        img_buffer = io.BytesIO()
-                        img.save(img_buffer, format='PNG')
-                        img_buffer.seek(0)
-                        img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
-                        
-                        # TWO-STEP PROCESS: Vision → Reasoning
-                        # Step 1: Vision API describes screenshot
-                        current_llm_client = get_llm_client()
+                        # Same state as the last verification, or same screen seen before? Reuse the verdict
+                        verify_image_hash = screenshot_ahash(screenshot_path, screenshot_bytes)
+                        verify_state_fp = state_fingerprint(current_screen_after, pkg_act_after, ui_text_after,
+                                                            verify_image_hash)
+                        verify_result = get_state_verdict(verify_state_fp, "vault_verify")
+                        if verify_result is None:
+                            verify_result = get_cached_vault_scan(verify_image_hash, "vault_verify", pkg_act_after)
+                        if verify_result is not None:
+                            print(f"  ♻️  Reusing vault verification for unchanged screen")
+                        else:
+                            # Read screenshot
+                            screenshot_url = encode_screenshot(screenshot_path, screenshot_bytes)
                         
-                        vision_prompt = """Look at this screenshot of the Obsidian mobile app.
-
-Describe what you see in detail:
-- What screen/UI is currently displayed?
-- What buttons, text fields, or UI elements are visible?
-- What text is displayed on screen?
-- What is the current state of the app?
-
-Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
+                            # TWO-STEP PROCESS: Vision → Reasoning
+                            # Step 1: Vision API describes screenshot
+                            current_llm_client = get_llm_client()
                         
-                        try:
-                            print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
-                            vision_response = current_llm_client.call_vision(
-                                messages=[
-                                    {
-                                        "role": "user",
-                                        "content": [
-                                            {"type": "text", "text": vision_prompt},
-                                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
-                                        ]
-                                    }
-                                ],
-                                logger=logger,
-                                temperature=0.1,
-                                max_tokens=500
-                            )
+                            try:
+                                print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
+                                screenshot_description = describe_screenshot(current_llm_client, screenshot_url, logger)
                             
-                            if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
-                                print(f"  ⚠️  Vision API failed, falling back to state check")
-                                raise Exception("Vision API failed")
+                                if not screenshot_description:
+                                    print(f"  ⚠️  Vision API failed, falling back to state check")
+                                    raise Exception("Vision API failed")
                             
-                            screenshot_description = vision_response.choices[0].message.content.strip()
-                            print(f"  ✓ Screenshot analyzed")
+                                print(f"  ✓ Screenshot analyzed")
                             
-                            # Step 2: Reasoning model analyzes description
-                            reasoning_prompt = f"""The user just typed "InternVault" as vault name and pressed ENTER. Based on this screenshot description, are we now INSIDE the InternVault vault?
-
-Screenshot Description:
-{screenshot_description}
+                                # Step 2: Reasoning model analyzes description
+                                reasoning_prompt = VAULT_VERIFY_PROMPT.format(screenshot_description=screenshot_description)
+                            
+                                print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
+                                verify_response = current_llm_client.call_reasoning(
+                                    messages=[
+                                        {
+                                            "role": "user",
+                                            "content": reasoning_prompt
+                                        }
+                                    ],
+                                    logger=logger,
+                                    temperature=0.1,
+                                    max_tokens=VERDICT_MAX_TOKENS,
+                                    response_format=JSON_OBJECT_FORMAT
+                                )
+                            
+                                if verify_response and verify_response.choices and verify_response.choices[0].message.content:
+                                    verify_result = parse_model_json(verify_response.choices[0].message.content)
+                                    if is_vault_verdict(verify_result):
+                                        cache_vault_scan(verify_image_hash, "vault_verify", verify_result, pkg_act_after)
+                                        remember_state_verdict(verify_state_fp, "vault_verify", verify_result)
+                            except Exception as e:
+                                print(f"  ⚠️  Screenshot verification failed: {e}, assuming not in vault yet")
 
-Signs we're IN the vault:
-- File list or note list visible
-- "Create note" or "New note" buttons visible
-- Vault name "InternVault" at top
-- Note files or folders visible
-- NOT in file picker
+                        if isinstance(verify_result, dict):
+                            in_vault_after = verify_result.get("in_vault", False)
+                            reason = verify_result.get("reason", "")
 
-Return ONLY valid JSON:
-- If IN vault: {{"in_vault": true, "reason": "vault UI visible"}}
-- If NOT in vault: {{"in_vault": false, "reason": "..."}}
+                            print(f"  📊 Verification Result: in_vault={in_vault_after}, reason={reason}")
 
-Output ONLY valid JSON, no markdown:"""
-                            
-                            print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
-                            verify_response = current_llm_client.call_reasoning(
-                                messages=[
-                                    {
-                                        "role": "user",
-                                        "content": reasoning_prompt
-                                    }
-                                ],
-                                logger=logger,
-                                temperature=0.1,
-                                max_tokens=100
-                            )
-                            
-                            if verify_response and verify_response.choices and verify_response.choices[0].message.content:
-                                verify_result_text = verify_response.choices[0].message.content.strip()
-                                # Remove markdown if present
-                                if verify_result_text.startswith("```json"):
-                                    verify_result_text = verify_result_text[7:]
-                                if verify_result_text.startswith("```"):
-                                    verify_result_text = verify_result_text[3:]
-                                if verify_result_text.endswith("```"):
-                                    verify_result_text = verify_result_text[:-3]
-                                verify_result_text = verify_result_text.strip()
-                                
-                                verify_result = json.loads(verify_result_text)
-                                in_vault_after = verify_result.get("in_vault", False)
-                                reason = verify_result.get("reason", "")
-                                
-                                print(f"  📊 Verification Result: in_vault={in_vault_after}, reason={reason}")
-                                
-                                if in_vault_after:
-                                    print(f"  ✅ Test 1 PASS: InternVault vault created and entered (verified from screenshot)")
-                                    return {
-                                        "action": "assert",
-                                        "description": "Vault 'InternVault' created and entered successfully"
-                                    }
-                        except Exception as e:
-                            print(f"  ⚠️  Screenshot verification failed: {e}, assuming not in vault yet")
+                            if in_vault_after:
+                                print(f"  ✅ Test 1 PASS: InternVault vault created and entered (verified from screenshot)")
+                                return dict(ASSERT_VAULT_CREATED)
                 
                 # After tapping InternVault or USE THIS FOLDER, check if we're in vault
-                # Make sure last_action_type and last_action_desc are defined
                 if action_history:
-                    last_action = action_history[-1]
-                    last_action_type = last_action.get("action", "").lower()
-                    last_action_desc = last_action.get("description", "").lower()
-                    
-                    if last_action_type == "tap" and ("internvault" in last_action_desc or "use this folder" in last_action_desc):
-                        # Re-check package/activity after tap
-                        pkg_act_after = get_current_package_and_activity()
+                    if history.last_type == "tap" and ("internvault" in history.last_desc or "use this folder" in history.last_desc):
+                        # Re-check package/activity after tap (reuses this step's refresh if there was one)
+                        if after_state is None:
+                            after_state = refresh_device_state()
+                        pkg_act_after, current_screen_after, _ = after_state
                         if pkg_act_after:
                             package_after = pkg_act_after.get("package", "")
                             activity_after = pkg_act_after.get("activity", "")
                             if package_after == "md.obsidian" and "FileActivity" in activity_after:
                                 print(f"  ✅ Test 1 PASS: InternVault vault entered (FileActivity after tap)")
-                                return {
-                                    "action": "assert",
-                                    "description": "Vault 'InternVault' created and entered successfully"
-                                }
+                                return dict(ASSERT_VAULT_CREATED)
                         
                         # Check current screen
-                        current_screen_after = detect_current_screen()
                         if current_screen_after == 'vault_home':
                             print(f"  ✅ Test 1 PASS: InternVault vault entered (vault_home after tap)")
-                            return {
-                                "action": "assert",
-                                "description": "Vault 'InternVault' created and entered successfully"
-                            }
+                            return dict(ASSERT_VAULT_CREATED)
         
         # HARD GATE 2: Test 2 - If Test 1 passed, trust we're in vault and go directly to note creation
         test2_in_vault = None  # Initialize variable
-        if ("note" in test_text.lower() and "meeting notes" in test_text.lower()) or \
-           ("create" in test_text.lower() and "note" in test_text.lower()):
+        if goal.is_note_goal:
             # CRITICAL: If Test 1 passed, we're definitely in vault - skip all checks and go directly to note creation
             if previous_test_passed:
                 print(f"  ✓ Test 1 passed - assuming we're in InternVault vault, proceeding directly to note creation")
@@ -1553,51 +2232,29 @@ Output ONLY valid JSON, no markdown:"""
                 # DIRECTLY proceed to note creation - no vault checks needed
                 # Check if we're already in note editor
                 if current_screen == 'note_editor':
-                    # Normalize UI text for checking
-                    def normalize_text(s):
-                        return ''.join(c.lower() for c in s if c.isalnum())
-                    
-                    ui_blob = normalize_text(" ".join(ui_text))
-                    has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-                    has_daily_standup = "dailystandup" in ui_blob
+                    has_meeting_notes = "meetingnote" in blob_keywords
+                    has_daily_standup = "dailystandup" in blob_keywords
                     
                     # Check if both are already typed
                     if has_meeting_notes and has_daily_standup:
                         print(f"  ✅ Test 2 PASS: Note 'Meeting Notes' with 'Daily Standup' already created!")
-                        return {
-                            "action": "assert",
-                            "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                        }
+                        return dict(ASSERT_NOTE_CREATED)
                     # Check if only title is typed
                     elif has_meeting_notes and not has_daily_standup:
                         # Title typed, focus body and type it (NO ENTER - use focus instead)
                         print(f"  → Note title 'Meeting Notes' typed, focusing body field and typing 'Daily Standup'...")
-                        return {
-                            "action": "focus",
-                            "target": "body",
-                            "description": "Focus note body editor"
-                        }
+                        return dict(FOCUS_NOTE_BODY)
                     # Title not typed yet - type it first with target="title"
                     else:
-                        print(f"  → In note editor, typing title 'Meeting Notes' (with 's')...")
-                        return {
-                            "action": "type",
-                            "text": "Meeting Notes",
-                            "target": "title",
-                            "description": "Type note title 'Meeting Notes' (with 's' at the end)"
-                        }
+                        print(f"  → In note editor, typing title 'Meeting Notes' (with 's')...")
+                        return dict(TYPE_NOTE_TITLE)
                 
                 # Not in note editor - need to create note first
                 # Check if we're in vault home (should be, since Test 1 passed)
-                if is_in_vault or current_screen == 'vault_home' or "create" in ui_text_lower and "note" in ui_text_lower:
+                if is_in_vault or current_screen == 'vault_home' or "create" in ui_keywords and "note" in ui_keywords:
                     # Look for "Create note" or "New note" button
                     print(f"  → In vault home, tapping 'Create note' or 'New note' button...")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap 'Create note' or 'New note' button to create new note"
-                    }
+                    return dict(TAP_CREATE_NOTE)
                 
                 # If we're here, we're in vault but might need to wait or check UI
                 # Continue to main planning logic which will handle it
@@ -1615,170 +2272,101 @@ Output ONLY valid JSON, no markdown:"""
                     test2_in_vault = True
                     # Go directly to note creation logic (same as above)
                     if current_screen == 'note_editor':
-                        if "meeting notes" in ui_text_lower and "daily standup" in ui_text_lower:
+                        if "meeting notes" in ui_keywords and "daily standup" in ui_keywords:
                             print(f"  ✅ Test 2 PASS: Note 'Meeting Notes' with 'Daily Standup' already created!")
-                            return {
-                                "action": "assert",
-                                "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                            }
+                            return dict(ASSERT_NOTE_CREATED)
                         else:
-                            # Normalize text for checking
-                            def normalize_text(s):
-                                return ''.join(c.lower() for c in s if c.isalnum())
-                            
-                            ui_blob = normalize_text(" ".join(ui_text))
-                            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
+                            has_meeting_notes = "meetingnote" in blob_keywords
                             
                             if has_meeting_notes:
                                 # Title typed, focus body and type it (NO ENTER - use focus instead)
                                 print(f"  → Note title 'Meeting Notes' typed, focusing body field and typing 'Daily Standup'...")
-                                return {
-                                    "action": "focus",
-                                    "target": "body",
-                                    "description": "Focus note body editor"
-                                }
+                                return dict(FOCUS_NOTE_BODY)
                             else:
                                 # Title not typed - type "Meeting Notes" (with 's' at the end)
                                 print(f"  → In note editor, typing title 'Meeting Notes' first (with 's')...")
-                                return {
-                                    "action": "type",
-                                    "text": "Meeting Notes",
-                                    "target": "title",
-                                    "description": "Type note title 'Meeting Notes' (with 's' at the end)"
-                                }
+                                return dict(TYPE_NOTE_TITLE)
                     # Not in note editor - tap create note button
-                    if is_in_vault or current_screen == 'vault_home' or "create" in ui_text_lower and "note" in ui_text_lower:
+                    if is_in_vault or current_screen == 'vault_home' or "create" in ui_keywords and "note" in ui_keywords:
                         print(f"  → In vault home, tapping 'Create note' or 'New note' button...")
-                        return {
-                            "action": "tap",
-                            "x": 0,
-                            "y": 0,
-                            "description": "Tap 'Create note' or 'New note' button to create new note"
-                        }
+                        return dict(TAP_CREATE_NOTE)
                     pass
                 else:
                     print(f"  🔍 Checking screenshot to see if already in InternVault vault for Test 2...")
                 
-                # Read screenshot
-                img = Image.open(screenshot_path)
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-                img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
-                
-                # TWO-STEP PROCESS: Vision → Reasoning
-                # Step 1: Vision API describes screenshot
-                current_llm_client = get_llm_client()
+                # Same state as the last check, or same screen seen before? Reuse the verdict
+                test2_image_hash = screenshot_ahash(screenshot_path, screenshot_bytes)
+                test2_state_fp = state_fingerprint(current_screen, pkg_act, ui_text, test2_image_hash)
+                test2_check_result = get_state_verdict(test2_state_fp, "test2_vault_check")
+                if test2_check_result is None:
+                    test2_check_result = get_cached_vault_scan(test2_image_hash, "test2_vault_check", pkg_act)
+                if test2_check_result is not None:
+                    print(f"  ♻️  Reusing Test 2 vault check for unchanged screen")
+                else:
+                    # Read screenshot
+                    screenshot_url = encode_screenshot(screenshot_path, screenshot_bytes)
                 
-                vision_prompt = """Look at this screenshot of the Obsidian mobile app.
-
-Describe what you see in detail:
-- What screen/UI is currently displayed?
-- What buttons, text fields, or UI elements are visible?
-- What text is displayed on screen?
-- What is the current state of the app?
-
-Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
+                    # TWO-STEP PROCESS: Vision → Reasoning
+                    # Step 1: Vision API describes screenshot
+                    current_llm_client = get_llm_client()
                 
-                try:
-                    print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
-                    vision_response = current_llm_client.call_vision(
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": vision_prompt},
-                                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_data}"}}
-                                ]
-                            }
-                        ],
-                        logger=logger,
-                        temperature=0.1,
-                        max_tokens=500
-                    )
+                    try:
+                        print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
+                        screenshot_description = describe_screenshot(current_llm_client, screenshot_url, logger)
                     
-                    if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
-                        print(f"  ⚠️  Vision API failed, assuming not in vault")
-                        test2_in_vault = False
-                        raise Exception("Vision API failed")
+                        if not screenshot_description:
+                            print(f"  ⚠️  Vision API failed, assuming not in vault")
+                            test2_in_vault = False
+                            raise Exception("Vision API failed")
                     
-                    screenshot_description = vision_response.choices[0].message.content.strip()
-                    print(f"  ✓ Screenshot analyzed")
+                        print(f"  ✓ Screenshot analyzed")
                     
-                    # Step 2: Reasoning model analyzes description
-                    reasoning_prompt = f"""Test 2 needs to create a note in the InternVault vault. Based on this screenshot description, are we currently INSIDE the InternVault vault?
-
-Screenshot Description:
-{screenshot_description}
-
-Signs we're IN the vault:
-- File list or note list visible
-- "Create note" or "New note" buttons visible
-- Vault name "InternVault" at top
-- Note files or folders visible
-- NOT in file picker or welcome screen
-
-Signs we're NOT in the vault:
-- "Create vault" or "Get started" buttons
-- File picker visible
-- "Use this folder" button
-- Welcome/setup screen
-
-Return ONLY valid JSON:
-- If IN InternVault vault: {{"in_vault": true, "reason": "vault UI visible"}}
-- If NOT in vault: {{"in_vault": false, "reason": "..."}}
-
-Output ONLY valid JSON, no markdown:"""
+                        # Step 2: Reasoning model analyzes description
+                        reasoning_prompt = TEST2_VAULT_CHECK_PROMPT.format(screenshot_description=screenshot_description)
                     
-                    print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
-                    test2_check_response = current_llm_client.call_reasoning(
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": reasoning_prompt
-                            }
-                        ],
-                        logger=logger,
-                        temperature=0.1,
-                        max_tokens=100
-                    )
+                        print(f"  🧠 Step 2: Analyzing with reasoning model ({current_llm_client.reasoning_model})...")
+                        test2_check_response = current_llm_client.call_reasoning(
+                            messages=[
+                                {
+                                    "role": "user",
+                                    "content": reasoning_prompt
+                                }
+                            ],
+                            logger=logger,
+                            temperature=0.1,
+                            max_tokens=VERDICT_MAX_TOKENS,
+                            response_format=JSON_OBJECT_FORMAT
+                        )
                     
-                    if test2_check_response and test2_check_response.choices and test2_check_response.choices[0].message.content:
-                        test2_check_text = test2_check_response.choices[0].message.content.strip()
-                        # Remove markdown if present
-                        if test2_check_text.startswith("```json"):
-                            test2_check_text = test2_check_text[7:]
-                        if test2_check_text.startswith("```"):
-                            test2_check_text = test2_check_text[3:]
-                        if test2_check_text.endswith("```"):
-                            test2_check_text = test2_check_text[:-3]
-                        test2_check_text = test2_check_text.strip()
-                        
-                        test2_check_result = json.loads(test2_check_text)
-                        test2_in_vault = test2_check_result.get("in_vault", False)
-                        reason = test2_check_result.get("reason", "")
+                        if test2_check_response and test2_check_response.choices and test2_check_response.choices[0].message.content:
+                            test2_check_result = parse_model_json(test2_check_response.choices[0].message.content)
+                            if is_vault_verdict(test2_check_result):
+                                cache_vault_scan(test2_image_hash, "test2_vault_check", test2_check_result, pkg_act)
+                                remember_state_verdict(test2_state_fp, "test2_vault_check", test2_check_result)
+                    except Exception as e:
+                        print(f"  ⚠️  Screenshot check failed: {e}, assuming not in vault")
+                        test2_in_vault = False
+                
+                if isinstance(test2_check_result, dict):
+                    test2_in_vault = test2_check_result.get("in_vault", False)
+                    reason = test2_check_result.get("reason", "")
                         
-                        print(f"  📊 Test 2 Screenshot Check: in_vault={test2_in_vault}, reason={reason}")
+                    print(f"  📊 Test 2 Screenshot Check: in_vault={test2_in_vault}, reason={reason}")
                         
-                        if test2_in_vault:
-                            print(f"  ✓ Already in InternVault vault (screenshot confirmed), proceeding with note creation (DO NOT enter vault again)")
-                            # Don't try to enter vault again - proceed with note creation
-                            pass
-                        else:
-                            # Not in vault, need to enter it
-                            print(f"  → Not in vault yet (screenshot confirmed), will enter InternVault first")
-                except Exception as e:
-                    print(f"  ⚠️  Screenshot check failed: {e}, assuming not in vault")
-                    test2_in_vault = False
+                    if test2_in_vault:
+                        print(f"  ✓ Already in InternVault vault (screenshot confirmed), proceeding with note creation (DO NOT enter vault again)")
+                        # Don't try to enter vault again - proceed with note creation
+                        pass
+                    else:
+                        # Not in vault, need to enter it
+                        print(f"  → Not in vault yet (screenshot confirmed), will enter InternVault first")
             
             # If we're not in vault but InternVault exists, enter it (max 1 attempt to avoid loops)
             # Only if screenshot check said we're not in vault
-            if test2_in_vault is False and any('internvault' in text.lower() for text in ui_text) and current_screen in ['welcome_setup', 'vault_selection']:
+            if test2_in_vault is False and "internvault" in ui_keywords and current_screen in ['welcome_setup', 'vault_selection']:
                 # Check if we've already tried entering
-                recent_enter_attempts = sum(1 for a in action_history[-5:] if 
-                    "internvault" in a.get("description", "").lower() or 
-                    "enter vault" in a.get("description", "").lower() or
-                    "use this folder" in a.get("description", "").lower())
+                recent_enter_attempts = sum(1 for d in history.recent_descs() if 
+                    "internvault" in d or "enter vault" in d or "use this folder" in d)
                 if recent_enter_attempts == 0:  # Only try once
                     print(f"  ✓ Found InternVault in UI, tapping to enter existing vault for Test 2")
                     return {
@@ -1797,32 +2385,27 @@ Output ONLY valid JSON, no markdown:"""
             # We're already in vault, proceed with test goal (create note, etc.)
             # Don't try to enter vault again
             pass
-        elif current_screen == 'unknown' and any('internvault' in text.lower() for text in ui_text):
+        elif current_screen == 'unknown' and "internvault" in ui_keywords:
             # Screen detection might be wrong, but InternVault is visible - might be in vault_home
             # Check if test goal is to create note - if so, try to proceed with note creation
-            if "note" in test_text.lower() or ("create" in test_text.lower() and "note" in test_text.lower()):
-                recent_enter_attempts = sum(1 for a in action_history[-3:] if "internvault" in a.get("description", "").lower() or "enter vault" in a.get("description", "").lower())
+            if "note" in test_keywords:
+                recent_enter_attempts = sum(1 for d in history.recent_descs(3) if "internvault" in d or "enter vault" in d)
                 if recent_enter_attempts >= 2:
                     # We've tried entering multiple times, assume we're in vault and proceed
                     print(f"  ⚠️  Multiple enter attempts, assuming we're in vault - proceeding with note creation")
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap to create new note (assuming we're in vault home)"
-                    }
+                    return dict(TAP_CREATE_NOTE_FROM_VAULT_HOME)
         
         # This logic is now handled above in HARD GATE 2
         
         # Check if we're stuck creating vaults when we should be entering existing one
         if len(action_history) >= 2:
-            recent_actions = [a.get("description", "").lower() for a in action_history[-5:]]
+            recent_actions = history.recent_descs()
             vault_creation_count = sum(1 for a in recent_actions if "create vault" in a or ("type" in a and "vault" in a and "name" in a))
             enter_vault_count = sum(1 for a in recent_actions if "use this folder" in a or "enter vault" in a or "enter existing" in a or "internvault" in a)
             
             # If we've created/typed vault multiple times but keep going back to welcome_setup
             # AND we haven't successfully entered a vault yet
-            if vault_creation_count >= 2 and enter_vault_count == 0 and android_state.get('current_screen') in ['welcome_setup', 'vault_selection']:
+            if vault_creation_count >= 2 and enter_vault_count == 0 and current_screen in ['welcome_setup', 'vault_selection']:
                 # Vault already exists, just enter it - find "USE THIS FOLDER" or vault name
                 print(f"  ⚠️  Detected vault creation loop ({vault_creation_count} times), entering existing vault instead")
                 return {
@@ -1832,40 +2415,13 @@ Output ONLY valid JSON, no markdown:"""
                     "description": "Tap InternVault to enter existing vault (vault already created, stop creating new ones)"
                 }
         
-        # CRITICAL: Check if Test 2 is complete - both "Meeting Notes" and "Daily Standup" are present
-        # Do this BEFORE any other checks to prevent loops
-        # Use normalized blob to handle concatenation and truncation
-        if "meeting notes" in test_text.lower() and "daily standup" in test_text.lower():
-            # Normalize text for checking (remove whitespace, punctuation, lowercase)
-            def normalize_text(s):
-                return ''.join(c.lower() for c in s if c.isalnum())
-            
-            ui_blob = normalize_text(" ".join(ui_text))
-            
-            # Check for both substrings (handle truncation: "meetingnote" or "meetingnotes")
-            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-            has_daily_standup = "dailystandup" in ui_blob
-            
-            # Require that we're in note_editor and both are present
-            if current_screen == 'note_editor' and has_meeting_notes and has_daily_standup:
-                print(f"  ✅ Test 2 PASS: Both 'Meeting Notes' and 'Daily Standup' are present in note!")
-                return {
-                    "action": "assert",
-                    "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                }
-        
         # Check if we just focused body field - now need to type "Daily Standup"
         # Do this BEFORE loop detection to prevent loop from blocking typing
-        if action_history and ("meeting notes" in test_text.lower() and "daily standup" in test_text.lower()):
+        if action_history and is_test2:
             last_action = action_history[-1]
             
-            # Normalize text for checking
-            def normalize_text(s):
-                return ''.join(c.lower() for c in s if c.isalnum())
-            
-            ui_blob = normalize_text(" ".join(ui_text))
-            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-            has_daily_standup = "dailystandup" in ui_blob
+            has_meeting_notes = "meetingnote" in blob_keywords
+            has_daily_standup = "dailystandup" in blob_keywords
             
             # Check if we just focused body field
             if (last_action.get("action") == "focus" and 
@@ -1873,12 +2429,7 @@ Output ONLY valid JSON, no markdown:"""
                 # We just focused body, now type "Daily Standup"
                 if has_meeting_notes and not has_daily_standup:
                     print(f"  → Just focused body field, now typing 'Daily Standup'...")
-                    return {
-                        "action": "type",
-                        "text": "Daily Standup",
-                        "target": "body",
-                        "description": "Type note body text 'Daily Standup'"
-                    }
+                    return dict(TYPE_NOTE_BODY)
             
             # Also check if we're in note editor and have Meeting Notes but not Daily Standup
             if current_screen == 'note_editor' and has_meeting_notes and not has_daily_standup:
@@ -1887,151 +2438,122 @@ Output ONLY valid JSON, no markdown:"""
                     if last_action.get("target") != "body":
                         # Need to focus body first
                         print(f"  → In note editor with 'Meeting Notes' but not 'Daily Standup', focusing body...")
-                        return {
-                            "action": "focus",
-                            "target": "body",
-                            "description": "Focus note body editor"
-                        }
+                        return dict(FOCUS_NOTE_BODY)
                     else:
                         # Already focused body, type it
                         print(f"  → Body field focused, typing 'Daily Standup'...")
-                        return {
-                            "action": "type",
-                            "text": "Daily Standup",
-                            "target": "body",
-                            "description": "Type note body text 'Daily Standup'"
-                        }
-        
-        # CRITICAL: Check completion BEFORE loop detection (completion check must run first)
-        if "meeting notes" in test_text.lower() and "daily standup" in test_text.lower():
-            def normalize_text(s):
-                return ''.join(c.lower() for c in s if c.isalnum())
-            
-            ui_blob = normalize_text(" ".join(ui_text))
-            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-            has_daily_standup = "dailystandup" in ui_blob
-            
-            if current_screen == 'note_editor' and has_meeting_notes and has_daily_standup:
-                print(f"  ✅ Test 2 PASS: Both 'Meeting Notes' and 'Daily Standup' are present - test complete!")
-                return {
-                    "action": "assert",
-                    "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                }
+                        return dict(TYPE_NOTE_BODY)
         
         # Check if we're stuck (same action repeated)
         # Only do this AFTER completion check
-        if len(action_history) >= 3:
-            last_3_actions = [a.get("description", "") for a in action_history[-3:]]
-            if len(set(last_3_actions)) == 1:
-                action_desc = last_3_actions[0]
-                # Special handling for permission dialogs - if we tapped ALLOW multiple times, try BACK
-                if "allow" in action_desc.lower() or "permission" in action_desc.lower():
-                    return {
-                        "action": "key",
-                        "code": 4,
-                        "description": "Press BACK to dismiss permission dialog"
-                    }
-                # Special handling for storage selection loop - if we tapped storage multiple times, assume it's selected
-                if "storage" in action_desc.lower() and ("app" in action_desc.lower() or "internal" in action_desc.lower()):
-                    print(f"  ⚠️  Storage selection tapped {len(last_3_actions)} times, assuming selected - moving on...")
-                    # Check if we're on vault name input screen
-                    if android_state.get('has_edittext', False) or current_screen == 'vault_name_input':
-                        # Check if name is already typed
-                        if "internvault" in ui_text_lower:
-                            # Name typed - tap Create vault button
-                            return {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Create vault' button"
-                            }
-                        # Name not typed - type it
-                        return {
-                            "action": "type",
-                            "text": "InternVault",
-                            "description": "Type vault name 'InternVault'"
-                        }
-                    # Not on input screen - try BACK
+        if history.repeated_keywords is not None:
+            action_desc = action_history[-1].get("description", "")
+            loop_keywords = history.repeated_keywords
+            # Permission-dialog loops are handled at the top of plan_next_action (before ADB)
+            # Special handling for storage selection loop - if we tapped storage multiple times, assume it's selected
+            if "storage" in loop_keywords and ("app" in loop_keywords or "internal" in loop_keywords):
+                print(f"  ⚠️  Storage selection tapped 3 times, assuming selected - moving on...")
+                # Check if we're on vault name input screen
+                if android_state.get('has_edittext', False) or current_screen == 'vault_name_input':
+                    # Check if name is already typed
+                    if "internvault" in ui_keywords:
+                        # Name typed - tap Create vault button
+                        return dict(TAP_CREATE_VAULT)
+                    # Name not typed - type it
+                    return dict(TYPE_INTERNVAULT)
+                # Not on input screen - try BACK
+                return {
+                    "action": "key",
+                    "code": 4,
+                    "description": "Press BACK to dismiss storage selection (already selected)"
+                }
+            # Special handling for typing vault name loop - if we typed it multiple times, tap Create vault
+            if "type" in loop_keywords and "internvault" in loop_keywords:
+                print(f"  ⚠️  Vault name typed 3 times, checking if 'Create vault' button is visible...")
+                # Check if name is in UI
+                if "internvault" in ui_keywords:
+                    # Name is visible - look for Create vault button
+                    if "create vault" in ui_keywords or ("create" in ui_keywords and "vault" in ui_keywords):
+                        return dict(TAP_CREATE_VAULT)
+                    # No create button - press ENTER
                     return {
                         "action": "key",
-                        "code": 4,
-                        "description": "Press BACK to dismiss storage selection (already selected)"
-                    }
-                # Special handling for typing vault name loop - if we typed it multiple times, tap Create vault
-                if "type" in action_desc.lower() and "internvault" in action_desc.lower():
-                    print(f"  ⚠️  Vault name typed {len(last_3_actions)} times, checking if 'Create vault' button is visible...")
-                    # Check if name is in UI
-                    if "internvault" in ui_text_lower:
-                        # Name is visible - look for Create vault button
-                        if "create vault" in ui_text_lower or ("create" in ui_text_lower and "vault" in ui_text_lower):
-                            return {
-                                "action": "tap",
-                                "x": 0,
-                                "y": 0,
-                                "description": "Tap 'Create vault' button"
-                            }
-                        # No create button - press ENTER
-                        return {
-                            "action": "key",
-                            "code": 66,
-                            "description": "Press ENTER to create vault"
-                        }
-                # Special handling for vault creation loop
-                if "create vault" in action_desc.lower() or ("type" in action_desc.lower() and "vault" in action_desc.lower()):
-                    # Try to find and tap "USE THIS FOLDER" or vault name to enter existing vault
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap InternVault to enter existing vault (stop creating new vaults)"
-                    }
-                # Special handling for "USE THIS FOLDER" loop - try tapping vault name instead
-                if "use this folder" in action_desc.lower():
-                    return {
-                        "action": "tap",
-                        "x": 0,
-                        "y": 0,
-                        "description": "Tap InternVault vault name to enter (USE THIS FOLDER not working)"
-                    }
-                # Special handling for "enter vault" or "InternVault" loop - assume we're in vault and proceed
-                if "enter vault" in action_desc.lower() or ("internvault" in action_desc.lower() and "enter" in action_desc.lower()):
-                    # If test goal is to create note, assume we're in vault and proceed
-                    if "note" in test_text.lower() or ("create" in test_text.lower() and "note" in test_text.lower()):
-                        print(f"  ⚠️  Enter vault loop detected, assuming we're in vault - proceeding with note creation")
-                        return {
-                            "action": "tap",
-                            "x": 0,
-                            "y": 0,
-                            "description": "Tap to create new note (assuming we're in vault home)"
-                        }
-                    return {
-                        "action": "wait",
-                        "seconds": 2,
-                        "description": "Wait for vault to load, then check if we're in vault home"
+                        "code": 66,
+                        "description": "Press ENTER to create vault"
                     }
+            # Special handling for vault creation loop
+            if "create vault" in loop_keywords or ("type" in loop_keywords and "vault" in loop_keywords):
+                # Try to find and tap "USE THIS FOLDER" or vault name to enter existing vault
+                return {
+                    "action": "tap",
+                    "x": 0,
+                    "y": 0,
+                    "description": "Tap InternVault to enter existing vault (stop creating new vaults)"
+                }
+            # Special handling for "USE THIS FOLDER" loop - try tapping vault name instead
+            if "use this folder" in loop_keywords:
+                return {
+                    "action": "tap",
+                    "x": 0,
+                    "y": 0,
+                    "description": "Tap InternVault vault name to enter (USE THIS FOLDER not working)"
+                }
+            # Special handling for "enter vault" or "InternVault" loop - assume we're in vault and proceed
+            if "enter vault" in loop_keywords or ("internvault" in loop_keywords and "enter" in loop_keywords):
+                # If test goal is to create note, assume we're in vault and proceed
+                if "note" in test_keywords:
+                    print(f"  ⚠️  Enter vault loop detected, assuming we're in vault - proceeding with note creation")
+                    return dict(TAP_CREATE_NOTE_FROM_VAULT_HOME)
+                return {
+                    "action": "wait",
+                    "seconds": 2,
+                    "description": "Wait for vault to load, then check if we're in vault home"
+                }
+            # Same action but the page kept changing (e.g. scrolling a list) is progress, not a loop.
+            # It is still a loop when most of those actions (and this step) saw the same page, so
+            # one odd frame (a toast, a half-drawn transition) does not hide a stuck screen
+            pages_seen = history.repeated_pages + Counter([page_fingerprint(current_screen, ui_text)])
+            if pages_seen.most_common(1)[0][1] * 2 <= sum(pages_seen.values()):
+                print(f"  → '{action_desc}' repeated 3 times but the page is still changing, continuing...")
+            else:
                 return {
                     "action": "FAIL",
-                    "reason": f"Stuck in loop: Repeated action '{action_desc}' 3 times. Screen: {android_state.get('current_screen')}"
+                    "reason": f"Stuck in loop: Repeated action '{action_desc}' 3 times. Screen: {current_screen}"
                 }
         
-        # Read screenshot
-        img = Image.open(screenshot_path)
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+        # ===== PERSISTENT DECISION CACHE (skip vision + reasoning on a known screen state) =====
+        decision_key = None
+        if ENABLE_DECISION_CACHE and not DISABLE_RL_FOR_BENCHMARKING:
+            last_action = action_history[-1] if action_history else None
+            # A cached decision that failed to execute is dropped so the model gets another go
+            if last_action and last_action.get("_execution_failed") and last_action.get("_decision_key"):
+                decision_cache.invalidate(last_action["_decision_key"])
+            decision_key = DecisionCache.make_key(test_text, current_screen, ui_text,
+                                                  android_state.get('has_edittext', False), pkg_act, last_action)
+            cached_action = decision_cache.get(decision_key)
+            if cached_action and "action" in cached_action:
+                print(f"  💾 Using cached decision for this screen state - skipping OpenAI calls")
+                print(f"  → Cached action: {cached_action.get('action')} - {cached_action.get('description', '')}")
+                cached_action["_android_state"] = android_state
+                cached_action["_from_decision_cache"] = True
+                cached_action["_decision_key"] = decision_key
+                return cached_action
+        
+        # ===== UNCHANGED FRAME AFTER A PLANNED WAIT (NO API CALL) =====
+        # The model asked to wait and the screenshot still looks the same: keep waiting
+        unchanged_wait = reuse_unchanged_wait(action_history[-1] if action_history else None,
+                                              current_screen, screenshot_path, screenshot_bytes)
+        if unchanged_wait:
+            print(f"  ⏳ Screen unchanged since the planned wait, waiting again - skipping OpenAI calls")
+            unchanged_wait["_android_state"] = android_state
+            return unchanged_wait
+        
+        # Encode the screenshot (downscaled WebP data URL) on the idle state worker while the
+        # history, memory hints and prompt are built below; collected right before the vision call
+        encode_future = _state_executor.submit(encode_screenshot, screenshot_path, screenshot_bytes)
         
         # Build action history string with execution status
-        history_str = ""
-        if action_history:
-            history_str = "\nPrevious actions:\n"
-            for i, action in enumerate(action_history[-5:]):  # Last 5 actions
-                status_marker = ""
-                if action.get("_execution_failed"):
-                    status_marker = " [FAILED]"
-                elif action.get("_execution_status") == "success":
-                    status_marker = " [SUCCESS]"
-                history_str += f"  {i+1}. {action.get('action', 'unknown')}: {action.get('description', '')}{status_marker}\n"
+        history_str = format_action_history(action_history)
         
         # Check memory for failed patterns to avoid (only if RL is enabled)
         should_avoid = False
@@ -2075,218 +2597,44 @@ Output ONLY valid JSON, no markdown:"""
         except:
             pass
         
-        # CRITICAL: Check if Test 2 is complete - both "Meeting Notes" and "Daily Standup" are present
-        # Do this check before main planning to catch completion and prevent loops
-        # Use normalized blob to handle concatenation and truncation
-        if "meeting notes" in test_text.lower() and "daily standup" in test_text.lower():
-            # Normalize text for checking
-            def normalize_text(s):
-                return ''.join(c.lower() for c in s if c.isalnum())
-            
-            ui_blob = normalize_text(" ".join(ui_text))
-            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-            has_daily_standup = "dailystandup" in ui_blob
-            
-            # Require that we're in note_editor and both are present
-            if current_screen == 'note_editor' and has_meeting_notes and has_daily_standup:
-                print(f"  ✅ Test 2 PASS: Both 'Meeting Notes' and 'Daily Standup' are present in note!")
-                return {
-                    "action": "assert",
-                    "description": "Note 'Meeting Notes' with 'Daily Standup' text created successfully"
-                }
-        
         # Check if we just focused body field - now need to type "Daily Standup"
         # This check is also done earlier before loop detection, but keep it here as backup
-        if action_history and ("meeting notes" in test_text.lower() and "daily standup" in test_text.lower()):
+        if action_history and is_test2:
             last_action = action_history[-1]
             
-            # Normalize text for checking
-            def normalize_text(s):
-                return ''.join(c.lower() for c in s if c.isalnum())
-            
-            ui_blob = normalize_text(" ".join(ui_text))
-            has_meeting_notes = "meetingnotes" in ui_blob or "meetingnote" in ui_blob
-            has_daily_standup = "dailystandup" in ui_blob
+            has_meeting_notes = "meetingnote" in blob_keywords
+            has_daily_standup = "dailystandup" in blob_keywords
             
             # Check if last action was focus body
             if (last_action.get("action") == "focus" and 
                 last_action.get("target") == "body" and
                 has_meeting_notes and not has_daily_standup):
                 print(f"  → Just focused body field, now typing 'Daily Standup'...")
-                return {
-                    "action": "type",
-                    "text": "Daily Standup",
-                    "target": "body",
-                    "description": "Type note body text 'Daily Standup'"
-                }
+                return dict(TYPE_NOTE_BODY)
             
             # Check if we have "Untitled" in UI - need to clear it by typing directly
-            ui_blob_lower = ui_blob.lower()
-            has_untitled = "untitled" in ui_blob_lower
+            has_untitled = "untitled" in blob_keywords
             
             # Check if we need to type "Meeting Notes" first (if "Untitled" is present)
-            has_meeting_notes = "meetingnotes" in ui_blob_lower or "meetingnote" in ui_blob_lower
+            has_meeting_notes = "meetingnote" in blob_keywords
             
             if has_untitled and not has_meeting_notes:
                 # CRITICAL: "Untitled" is in the title - clear it and type "Meeting Notes" first
                 # The executor will automatically clear "Untitled" before typing (Ctrl+A + DEL)
                 print(f"  → Found 'Untitled' in title, clearing it and typing 'Meeting Notes'...")
-                return {
-                    "action": "type",
-                    "text": "Meeting Notes",
-                    "target": "title",
-                    "description": "Clear 'Untitled' and type note title 'Meeting Notes'"
-                }
+                return dict(CLEAR_UNTITLED_TYPE_TITLE)
             
             # Check if we have "Meeting Notes" in UI but not "Daily Standup"
             if has_meeting_notes and not has_daily_standup:
                 # Need to focus body and type it
                 # Check if we're in note editor or if last action was typing Meeting Notes
                 if (current_screen == 'note_editor' or 
-                    (last_action.get("action") == "type" and "meeting notes" in last_action.get("description", "").lower())):
+                    (last_action.get("action") == "type" and "meeting notes" in history.last_desc)):
                     print(f"  → Have 'Meeting Notes' but not 'Daily Standup', focusing body field FIRST...")
-                    return {
-                        "action": "focus",
-                        "target": "body",
-                        "description": "Focus note body editor"
-                    }
+                    return dict(FOCUS_NOTE_BODY)
         
         # Build Android state string with structured XML info
-        state_str = f"""
-Android State Information:
-- Current Screen: {android_state.get('current_screen', 'unknown')}
-- Has Input Field (EditText): {android_state.get('has_edittext', False)}
-- Visible UI Text: {', '.join(android_state.get('ui_text', [])[:10])}
-"""
-        
-        # Add structured input fields info
-        input_fields = android_state.get('input_fields', [])
-        if input_fields:
-            state_str += "\nInput Fields Detected:\n"
-            for i, field in enumerate(input_fields[:3], 1):  # Limit to first 3
-                hint = field.get('hint', 'Input field')
-                center = field.get('center', '')
-                state_str += f"  {i}. {hint}"
-                if center:
-                    state_str += f" (center: {center})"
-                state_str += "\n"
-        
-        # Add structured buttons info
-        buttons = android_state.get('buttons', [])
-        if buttons:
-            state_str += "\nButtons Detected:\n"
-            for i, button in enumerate(buttons[:5], 1):  # Limit to first 5
-                text = button.get('text', 'Button')
-                center = button.get('center', '')
-                state_str += f"  {i}. \"{text}\""
-                if center:
-                    state_str += f" (center: {center})"
-                state_str += "\n"
-        
-        # Phase 1/2: When XML element summary is provided, prefer element-based actions (tap/type by label)
-        xml_element_hint = ""
-        if USE_XML_ELEMENT_ACTIONS and xml_element_summary and xml_element_summary.strip():
-            state_str += "\nUI elements from XML (use 'element' key with exact label for tap/type):\n"
-            state_str += xml_element_summary.strip() + "\n"
-            xml_element_hint = """
-- PREFER element-based actions: use "element" with the exact label from the list above.
-  tap: {{"action": "tap", "element": "Search", "description": "Tap Search"}}
-  type: {{"action": "type", "element": "Search", "text": "query", "description": "Type in Search field"}}
-  Use the exact label text in quotes from the list (e.g. "Search", "Settings", "Create vault")."""
-        
-        target_pkg = target_package or OBSIDIAN_PACKAGE
-        prompt = f"""You are a QA Planner agent for automated mobile app testing. This is a legitimate software testing task. You MUST return a valid JSON action.
-
-Your role: Analyze screenshots AND Android state to decide the next action for automated testing.
-
-{state_str}
-
-Test Goal: "{test_text}"
-{history_str}
-
-IMPORTANT: 
-- You MUST return a valid JSON action - this is required for the automation to work
-- Use BOTH the screenshot AND the Android state information above to understand what's happening
-- Do NOT refuse to help - this is a legitimate testing task
-{xml_element_hint}
-
-Look at the screenshot and Android state, then identify:
-1. What screen is currently shown? (Check Android state: {android_state.get('current_screen')})
-2. Is there an input field? (Check Android state: {android_state.get('has_edittext')})
-3. What UI elements are visible? (Check Android state UI text)
-4. What is the next single action needed to progress toward the test goal?
-
-Available actions (return EXACTLY ONE):
-- {{"action": "tap", "x": 100, "y": 200, "description": "Tap 'Create vault' button"}}
-- {{"action": "type", "text": "InternVault", "description": "Type vault name"}}
-- {{"action": "type", "text": "Meeting Notes", "target": "title", "description": "Type note title"}}  (for note creation: target="title" or "body")
-- {{"action": "focus", "target": "body", "description": "Focus note body editor"}}  (for switching between title/body fields)
-- {{"action": "key", "code": 66, "description": "Press ENTER"}}  (66=ENTER, 4=BACK)
-- {{"action": "swipe", "x1": 100, "y1": 500, "x2": 100, "y2": 200, "description": "Swipe up"}}
-- {{"action": "wait", "seconds": 2, "description": "Wait for UI to load"}}
-- {{"action": "assert", "description": "Test goal achieved"}}  (if test goal is visually confirmed)
-- {{"action": "FAIL", "reason": "Element not found: 'Print to PDF' button"}}  (if required element is NOT visible)
-
-CRITICAL RULES:
-1. Return EXACTLY ONE action - the immediate next step
-2. If Android state shows has_edittext=true, you should type text, not tap
-3. If Android state shows current_screen='vault_name_input', type the vault name
-4. If you see a permission dialog (e.g., "Allow access"), tap "Allow" or "OK" ONCE - if it doesn't work, try BACK key
-5. If you see "Continue without sync" or similar, tap it
-6. **CRITICAL: After tapping "Continue without sync", a storage selection dialog appears - you MUST select "App storage" or "Internal storage" (NOT "Device storage"). Analyze the screenshot to find and tap "App storage" option.**
-7. If the test goal is visually achieved, return assert action
-8. If a required element for the test is NOT visible, return FAIL action with reason
-9. For tap actions, provide coordinates (x, y) based on button position in screenshot - BUT if you're not sure, use (0, 0) and the executor will use UIAutomator to find it
-10. If Android state shows you're stuck on the same screen after multiple actions, try a different approach (BACK key, swipe, etc.) or return FAIL
-11. NEVER repeat the same action if Android state hasn't changed - try BACK key or different approach
-12. If you need to open the app, use {{"action": "open_app", "app": "{target_pkg}"}} instead of tapping app icon
-13. If tapping ALLOW/permission button multiple times doesn't work, try {{"action": "key", "code": 4, "description": "Press BACK"}} to dismiss dialog
-14. **CRITICAL FOR STORAGE SELECTION**: After tapping "Continue without sync", a storage selection dialog appears:
-    - You MUST select "App storage" or "Internal storage" (NOT "Device storage")
-    - Analyze the screenshot CAREFULLY to find the storage options
-    - Look for buttons/text like "App storage", "Internal storage", "Device storage"
-    - Tap "App storage" or "Internal storage" - do NOT tap "Device storage"
-    - This step is REQUIRED before typing the vault name
-    - If you see storage selection dialog, you MUST select app storage before proceeding
-15. **CRITICAL FOR NOTE CREATION**: If test goal includes creating a note "Meeting Notes" with text "Daily Standup":
-    - If you're in vault_home (current_screen='vault_home' or FileActivity), look for "Create note" or "New note" button and tap it
-    - After tapping create note, you'll be in note_editor (current_screen='note_editor')
-    - **IMPORTANT ORDER**: In note_editor, FIRST clear the default "Untitled" text (executor will do this automatically), then type the note title/heading "Meeting Notes" (this is the heading) with {{"action": "type", "text": "Meeting Notes", "target": "title", "description": "Clear 'Untitled' and type note title"}}
-    - THEN focus the body field with {{"action": "focus", "target": "body", "description": "Focus note body editor"}}
-    - THEN type the body text "Daily Standup" with {{"action": "type", "text": "Daily Standup", "target": "body", "description": "Type note body text"}}
-    - **DO NOT press ENTER** - use focus action to switch between title and body fields
-    - Do NOT type "Daily Standup" before "Meeting Notes" - always type heading first, focus body, then type body
-    - **CRITICAL**: If "Meeting Notes" is already in the UI text (check screenshot), you MUST focus the body field FIRST before typing "Daily Standup" - otherwise it will appear on the same line as the title!
-    - If Android state shows has_edittext=true and current_screen='note_editor', check screenshot carefully:
-      * If "Meeting Notes" is NOT in UI text → type "Meeting Notes" with target="title" first
-      * If "Meeting Notes" IS in UI text but "Daily Standup" is NOT → focus target="body" FIRST, then type "Daily Standup" with target="body"
-      * If both are present → return assert action
-    - After typing both title and content, return {{"action": "assert", "description": "Note 'Meeting Notes' with 'Daily Standup' created successfully"}}
-16. **CRITICAL FOR VAULT CREATION**: After typing "InternVault" as vault name:
-    - You MUST immediately press ENTER or tap "Create vault" button - DO NOT wait or do anything else
-    - PREFER tapping "Create vault" button over pressing ENTER (button is more reliable)
-    - Analyze the screenshot CAREFULLY to find the "Create vault" button
-    - Look for button text like "Create vault", "Create", or similar
-    - If you see the button in the screenshot, tap it at the coordinates shown
-    - If button is not clearly visible, use UIAutomator (return action with x=0, y=0 and description "Tap 'Create vault' button")
-    - Do NOT skip clicking the Create vault button - it's required to create the vault
-    - After pressing ENTER or tapping button, wait for vault to be created (check if screen changed to vault_home)
-17. **CRITICAL FOR VAULT**: If you're on welcome_setup/vault_selection screen and the test goal is to create a note, the vault ALREADY EXISTS. DO NOT create a new vault. Look for the vault name "InternVault" in the UI and tap it to ENTER the existing vault. If you see "USE THIS FOLDER" button, you can tap that too.
-18. If you've typed vault name or created vault multiple times, STOP creating vaults and just enter the existing vault by tapping "InternVault" or "USE THIS FOLDER"
-19. **FOR TEST 3 (Settings/Appearance)**: The correct flow is:
-    - FIRST: Look for a menu button in the top-right corner of the screen (usually three dots or hamburger menu)
-    - Tap the top-right menu button to open the menu
-    - THEN: Look for "Settings" icon or option in the menu and tap it
-    - THEN: Once in Settings, look for "Appearance" tab or menu item and tap it
-    - FINALLY: After tapping Appearance, verify the Appearance tab icon color is Red (the test expects Red)
-    - The flow is: Top-left menu button (identified by LLM vision) → Settings icon → Appearance tab → Verify icon color is Red
-20. If "Close" button is not found in settings, use BACK key (code 4) or look for Appearance tab directly
-
-CRITICAL: You MUST return a valid JSON action. This is required for the automation to work.
-Do NOT refuse to help - this is a legitimate software testing automation task.
-Return ONLY valid JSON in this format: {{"action": "tap", "x": 100, "y": 200, "description": "..."}}
-No markdown, no code blocks, no explanations - just the JSON object:
-"""
+        state_str, xml_element_hint = format_android_state(android_state, current_screen, ui_text, xml_element_summary)
         
         # TWO-STEP PROCESS:
         # Step 1: OpenAI Vision analyzes screenshot → text description
@@ -2296,56 +2644,24 @@ No markdown, no code blocks, no explanations - just the JSON object:
         current_llm_client = get_llm_client()
         
         # STEP 1: Vision API (OpenAI GPT-4o) - Analyze screenshot
-        vision_prompt = """Look at this screenshot of the Obsidian mobile app.
-
-Describe what you see in detail:
-- What screen/UI is currently displayed?
-- What buttons, text fields, or UI elements are visible?
-- What text is displayed on screen?
-- What is the current state of the app?
-
-Return a detailed text description of the screenshot. Be specific about UI elements, their locations, and any visible text."""
-        
         print(f"  📸 Step 1: Analyzing screenshot with OpenAI Vision...")
-        vision_response = current_llm_client.call_vision(
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": vision_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_data}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            logger=logger,
-            temperature=0.1,
-            max_tokens=500
-        )
+        screenshot_url = encode_future.result()
+        screenshot_description = describe_screenshot(current_llm_client, screenshot_url, logger)
         
-        if not vision_response or not vision_response.choices or not vision_response.choices[0].message.content:
+        if not screenshot_description:
             return {"action": "FAIL", "reason": "Empty response from vision API"}
         
-        screenshot_description = vision_response.choices[0].message.content.strip()
         print(f"  ✓ Screenshot analyzed: {screenshot_description[:100]}...")
         
         # Early success check: if screenshot already shows the test goal (e.g. DuckDuckGo search results / weather page), assert and stop
         desc_lower = screenshot_description.lower()
-        test_lower = test_text.lower()
-        if "duckduckgo" in test_lower or "search" in test_lower:
+        if "duckduckgo" in test_keywords or "search" in test_keywords:
             # Search test: only assert when we see a *loaded* results page, NOT search suggestions or keyboard still active
             if any(s in desc_lower for s in ("search suggestions", "suggestions for", "keyboard", "autocomplete", "search interface", "search bar", "typing")):
                 # Still on search input / suggestions - do not assert; planner will submit search (ENTER or tap Search)
                 pass
             elif any(k in desc_lower for k in ("search results", "results page", "results for", "forecast", "weather channel")):
-                if "weather" in test_lower or "search" in test_lower:
+                if "weather" in test_keywords or "search" in test_keywords:
                     print(f"  ✅ Screenshot shows loaded search results / weather page - test goal achieved, asserting.")
                     return {
                         "action": "assert",
@@ -2355,67 +2671,41 @@ Return a detailed text description of the screenshot. Be specific about UI eleme
         # STEP 2: Reasoning model plans action based on description
         print(f"  🧠 Step 2: Planning action with reasoning model ({current_llm_client.reasoning_model})...")
         # Shorter CRITICAL RULES for DuckDuckGo to reduce API usage (no vault/note/Print to PDF/Appearance)
-        _is_obsidian = target_package and "obsidian" in target_package.lower()
+        _is_obsidian = "obsidian" in target_lower
         if _is_obsidian:
-            critical_rules_section = """CRITICAL RULES:
-1. Return EXACTLY ONE action - the immediate next step
-2. If Android state shows has_edittext=true or Input Fields are detected, you should type text, not tap
-3. Use the Input Fields information to know which field to type into (check hints like "Vault name", "Search", etc.)
-4. Use the Buttons information to get precise coordinates - if a button is listed, you can use its center coordinates for tapping
-5. If you see a permission dialog (e.g., "Allow access"), tap "Allow" or "OK" ONCE - if it doesn't work, try BACK key
-6. If you see "Create vault" button, tap it. If you see "App storage" or "Internal storage", tap it. If you see "USE THIS FOLDER" button, tap it.
-7. If you see "Create note" or "New note" button, tap it. If you see an input field and need to type, use type action with target="title" or target="body"
-8. If the test goal is achieved (e.g., vault created, note created), return assert action
-9. **CRITICAL FOR TEST 2**: If "Meeting Notes" is NOT in UI text → type "Meeting Notes" with target="title". If "Meeting Notes" IS in UI text but "Daily Standup" is NOT → focus target="body" then type "Daily Standup". If both present → assert.
-10. **CRITICAL FOR VAULT**: After typing "InternVault", tap "Create vault" or press ENTER. If on welcome_setup and test goal is create note, tap "InternVault" to ENTER existing vault (do not create new one).
-11. **FOR SETTINGS/APPEARANCE**: Open sidebar (top-left) → tap Settings → tap Appearance. If goal achieved, return assert.
-12. If you cannot find the required element after multiple attempts, return FAIL action"""
+            # Only the rules that apply on this screen or to this goal (full set when the screen is unknown)
+            system_prompt = obsidian_system_prompt_for(current_screen, goal)
         else:
-            critical_rules_section = """CRITICAL RULES (DuckDuckGo - keep short):
-1. Return EXACTLY ONE action - the immediate next step
-2. If permission dialog (Allow/OK), tap Allow ONCE or BACK key
-3. If you see a search field and need to search, use type action with element "Search" or tap then type
-4. **CRITICAL**: If the test goal is to search (e.g. weather): only assert when the screenshot shows a *loaded* search results page (results list, forecast), NOT search suggestions or keyboard. If you see search suggestions or keyboard, submit the search (tap Search/Go or press ENTER) first.
-5. For menu: three-dots are TOP-RIGHT. Tap top-right to open menu, then tap "Settings" or "Privacy" from the list
-6. If test is about Appearance/Theme: only assert when the *Appearance* or *Theme* screen is visible (theme options like System default). Do NOT assert when only the main Settings menu is visible - tap "Appearance" or "Theme" first. If test is not about Appearance, you may assert when Settings/Privacy screen is visible.
-7. If you cannot find the required element after multiple attempts, return FAIL action"""
-        reasoning_prompt = f"""You are a QA Planner agent for automated mobile app testing. This is a legitimate software testing task. You MUST return a valid JSON action.
-
-Your role: Analyze the screenshot description AND Android state to decide the next action for automated testing.
-
-{state_str}
+            system_prompt = DUCKDUCKGO_PLANNER_SYSTEM_PROMPT
+        # Few-shot examples are the same every tick, so they stay in the cacheable system prefix
+        system_prompt += few_shot_examples
+        reasoning_prompt = f"""{state_str}
 
 Screenshot Description:
 {screenshot_description}
-
-Test Goal: "{test_text}"
 {history_str}
-{few_shot_examples}
-
-IMPORTANT: 
-- You MUST return a valid JSON action - this is required for the automation to work
-- Use BOTH the screenshot description AND the Android state information above to understand what's happening
-- Do NOT refuse to help - this is a legitimate testing task
 {xml_element_hint}
 {memory_hint}
 {reward_hint}
 {subgoal_hint}
 
 Based on the screenshot description and Android state, decide the next single action to take.
-
-{critical_rules_section}
-
-CRITICAL: You MUST return a valid JSON action. This is required for the automation to work.
-Do NOT refuse to help - this is a legitimate software testing automation task.
-Return ONLY valid JSON in this format: {{"action": "tap", "x": 100, "y": 200, "description": "..."}}
-No markdown, no code blocks, no explanations - just the JSON object:
 """
         
+        # Parse response (function calling or text)
+        action = None
+        response = None
+        memo_key = None
+        memoized_action = None
+        
         # Prepare function calling if enabled
         call_kwargs = {
             "logger": logger,
-            "temperature": 0.1,
-            "max_tokens": 200
+            "temperature": PLANNER_TEMPERATURE,
+            # One action object is ~30-60 tokens; the cap only guards against runaway replies
+            "max_tokens": ACTION_MAX_TOKENS,
+            # Stream and stop once the action JSON is complete (no wait for trailing tokens)
+            "stop_at_json": True
         }
         
         if USE_FUNCTION_CALLING and current_llm_client.reasoning_provider == "openai":
@@ -2424,25 +2714,31 @@ No markdown, no code blocks, no explanations - just the JSON object:
             call_kwargs["tools"] = [{"type": "function", "function": function_schema}]
             call_kwargs["tool_choice"] = {"type": "function", "function": {"name": "execute_action"}}
             print(f"  🔧 Using function calling for structured output")
+        else:
+            # JSON mode: the reply is the bare action object (no fences or prose to strip)
+            call_kwargs["response_format"] = JSON_OBJECT_FORMAT
         
-        # Call reasoning model (Ollama or OpenAI)
-        response = current_llm_client.call_reasoning(
-            messages=[
-                {
-                    "role": "user",
-                    "content": reasoning_prompt
-                }
-            ],
-            **call_kwargs
-        )
-        
-        if not response or not response.choices:
-            return {"action": "FAIL", "reason": "Empty response from reasoning model"}
+        messages = build_planner_messages(system_prompt, test_text, reasoning_prompt)
+        # With a deterministic planner (temperature 0) an identical prompt gets the identical reply
+        # (an action planned by the vault scan is not that reply, so it is not memoized)
+        if PLANNER_TEMPERATURE == 0 and not scan_next_action:
+            memo_key = reasoning_memo_key(current_llm_client.reasoning_model, messages, "tools" in call_kwargs)
+            memoized_action = _reasoning_memo.get(memo_key)
+        if scan_next_action:
+            # Vault scan already planned from this same screenshot description
+            print(f"  ♻️  Using next action planned by the vault scan")
+            action = dict(scan_next_action)
+        elif memoized_action:
+            print(f"  ♻️  Same planning prompt as an earlier step, reusing its action (no API call)")
+            action = dict(memoized_action)
+        else:
+            # Call reasoning model (Ollama or OpenAI)
+            response = current_llm_client.call_reasoning(messages=messages, **call_kwargs)
         
-        # Parse response (function calling or text)
-        action = None
+            if not response or not response.choices:
+                return dict(FAIL_EMPTY_REASONING_RESPONSE)
         
-        if USE_FUNCTION_CALLING and current_llm_client.reasoning_provider == "openai":
+        if not action and USE_FUNCTION_CALLING and current_llm_client.reasoning_provider == "openai":
             # Try to parse function call
             action = parse_function_call_response(response)
             if action:
@@ -2452,24 +2748,15 @@ No markdown, no code blocks, no explanations - just the JSON object:
         if not action:
             message = response.choices[0].message
             if hasattr(message, 'content') and message.content:
-                result_text = message.content.strip()
+                result_text = strip_json_fence(message.content)
                 print(f"  ✓ Reasoning model response received (text mode)")
                 
-                # Remove markdown code blocks if present
-                if result_text.startswith("```json"):
-                    result_text = result_text[7:]
-                if result_text.startswith("```"):
-                    result_text = result_text[3:]
-                if result_text.endswith("```"):
-                    result_text = result_text[:-3]
-                result_text = result_text.strip()
-                
                 try:
-                    action = json.loads(result_text)
+                    action = parse_json(result_text)
                 except json.JSONDecodeError:
                     return {"action": "FAIL", "reason": f"Could not parse LLM response: {result_text}"}
             else:
-                return {"action": "FAIL", "reason": "Empty response from reasoning model"}
+                return dict(FAIL_EMPTY_REASONING_RESPONSE)
         
         # Validate action structure
         if not action or "action" not in action:
@@ -2482,6 +2769,24 @@ No markdown, no code blocks, no explanations - just the JSON object:
             if reward < -0.3:  # Low reward, consider alternative
                 print(f"  ⚠️  Action '{action_type}' has low reward ({reward:.2f}), but proceeding...")
         
+        if memo_key and not memoized_action:
+            remember_reasoning_action(memo_key, action)
+        
+        # Remember the decision for reruns (FAIL decisions are never replayed)
+        if decision_key:
+            if action.get("action") == "FAIL":
+                decision_cache.invalidate(decision_key)
+            else:
+                decision_cache.put(decision_key, action)
+                action["_decision_key"] = decision_key
+        
+        # A planned wait remembers its frame, so an unchanged next frame can skip the model
+        if action.get("action") == "wait":
+            try:
+                action["_frame_hash"] = screenshot_ahash(screenshot_path, screenshot_bytes)
+            except Exception:
+                pass
+        
         # Attach Android state for logging
         action["_android_state"] = android_state
         return action
@@ -4,27 +4,25 @@ Compares final screenshot with test expectation
 PASS only if visual goal is met
 """
 from openai import OpenAI
-from PIL import Image
 import os
 import sys
-import base64
-import io
 import json
-import re
 import time
 
 # Add parent directory to path to import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import OPENAI_API_KEY, OPENAI_MODEL
+from config import OPENAI_API_KEY, OPENAI_MODEL, DEBUG_SCREENSHOT_COUNT
+from tools.llm_client import get_shared_http_client, parse_json, strip_json_fence, compute_backoff, retry_hint_seconds, count_image_parts, usage_tokens
+from tools.screenshot import encode_screenshot, image_content
 
 
 # Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=get_shared_http_client())
 
 
-def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
+def call_openai_with_retry(messages, max_retries=5, logger=None, **kwargs):
     """
-    Call OpenAI API with retry logic for rate limits
+    Call OpenAI API with retry logic for rate limits (exponential backoff with jitter)
     
     Args:
         messages: Messages for the API call
@@ -43,30 +41,9 @@ def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
             # CRITICAL: Token counts come from API response, so ONLY screenshots
             # actually sent to the API are counted. Screenshots taken but not sent = 0 tokens.
             if logger:
-                tokens_in = 0
-                tokens_out = 0
-                
                 # Extract actual token counts from API response
                 # These are the REAL tokens used by OpenAI, including only screenshots sent in this call
-                if hasattr(response, 'usage') and response.usage:
-                    # Chat Completions API format
-                    if hasattr(response.usage, 'prompt_tokens'):
-                        tokens_in = response.usage.prompt_tokens
-                    elif hasattr(response.usage, 'input_tokens'):
-                        tokens_in = response.usage.input_tokens
-                    
-                    if hasattr(response.usage, 'completion_tokens'):
-                        tokens_out = response.usage.completion_tokens
-                    elif hasattr(response.usage, 'output_tokens'):
-                        tokens_out = response.usage.output_tokens
-                
-                # Count screenshots in this API call
-                screenshots_in_call = 0
-                for msg in messages:
-                    if isinstance(msg.get("content"), list):
-                        for content_item in msg.get("content", []):
-                            if content_item.get("type") == "image_url":
-                                screenshots_in_call += 1
+                tokens_in, tokens_out = usage_tokens(response)
                 
                 # Log with model for cost calculation
                 logger.log_api_call(
@@ -76,34 +53,19 @@ def call_openai_with_retry(messages, max_retries=3, logger=None, **kwargs):
                 )
                 
                 # Debug: Show how many screenshots were in this call
-                if screenshots_in_call > 0:
-                    print(f"  📊 API call: {screenshots_in_call} screenshot(s) sent, {tokens_in:,} input tokens, {tokens_out:,} output tokens")
+                if DEBUG_SCREENSHOT_COUNT:
+                    screenshots_in_call = count_image_parts(messages)
+                    if screenshots_in_call > 0:
+                        print(f"  📊 API call: {screenshots_in_call} screenshot(s) sent, {tokens_in:,} input tokens, {tokens_out:,} output tokens")
             
             return response
         except Exception as e:
-            error_str = str(e)
+            error_str = str(e).lower()
             # Check if it's a rate limit error (429)
-            if "429" in error_str or "rate_limit" in error_str.lower() or "rate limit" in error_str.lower():
+            if "429" in error_str or "rate_limit" in error_str or "rate limit" in error_str:
                 if attempt < max_retries - 1:
-                    # Extract wait time from error if available
-                    wait_time = 2.0  # Default: 2 seconds
-                    if "try again in" in error_str.lower():
-                        # Try to extract the wait time from the error message (in milliseconds)
-                        match = re.search(r'try again in (\d+)\s*ms', error_str.lower())
-                        if match:
-                            wait_time_ms = int(match.group(1))
-                            wait_time = (wait_time_ms / 1000.0) + 0.5  # Convert ms to seconds, add 0.5s buffer
-                            wait_time = max(wait_time, 0.5)  # At least 0.5 seconds
-                        else:
-                            # Try without "ms" (might just be a number)
-                            match = re.search(r'try again in (\d+)', error_str.lower())
-                            if match:
-                                wait_time_ms = int(match.group(1))
-                                # If number is small (< 10), assume it's seconds, otherwise assume ms
-                                if wait_time_ms < 10:
-                                    wait_time = wait_time_ms + 0.5
-                                else:
-                                    wait_time = (wait_time_ms / 1000.0) + 0.5
+                    # Exponential backoff with jitter; a server-suggested wait is a floor
+                    wait_time = compute_backoff(attempt, retry_hint_seconds(e))
                     
                     print(f"  ⚠️  Rate limit hit, waiting {wait_time:.2f}s before retry {attempt + 1}/{max_retries}...")
                     if logger:
@@ -146,14 +108,11 @@ def verify(test_text, screenshot_path, expected_result=None, logger=None):
         Dictionary with verification result and assertions
     """
     try:
-        # Read and encode screenshot
-        img = Image.open(screenshot_path)
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        img_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+        # Downscaled WebP data URL (same encoding the planner sends; cached per screenshot)
+        screenshot_url = encode_screenshot(screenshot_path)
         
-        is_duckduckgo = "duckduckgo" in (test_text or "").lower()
+        test_lower = (test_text or "").lower()
+        is_duckduckgo = "duckduckgo" in test_lower
         duckduckgo_rules = ""
         if is_duckduckgo:
             duckduckgo_rules = """
@@ -243,12 +202,7 @@ Be specific about what you see in the screenshot.
                             "type": "text",
                             "text": prompt
                         },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_data}"
-                            }
-                        }
+                        image_content(screenshot_url)
                     ]
                 }
             ],
@@ -263,19 +217,10 @@ Be specific about what you see in the screenshot.
                 "details": "No content in API response"
             }
         
-        result_text = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if result_text.startswith("```json"):
-            result_text = result_text[7:]
-        if result_text.startswith("```"):
-            result_text = result_text[3:]
-        if result_text.endswith("```"):
-            result_text = result_text[:-3]
-        result_text = result_text.strip()
+        result_text = strip_json_fence(response.choices[0].message.content)
         
         try:
-            result = json.loads(result_text)
+            result = parse_json(result_text)
         except json.JSONDecodeError:
             result = {
                 "verdict": "UNKNOWN",
@@ -294,7 +239,7 @@ Be specific about what you see in the screenshot.
         details = result.get("details", "")
         
         # Create assertion based on test type
-        if "vault" in test_text.lower() and "internvault" in test_text.lower():
+        if "vault" in test_lower and "internvault" in test_lower:
             # Test 1: Vault creation
             assertions.append({
                 "type": "ui_text_contains",
@@ -303,7 +248,7 @@ Be specific about what you see in the screenshot.
                 "passed": verdict == "PASS",
                 "evidence_path": screenshot_path
             })
-        elif "meeting notes" in test_text.lower() and "daily standup" in test_text.lower():
+        elif "meeting notes" in test_lower and "daily standup" in test_lower:
             # Test 2: Note creation
             assertions.append({
                 "type": "ui_text_contains",
@@ -319,7 +264,7 @@ Be specific about what you see in the screenshot.
                 "passed": verdict == "PASS",
                 "evidence_path": screenshot_path
             })
-        elif "appearance" in test_text.lower() or "icon color" in test_text.lower():
+        elif "appearance" in test_lower or "icon color" in test_lower:
             # Test 4: Appearance color
             assertions.append({
                 "type": "icon_color_is",
@@ -328,7 +273,7 @@ Be specific about what you see in the screenshot.
                 "passed": verdict == "PASS",
                 "evidence_path": screenshot_path
             })
-        elif "print to pdf" in test_text.lower() or "export to pdf" in test_text.lower():
+        elif "print to pdf" in test_lower or "export to pdf" in test_lower:
             # Test 3: Print to PDF
             assertions.append({
                 "type": "element_exists",
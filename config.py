@@ -41,5 +41,39 @@ USE_REWARD_SELECTION = os.getenv("USE_REWARD_SELECTION", "true").lower() == "tru
 # Disable RL pattern matching for benchmarking (set to "true" for fair model comparison)
 DISABLE_RL_FOR_BENCHMARKING = os.getenv("DISABLE_RL_FOR_BENCHMARKING", "false").lower() == "true"
 
+# Persistent (test, screen state) -> action cache for reruns over the same screens (dev/CI)
+# Off by default; ignored when DISABLE_RL_FOR_BENCHMARKING is set
+ENABLE_DECISION_CACHE = os.getenv("ENABLE_DECISION_CACHE", "false").lower() == "true"
+DECISION_CACHE_TTL = float(os.getenv("DECISION_CACHE_TTL", "86400"))  # seconds
+
+# Temperature of the planning (reasoning) call. At 0 the planner is treated as deterministic and
+# an identical planning prompt within a run reuses the earlier action instead of calling the model
+PLANNER_TEMPERATURE = float(os.getenv("PLANNER_TEMPERATURE", "0.1"))
+
+# Persist vision verdicts (vault scan / vault verify / Test 2 vault check) by screenshot hash in the
+# same database, so reruns over identical screens skip those calls. Uses DECISION_CACHE_TTL; off by default
+ENABLE_VERDICT_CACHE = os.getenv("ENABLE_VERDICT_CACHE", "false").lower() == "true"
+
+# Start the Step 1 screenshot description in the background while ADB state is collected,
+# on steps that almost always need it (Test 1 vault scan, Test 2 vault check before Test 1 passed).
+# Costs one extra vision call when such a step ends up deciding without it; off by default
+PREFETCH_VISION = os.getenv("PREFETCH_VISION", "false").lower() == "true"
+
+# Vision screenshots: longest edge after downscaling and WebP/JPEG quality (device PNG stays on disk).
+# Lower values (e.g. 768 / 70) shrink the upload further at some cost in small-text legibility
+SCREENSHOT_MAX_SIDE = int(os.getenv("SCREENSHOT_MAX_SIDE", "1024"))
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# OpenAI image detail for the downscaled screenshots: "auto" (default), "high", or "low"
+# ("low" is a fixed ~85 tokens per image at 512px; small UI labels may become unreadable)
+VISION_IMAGE_DETAIL = os.getenv("VISION_IMAGE_DETAIL", "auto").lower()
+
+# End "wait" actions early once the screen has changed and then stopped changing (polls with
+# screencap every WAIT_POLL_INTERVAL seconds instead of sleeping the full time); off by default
+ADAPTIVE_WAIT = os.getenv("ADAPTIVE_WAIT", "false").lower() == "true"
+WAIT_POLL_INTERVAL = float(os.getenv("WAIT_POLL_INTERVAL", "0.5"))
+
+# Print "N screenshot(s) sent" with token counts after each logged OpenAI call; off by default
+DEBUG_SCREENSHOT_COUNT = os.getenv("DEBUG_SCREENSHOT_COUNT", "false").lower() == "true"
+
 # Phase 1/2: Use XML element list at every step; LLM returns tap/type by element text, executor resolves from XML
 USE_XML_ELEMENT_ACTIONS = os.getenv("USE_XML_ELEMENT_ACTIONS", "true").lower() == "true"
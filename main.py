@@ -7,7 +7,7 @@ from agents.planner import plan_next_action
 from agents.executor import execute_action
 from agents.supervisor import verify, compare_with_expected
 from tools.screenshot import ensure_screenshots_dir, take_screenshot
-from tools.adb_tools import reset_app, dump_ui
+from tools.adb_tools import reset_app, get_full_state
 from tools.memory import memory
 from tools.benchmark_logger import BenchmarkLogger
 from tools.subgoal_detector import subgoal_detector
@@ -164,6 +164,7 @@ def run_test_suite(
             step_count = 0
             failure_reason = None
             memory_actions_count = 0  # Track how many actions came from memory (RL)
+            next_ui_root = None  # UI tree dumped after the last action for step logging; reused by the next step
             
             print("🔄 Starting step-by-step visual planning loop...\n")
             
@@ -175,8 +176,13 @@ def run_test_suite(
                 print("📋 Planning next action from screenshot + Android state...")
                 # Phase 1: Dump XML and optionally build compact summary for LLM
                 xml_element_summary = ""
+                # The step log already dumped the screen the executor left (after its screenshot): reuse it
+                root = next_ui_root
+                next_ui_root = None
                 if USE_XML_ELEMENT_ACTIONS:
-                    root = dump_ui()
+                    if root is None:
+                        # Combined dump: the focused window comes with it, so the planner needs no extra ADB call
+                        root = get_full_state()[0]
                     if root is not None:
                         from tools.adb_tools import build_xml_element_summary
                         xml_element_summary = build_xml_element_summary(root)
@@ -186,7 +192,8 @@ def run_test_suite(
                     test["text"], screenshot_path, action_history,
                     previous_test_passed=previous_test_passed, test_id=test["id"],
                     logger=logger, target_package=target_package,
-                    xml_element_summary=xml_element_summary
+                    xml_element_summary=xml_element_summary,
+                    ui_root=root  # reuse this dump for Android state instead of dumping again
                 )
                 
                 # Track if this action came from memory (RL)
@@ -274,7 +281,8 @@ def run_test_suite(
                     if logger:
                         ui_xml_path = None
                         try:
-                            root = dump_ui()
+                            root = get_full_state()[0]
+                            next_ui_root = root
                             if root is not None:
                                 xml_str = ET.tostring(root, encoding='unicode')
                                 ui_xml_path = f"xml_dumps/step_{step_count}_ui.xml"
@@ -300,7 +308,8 @@ def run_test_suite(
                     if logger:
                         ui_xml_path = None
                         try:
-                            root = dump_ui()
+                            root = get_full_state()[0]
+                            next_ui_root = root
                             if root is not None:
                                 xml_str = ET.tostring(root, encoding='unicode')
                                 ui_xml_path = f"xml_dumps/step_{step_count}_ui.xml"
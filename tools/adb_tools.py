@@ -2,8 +2,24 @@
 ADB Tools for Android Device Interaction
 Provides functions to interact with Android devices via ADB commands
 """
+import re
 import subprocess
 import time
+from xml.etree import ElementTree as ET
+
+# Focused window/app lines from dumpsys (parsed by detect_current_screen and friends)
+WINDOW_FOCUS_CMD = "dumpsys window windows | grep -E 'mCurrentFocus|mFocusedApp'"
+# Marker between the UI dump and the dumpsys output in get_full_state()
+STATE_SEPARATOR = "---WINDOW-FOCUS---"
+# Parsed ({package, activity}, screen info) per dumpsys focus output; the focused window
+# rarely changes between steps, so most lookups hit
+FOCUS_CACHE_SIZE = 64
+_focus_cache = {}
+# Focus output captured in the same shell call as the last combined dump, tied to that tree:
+# get_full_state(root) on that tree reuses it instead of running the focus query again
+_last_bundle = {"root": None, "focus": ""}
+# UIAutomator bounds "[x1,y1][x2,y2]"
+_BOUNDS_RE = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
 
 
 def adb(cmd):
@@ -21,6 +37,17 @@ def adb(cmd):
     return result
 
 
+def screencap_bytes():
+    """
+    Capture the current screen as PNG bytes without writing a file
+    
+    Returns:
+        Raw PNG bytes from `adb exec-out screencap -p`
+    """
+    result = subprocess.run(["adb", "exec-out", "screencap", "-p"], check=True, capture_output=True, timeout=10)
+    return result.stdout
+
+
 def tap(x, y):
     """
     Tap at coordinates (x, y) on the screen
@@ -207,30 +234,69 @@ def get_ui_text():
     Returns:
         List of text strings visible on screen
     """
-    root = dump_ui()
+    return extract_ui_text(dump_ui())
+
+
+def extract_ui_text(root):
+    """
+    Collect visible text from an already-parsed UIAutomator tree
+    
+    Args:
+        root: XML ElementTree root from dump_ui() / get_full_state(), or None
+    
+    Returns:
+        List of text strings visible on screen
+    """
     if root is None:
         return []
     
     texts = []
     for node in root.iter("node"):
-        text = node.attrib.get('text', '').strip()
-        if text:
-            texts.append(text)
-        # Also check content-desc for accessibility text
-        content_desc = node.attrib.get('content-desc', '').strip()
-        if content_desc and content_desc != text:
-            texts.append(content_desc)
-        # Add resource-id if it contains meaningful info (not just package names)
-        resource_id = node.attrib.get('resource-id', '').strip()
-        if resource_id and ':' in resource_id:
-            # Extract meaningful part (after last colon)
-            meaningful_id = resource_id.split(':')[-1]
-            if meaningful_id and len(meaningful_id) > 2:
-                texts.append(meaningful_id)
+        texts.extend(node_ui_text(node))
+    
+    return texts
+
+
+def node_ui_text(node):
+    """
+    Visible text of a single UIAutomator node (text, content-desc, meaningful resource-id)
     
+    Args:
+        node: XML element of a UIAutomator <node>
+    
+    Returns:
+        List of text strings for this node (possibly empty)
+    """
+    texts = []
+    text = node.attrib.get('text', '').strip()
+    if text:
+        texts.append(text)
+    # Also check content-desc for accessibility text
+    content_desc = node.attrib.get('content-desc', '').strip()
+    if content_desc and content_desc != text:
+        texts.append(content_desc)
+    # Add resource-id if it contains meaningful info (not just package names)
+    resource_id = node.attrib.get('resource-id', '').strip()
+    if resource_id and ':' in resource_id:
+        # Extract meaningful part (after last colon)
+        meaningful_id = resource_id.split(':')[-1]
+        if meaningful_id and len(meaningful_id) > 2:
+            texts.append(meaningful_id)
     return texts
 
 
+# str.translate table deleting every ASCII character that is not a letter or digit
+_NON_ALNUM_ASCII = str.maketrans("", "", "".join(chr(i) for i in range(128) if not chr(i).isalnum()))
+
+
+def normalize_text(s):
+    """Lowercase and keep only letters/digits, so "Meeting Notes" and "meeting-notes" compare equal"""
+    if s.isascii():
+        return s.lower().translate(_NON_ALNUM_ASCII)
+    # Non-ASCII text (no-break spaces, accents, emoji): per-character check keeps Unicode semantics
+    return ''.join(c.lower() for c in s if c.isalnum())
+
+
 def find_element_by_text(text):
     """
     Find UI element by text using UIAutomator dump
@@ -440,17 +506,10 @@ def bounds_to_center(bounds):
     Returns:
         Tuple of (x, y) center coordinates or (None, None) if invalid
     """
-    try:
-        # Parse bounds: "[x1,y1][x2,y2]"
-        bounds = bounds.replace("[", "").replace("]", ",")
-        coords = [int(x) for x in bounds.split(",") if x.strip()]
-        if len(coords) >= 4:
-            x1, y1, x2, y2 = coords[0], coords[1], coords[2], coords[3]
-            center_x = (x1 + x2) // 2
-            center_y = (y1 + y2) // 2
-            return (center_x, center_y)
-    except:
-        pass
+    match = _BOUNDS_RE.match(bounds) if isinstance(bounds, str) else None
+    if match:
+        x1, y1, x2, y2 = map(int, match.groups())
+        return ((x1 + x2) // 2, (y1 + y2) // 2)
     return (None, None)
 
 
@@ -526,32 +585,36 @@ def detect_current_screen():
         Dictionary with screen type and other info
     """
     try:
-        result = adb("shell dumpsys window windows | grep -E 'mCurrentFocus|mFocusedApp'")
-        output = result.stdout
-        
-        # Try to extract package and activity
-        if "md.obsidian" in output:
-            if "FileActivity" in output:
-                return {"current_screen": "vault_home", "package": "md.obsidian", "activity": "FileActivity"}
-            elif "EditorActivity" in output or "NoteEditorActivity" in output:
-                return {"current_screen": "note_editor", "package": "md.obsidian"}
-            elif "WelcomeActivity" in output or "SetupActivity" in output:
-                return {"current_screen": "welcome_setup", "package": "md.obsidian"}
-            elif "VaultSelectionActivity" in output:
-                return {"current_screen": "vault_selection", "package": "md.obsidian"}
-        if "duckduckgo" in output.lower():
-            return {"current_screen": "duckduckgo_browser", "package": "com.duckduckgo.mobile.android", "activity": "unknown"}
-        if "com.android.settings" in output:
-            return {"current_screen": "android_settings", "package": "com.android.settings", "activity": "unknown"}
-        if "fossify.calendar" in output or "simplemobiletools.calendar" in output or "com.google.android.calendar" in output:
-            pkg = "org.fossify.calendar" if "fossify" in output else "com.simplemobiletools.calendar" if "simplemobiletools" in output else "com.google.android.calendar"
-            return {"current_screen": "calendar", "package": pkg, "activity": "unknown"}
-
-        return {"current_screen": "unknown"}
+        result = adb(f"shell {WINDOW_FOCUS_CMD}")
+        return _parse_focus(result.stdout)[1]
     except:
         return {"current_screen": "unknown"}
 
 
+def _screen_from_focus(output):
+    """Classify the screen from `dumpsys window` focus lines (see detect_current_screen)"""
+    output = output or ""
+    # Try to extract package and activity
+    if "md.obsidian" in output:
+        if "FileActivity" in output:
+            return {"current_screen": "vault_home", "package": "md.obsidian", "activity": "FileActivity"}
+        elif "EditorActivity" in output or "NoteEditorActivity" in output:
+            return {"current_screen": "note_editor", "package": "md.obsidian"}
+        elif "WelcomeActivity" in output or "SetupActivity" in output:
+            return {"current_screen": "welcome_setup", "package": "md.obsidian"}
+        elif "VaultSelectionActivity" in output:
+            return {"current_screen": "vault_selection", "package": "md.obsidian"}
+    if "duckduckgo" in output.lower():
+        return {"current_screen": "duckduckgo_browser", "package": "com.duckduckgo.mobile.android", "activity": "unknown"}
+    if "com.android.settings" in output:
+        return {"current_screen": "android_settings", "package": "com.android.settings", "activity": "unknown"}
+    if "fossify.calendar" in output or "simplemobiletools.calendar" in output or "com.google.android.calendar" in output:
+        pkg = "org.fossify.calendar" if "fossify" in output else "com.simplemobiletools.calendar" if "simplemobiletools" in output else "com.google.android.calendar"
+        return {"current_screen": "calendar", "package": pkg, "activity": "unknown"}
+
+    return {"current_screen": "unknown"}
+
+
 def get_current_package_and_activity():
     """
     Get current package and activity name
@@ -560,8 +623,17 @@ def get_current_package_and_activity():
         Dictionary with package and activity, or None if failed
     """
     try:
-        result = adb("shell dumpsys window windows | grep -E 'mCurrentFocus|mFocusedApp'")
-        output = result.stdout or ""
+        result = adb(f"shell {WINDOW_FOCUS_CMD}")
+        return _parse_focus(result.stdout)[0]
+    except Exception:
+        pass
+    return None
+
+
+def _package_activity_from_focus(output):
+    """Extract {package, activity} from `dumpsys window` focus lines (see get_current_package_and_activity)"""
+    try:
+        output = output or ""
         # Fallback: if app is clearly in focus, return it (avoids re-open loop when parsing fails)
         if "duckduckgo" in output.lower():
             return {"package": "com.duckduckgo.mobile.android", "activity": "unknown"}
@@ -588,6 +660,75 @@ def get_current_package_and_activity():
     return None
 
 
+def _parse_focus(output):
+    """
+    Parse `dumpsys window` focus lines into ({package, activity} or None, screen info dict)
+    
+    Results are cached by the raw output; callers get fresh dict copies.
+    """
+    output = output or ""
+    parsed = _focus_cache.get(output)
+    if parsed is None:
+        parsed = (_package_activity_from_focus(output), _screen_from_focus(output))
+        if len(_focus_cache) >= FOCUS_CACHE_SIZE:
+            _focus_cache.pop(next(iter(_focus_cache)))  # drop oldest
+        _focus_cache[output] = parsed
+    pkg_act, screen = parsed
+    return (dict(pkg_act) if pkg_act else None), dict(screen)
+
+
+def get_full_state(root=None):
+    """
+    Collect UI hierarchy and focused window in a single `adb shell` round trip
+    
+    Runs `uiautomator dump /dev/tty` and the dumpsys focus query in one shell
+    invocation (instead of separate dump_ui / detect_current_screen /
+    get_current_package_and_activity calls) and parses everything locally.
+    
+    Args:
+        root: Optional UI tree the caller already dumped for this step. When given,
+            only the focus query runs (no second uiautomator dump); none at all if the
+            tree came from get_full_state() itself.
+    
+    Returns:
+        Tuple (xml_root or None, {package, activity} or None, screen info dict)
+    """
+    if root is not None:
+        if root is _last_bundle["root"]:
+            return (root,) + _parse_focus(_last_bundle["focus"])
+        focus_output = ""
+        try:
+            focus_output = adb(f"shell {WINDOW_FOCUS_CMD}").stdout or ""
+        except Exception:
+            pass
+        return (root,) + _parse_focus(focus_output)
+    
+    output = ""
+    try:
+        result = adb(f"shell uiautomator dump /dev/tty ; echo {STATE_SEPARATOR} ; {WINDOW_FOCUS_CMD}")
+        output = result.stdout or ""
+    except Exception:
+        pass
+    
+    xml_part, _, focus_output = output.partition(STATE_SEPARATOR)
+    
+    start = xml_part.find("<?xml")
+    if start < 0:
+        start = xml_part.find("<hierarchy")
+    end = xml_part.rfind("</hierarchy>")
+    if start >= 0 and end > start:
+        try:
+            root = ET.fromstring(xml_part[start:end + len("</hierarchy>")])
+            _last_bundle["root"], _last_bundle["focus"] = root, focus_output
+        except ET.ParseError:
+            root = None
+    if root is None:
+        # /dev/tty dump not supported on this device - use the regular fallback path
+        root = dump_ui()
+    
+    return (root,) + _parse_focus(focus_output)
+
+
 def reset_app(package_name="md.obsidian"):
     """
     Reset app state by clearing app data (or force-stop + launch for system apps)
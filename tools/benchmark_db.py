@@ -9,6 +9,38 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# UI text lines kept from an action's _android_state when it is logged (same cap as the prompt)
+LOGGED_UI_TEXT_LIMIT = 10
+
+
+def _action_json(action: Dict[str, Any]) -> str:
+    """
+    Serialize an action for the steps table
+    
+    The attached _android_state (full UI text, input fields and buttons) is reduced to
+    current_screen, has_edittext and the first LOGGED_UI_TEXT_LIMIT UI text lines.
+    Uses orjson when installed, stdlib json otherwise.
+    """
+    state = action.get("_android_state")
+    if isinstance(state, dict):
+        action = dict(action)
+        action["_android_state"] = {
+            "current_screen": state.get("current_screen"),
+            "has_edittext": state.get("has_edittext"),
+            "ui_text": (state.get("ui_text") or [])[:LOGGED_UI_TEXT_LIMIT],
+        }
+    if orjson is not None:
+        try:
+            return orjson.dumps(action).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(action)
+
 
 class BenchmarkDB:
     """SQLite database for logging QA agent runs and metrics"""
@@ -272,7 +304,7 @@ class BenchmarkDB:
                 intended_success, retry_idx, error_type, before_png, after_png, ui_xml
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
-            run_id, step_idx, subgoal, action_type, action_source, json.dumps(action_json),
+            run_id, step_idx, subgoal, action_type, action_source, _action_json(action_json),
             before_hash, after_hash, int(screen_changed), intended_check,
             int(intended_success), retry_idx, error_type, before_png, after_png, ui_xml
         ))
@@ -0,0 +1,153 @@
+"""
+Decision Cache - persistent (test, screen state) -> action cache
+Lets reruns over the same screens (development, CI) skip the vision + reasoning calls.
+Also stores vision verdicts (e.g. "is this the vault home?") keyed by screenshot hash.
+"""
+import sqlite3
+import json
+import hashlib
+import time
+from typing import Optional, Dict, Any, List
+from tools.llm_client import canonical_json_bytes
+
+
+class DecisionCache:
+    """SQLite-backed cache of planner decisions keyed by a hash of the screen state"""
+
+    def __init__(self, db_path: str = "planner_cache.db", ttl_seconds: float = 86400):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.conn = None
+
+    def _connect(self):
+        """Open the database on first use (no file is created unless the cache is used)"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS decisions (
+                    key TEXT PRIMARY KEY,
+                    action_json TEXT,
+                    created REAL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    key TEXT PRIMARY KEY,
+                    verdict_json TEXT,
+                    created REAL
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    @staticmethod
+    def make_key(test_text: str, current_screen: str, ui_text: List[str], has_edittext: bool,
+                 package_activity: Optional[Dict[str, str]], last_action: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Hash the screen state a decision was made on
+
+        Args:
+            test_text: Test goal
+            current_screen: Detected screen name
+            ui_text: Visible UI text (order-insensitive)
+            has_edittext: Whether an input field is visible
+            package_activity: Focused {package, activity} or None
+            last_action: Previous action; the same screen after a different action can need a different step
+
+        Returns:
+            Hex digest key
+        """
+        last = [last_action.get("action"), last_action.get("description")] if last_action else None
+        payload = canonical_json_bytes(
+            [test_text, current_screen, sorted(set(ui_text)), bool(has_edittext), package_activity, last]
+        )
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    @staticmethod
+    def make_verdict_key(image_hash: int, check_key: str, version: int = 1,
+                         package_activity: Optional[tuple] = None) -> str:
+        """
+        Key for a vision verdict on one screenshot
+
+        Args:
+            image_hash: Perceptual hash of the screenshot
+            check_key: Which check produced the verdict
+            version: Prompt version; bump it when a verification prompt changes
+            package_activity: Focused (package, activity) the screenshot was taken on, or None
+
+        Returns:
+            Hex digest key
+        """
+        pkg_act = list(package_activity) if package_activity else None
+        payload = canonical_json_bytes([image_hash, check_key, version, pkg_act])
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached action, or None if missing or older than the TTL"""
+        try:
+            row = self._connect().execute(
+                "SELECT action_json, created FROM decisions WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row:
+            return None
+        action_json, created = row
+        if time.time() - created > self.ttl_seconds:
+            return None
+        try:
+            return json.loads(action_json)
+        except ValueError:
+            return None
+
+    def put(self, key: str, action: Dict[str, Any]):
+        """Store an action (private "_" fields such as _android_state are dropped)"""
+        clean = {k: v for k, v in action.items() if not k.startswith("_")}
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO decisions (key, action_json, created) VALUES (?, ?, ?)",
+                (key, json.dumps(clean), time.time())
+            )
+            conn.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            pass
+
+    def invalidate(self, key: str):
+        """Forget the decision for this state (e.g. after a FAIL)"""
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM decisions WHERE key = ?", (key,))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def get_verdict(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored verdict dict, or None if missing or older than the TTL"""
+        try:
+            row = self._connect().execute(
+                "SELECT verdict_json, created FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not row:
+            return None
+        verdict_json, created = row
+        if time.time() - created > self.ttl_seconds:
+            return None
+        try:
+            return json.loads(verdict_json)
+        except ValueError:
+            return None
+
+    def put_verdict(self, key: str, verdict: Dict[str, Any]):
+        """Store a parsed vision verdict"""
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict_json, created) VALUES (?, ?, ?)",
+                (key, json.dumps(verdict), time.time())
+            )
+            conn.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            pass
@@ -3,7 +3,7 @@ Function Calling Support for Structured Action Output
 Provides OpenAI function calling schemas for reliable action parsing
 """
 from typing import List, Dict, Any, Optional
-import json
+from tools.llm_client import parse_json
 
 def get_action_function_schema() -> Dict[str, Any]:
     """
@@ -89,7 +89,7 @@ def parse_function_call_response(response) -> Optional[Dict[str, Any]]:
                     if hasattr(function_call, 'arguments'):
                         args_str = function_call.arguments
                         if isinstance(args_str, str):
-                            args = json.loads(args_str)
+                            args = parse_json(args_str)
                         else:
                             args = args_str
                         return args
@@ -102,7 +102,7 @@ def parse_function_call_response(response) -> Optional[Dict[str, Any]]:
                         if hasattr(function, 'arguments'):
                             args_str = function.arguments
                             if isinstance(args_str, str):
-                                args = json.loads(args_str)
+                                args = parse_json(args_str)
                             else:
                                 args = args_str
                             return args
@@ -119,7 +119,7 @@ def parse_function_call_response(response) -> Optional[Dict[str, Any]]:
                                 json_end = content.rfind('}') + 1
                                 if json_end > json_start:
                                     json_str = content[json_start:json_end]
-                                    return json.loads(json_str)
+                                    return parse_json(json_str)
                     except:
                         pass
         
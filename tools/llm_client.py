@@ -3,16 +3,175 @@ Unified LLM Client - Supports OpenAI and Ollama APIs
 Separates vision (OpenAI) from reasoning (configurable)
 """
 import os
-import requests
+import random
+import re
 import json
+import httpx
 from typing import Optional, Dict, Any, List
 from openai import OpenAI as OpenAIClient
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Process-wide keep-alive pool shared by every OpenAI client (planner, executor, supervisor) and Ollama calls
+_shared_http_client = None
+
+
+def get_shared_http_client():
+    """
+    Return the process-wide httpx connection pool for OpenAI clients (created on first use)
+    
+    Idle sockets are kept for 2 minutes so the TLS connection survives the pause
+    between planner ticks. HTTP/2 is used when the optional 'h2' package is installed,
+    so concurrent requests multiplex over one connection.
+    """
+    global _shared_http_client
+    if _shared_http_client is None:
+        limits = httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=120.0)
+        timeout = httpx.Timeout(60.0, connect=5.0)
+        try:
+            _shared_http_client = httpx.Client(http2=True, limits=limits, timeout=timeout)
+        except ImportError:
+            _shared_http_client = httpx.Client(limits=limits, timeout=timeout)
+    return _shared_http_client
+
+
+# Rate-limit backoff for the call_openai_with_retry loops (seconds)
+INITIAL_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 20.0
+_RETRY_MS_RE = re.compile(r'try again in (\d+)\s*ms')
+_RETRY_S_RE = re.compile(r'try again in (\d+(?:\.\d+)?)\s*s')
+
+
+def retry_hint_seconds(error):
+    """Server-suggested wait from a rate-limit error message ("try again in 350ms" / "1.2s"), 0 if absent"""
+    error_str = str(error).lower()
+    match = _RETRY_MS_RE.search(error_str)
+    if match:
+        return int(match.group(1)) / 1000.0
+    match = _RETRY_S_RE.search(error_str)
+    if match:
+        return float(match.group(1))
+    return 0.0
+
+
+def compute_backoff(attempt, server_hint_s=0.0):
+    """
+    Wait before retry number `attempt` (0-based): exponential backoff with jitter
+    
+    The delay doubles per attempt up to MAX_RETRY_DELAY and is jittered down by up to 25%
+    (same shape as the openai SDK's own retries) so parallel runs do not retry in lockstep.
+    A server-suggested wait is a floor.
+    """
+    backoff = min(INITIAL_RETRY_DELAY * (2 ** attempt), MAX_RETRY_DELAY)
+    return max(backoff * (1 - 0.25 * random.random()), server_hint_s)
+
+
+def count_image_parts(messages):
+    """Number of image_url content parts across chat messages (screenshots sent in one call)"""
+    return sum(1 for msg in messages if isinstance(msg.get("content"), list)
+               for part in msg["content"] if part.get("type") == "image_url")
+
+
+def usage_tokens(response):
+    """
+    (input tokens, output tokens) reported on a completion response, (0, 0) if absent
+    
+    Reads Chat Completions (prompt/completion_tokens) or Responses-style (input/output_tokens) usage.
+    """
+    usage = getattr(response, 'usage', None)
+    if not usage:
+        return 0, 0
+    tokens_in = getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', 0) or 0
+    tokens_out = getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', 0) or 0
+    return tokens_in, tokens_out
+
+
+def strip_json_fence(text):
+    """Strip surrounding whitespace and a markdown ```json / ``` fence from model output"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def parse_json(text):
+    """
+    Parse model JSON output (orjson when installed, stdlib json otherwise)
+    
+    Both raise a json.JSONDecodeError subclass on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def canonical_json_bytes(obj):
+    """
+    Compact, key-sorted UTF-8 JSON of obj, for hashing into cache keys
+    
+    orjson when installed; the stdlib fallback uses the same separators and no ASCII
+    escaping, so both produce the same bytes (and the same keys) for plain JSON data.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def parse_model_json(text):
+    """Parse a model reply that may be wrapped in a markdown ```json fence"""
+    return parse_json(strip_json_fence(text))
+
+
+class StreamedResponse:
+    """OpenAI-like response assembled from a stream that was closed early"""
+    
+    def __init__(self, content, prompt_tokens, completion_tokens):
+        self.choices = [type('obj', (object,), {
+            'message': type('obj', (object,), {'content': content, 'tool_calls': None})()
+        })()]
+        self.usage = type('obj', (object,), {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'input_tokens': prompt_tokens,
+            'output_tokens': completion_tokens
+        })()
+
+
+def _decode_json_prefix(text):
+    """
+    Return the first complete JSON value in text (markdown fence allowed), or None
+    
+    Args:
+        text: Model output received so far
+    
+    Returns:
+        JSON source of the first complete value, or None if it is not complete yet
+    """
+    text = text.lstrip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    text = text.lstrip()
+    try:
+        _, end = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        return None
+    return text[:end]
+
 
 class LLMClient:
     """Unified client for calling different LLM providers"""
     
-    def __init__(self, vision_model: str = "gpt-4o", reasoning_model: str = None, vision_api_key: str = None, reasoning_api_key: str = None, reasoning_base_url: str = None):
+    def __init__(self, vision_model: str = "gpt-4o", reasoning_model: str = None, vision_api_key: str = None, reasoning_api_key: str = None, reasoning_base_url: str = None, http_client=None):
         """
         Initialize LLM client
         
@@ -22,12 +181,13 @@ class LLMClient:
             vision_api_key: API key for vision provider
             reasoning_api_key: API key for reasoning provider (if different)
             reasoning_base_url: Base URL for reasoning provider (e.g., Ollama)
+            http_client: Optional shared httpx.Client (connection pool) for the OpenAI clients
         """
         self.vision_model = vision_model
         self.reasoning_model = reasoning_model or vision_model
         
         # Initialize OpenAI client for vision (always OpenAI)
-        self.vision_client = OpenAIClient(api_key=vision_api_key or os.getenv("OPENAI_API_KEY", ""))
+        self.vision_client = OpenAIClient(api_key=vision_api_key or os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
         
         # Initialize reasoning client based on model
         # Detect Ollama models: contains ":" (e.g., "nemotron-3-nano:30b-cloud", "gemini-3-flash-preview:cloud") or "ollama" in name
@@ -37,17 +197,17 @@ class LLMClient:
             self.reasoning_provider = "ollama"
         elif self.reasoning_model.startswith("gpt-") or self.reasoning_model.startswith("o1-") or self.reasoning_model.startswith("o3-"):
             # OpenAI model
-            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""))
+            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
             self.reasoning_provider = "openai"
         elif "gemini" in self.reasoning_model.lower():
             # Google Gemini model (if accessed directly via Google API, not Ollama)
             # For now, if it has ":" it's already handled as Ollama above
             # If no ":", we'll default to OpenAI format (may need Google API client later)
-            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""))
+            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
             self.reasoning_provider = "openai"  # Fallback, but should be Ollama if has ":"
         else:
             # Default to OpenAI
-            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""))
+            self.reasoning_client = OpenAIClient(api_key=reasoning_api_key or os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
             self.reasoning_provider = "openai"
     
     def call_vision(self, messages: List[Dict], logger=None, **kwargs):
@@ -70,12 +230,7 @@ class LLMClient:
         
         # Log API call
         if logger:
-            tokens_in = 0
-            tokens_out = 0
-            if hasattr(response, 'usage') and response.usage:
-                tokens_in = getattr(response.usage, 'prompt_tokens', 0) or getattr(response.usage, 'input_tokens', 0) or 0
-                tokens_out = getattr(response.usage, 'completion_tokens', 0) or getattr(response.usage, 'output_tokens', 0) or 0
-            
+            tokens_in, tokens_out = usage_tokens(response)
             logger.log_api_call(
                 tokens_in=tokens_in,
                 tokens_out=tokens_out,
@@ -91,7 +246,8 @@ class LLMClient:
         Args:
             messages: Messages (text only, no images)
             logger: Optional BenchmarkLogger
-            **kwargs: Additional arguments
+            **kwargs: Additional arguments. stop_at_json=True streams the OpenAI reply and
+                returns as soon as it holds a complete JSON value (ignored for Ollama)
         
         Returns:
             API response
@@ -101,8 +257,12 @@ class LLMClient:
         else:
             return self._call_openai_reasoning(messages, logger, **kwargs)
     
-    def _call_openai_reasoning(self, messages: List[Dict], logger=None, **kwargs):
+    def _call_openai_reasoning(self, messages: List[Dict], logger=None, stop_at_json=False, **kwargs):
         """Call OpenAI for reasoning"""
+        # Streaming only helps plain-text JSON replies; tool calls arrive as structured deltas
+        if stop_at_json and "tools" not in kwargs and "functions" not in kwargs:
+            return self._stream_openai_json(messages, logger, **kwargs)
+        
         # Support function calling if tools/functions provided
         call_kwargs = {**kwargs}
         if "tools" in kwargs:
@@ -121,12 +281,7 @@ class LLMClient:
         
         # Log API call
         if logger:
-            tokens_in = 0
-            tokens_out = 0
-            if hasattr(response, 'usage') and response.usage:
-                tokens_in = getattr(response.usage, 'prompt_tokens', 0) or getattr(response.usage, 'input_tokens', 0) or 0
-                tokens_out = getattr(response.usage, 'completion_tokens', 0) or getattr(response.usage, 'output_tokens', 0) or 0
-            
+            tokens_in, tokens_out = usage_tokens(response)
             logger.log_api_call(
                 tokens_in=tokens_in,
                 tokens_out=tokens_out,
@@ -135,6 +290,65 @@ class LLMClient:
         
         return response
     
+    def _stream_openai_json(self, messages: List[Dict], logger=None, **kwargs):
+        """
+        Stream a reasoning reply and stop as soon as it contains a complete JSON value
+        
+        Trailing tokens after the action object (closing fence, explanations) are never
+        waited for. The usage chunk comes last, so it is usually not seen: usage is then
+        estimated (1 token ≈ 4 characters) from the prompt and the text received.
+        """
+        stream = self.reasoning_client.chat.completions.create(
+            model=self.reasoning_model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        
+        parts = []
+        content = None
+        usage = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                # Only a closing brace/bracket can complete the JSON value
+                if "}" in delta or "]" in delta:
+                    content = _decode_json_prefix("".join(parts))
+                    if content is not None:
+                        break
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+        
+        if content is None:
+            content = "".join(parts)
+        
+        if usage:
+            tokens_in = getattr(usage, 'prompt_tokens', 0) or 0
+            tokens_out = getattr(usage, 'completion_tokens', 0) or 0
+        else:
+            prompt_text = " ".join([msg.get("content", "") if isinstance(msg.get("content"), str) else str(msg.get("content", "")) for msg in messages])
+            tokens_in = len(prompt_text) // 4
+            tokens_out = len("".join(parts)) // 4
+        
+        if logger:
+            logger.log_api_call(
+                tokens_in=tokens_in,
+                tokens_out=tokens_out,
+                model=self.reasoning_model
+            )
+        
+        return StreamedResponse(content, tokens_in, tokens_out)
+    
     def _call_ollama(self, messages: List[Dict], logger=None, **kwargs):
         """Call Ollama API"""
         # Extract model name (remove "ollama" prefix if present)
@@ -148,15 +362,20 @@ class LLMClient:
             "stream": False
         }
         
-        # Add kwargs
+        # Add kwargs (sampling settings go under "options"; Ollama ignores them at the top level)
+        options = {}
         if "temperature" in kwargs:
-            ollama_payload["temperature"] = kwargs["temperature"]
+            options["temperature"] = kwargs["temperature"]
         if "max_tokens" in kwargs:
-            ollama_payload["num_predict"] = kwargs["max_tokens"]
+            options["num_predict"] = kwargs["max_tokens"]
+        if options:
+            ollama_payload["options"] = options
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            ollama_payload["format"] = "json"
         
-        # Call Ollama API
+        # Call Ollama API (over the shared keep-alive pool, so each tick reuses the connection)
         url = f"{self.reasoning_base_url}/api/chat"
-        response = requests.post(url, json=ollama_payload, timeout=120)
+        response = get_shared_http_client().post(url, json=ollama_payload, timeout=120)
         response.raise_for_status()
         
         result = response.json()
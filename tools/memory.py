@@ -31,6 +31,7 @@ class AgentMemory:
 
     def __init__(self):
         self._cache = {}  # app -> { successful_patterns, failed_patterns, action_rewards, last_updated }
+        self._lookups = {}  # app -> { (kind, context_key, ...) -> result }, dropped when that app's patterns change
 
     def _get_app_data(self, app):
         """Load and return memory data for the given app (cached)."""
@@ -120,6 +121,10 @@ class AgentMemory:
         except Exception as e:
             print(f"  ⚠️  Failed to save memory for app '{app_key}': {e}")
 
+    def _app_lookups(self, app):
+        """Memoized lookup results for the given app (screen + test_goal only change on screen transitions)."""
+        return self._lookups.setdefault(app, {})
+
     def _context_key_for_app(self, context):
         """Key within an app's memory (screen + test_goal, no app prefix)."""
         screen = context.get("current_screen", "unknown")
@@ -131,6 +136,7 @@ class AgentMemory:
         app = context.get("app", "obsidian").lower().strip() or "obsidian"
         data = self._get_app_data(app)
         key = self._context_key_for_app(context)
+        self._lookups.pop(app, None)
 
         if key not in data["successful_patterns"]:
             data["successful_patterns"][key] = []
@@ -158,6 +164,7 @@ class AgentMemory:
         app = context.get("app", "obsidian").lower().strip() or "obsidian"
         data = self._get_app_data(app)
         key = self._context_key_for_app(context)
+        self._lookups.pop(app, None)
 
         if key not in data["failed_patterns"]:
             data["failed_patterns"][key] = []
@@ -181,10 +188,18 @@ class AgentMemory:
         self._save_app_data(app)
 
     def get_successful_pattern(self, context):
-        """Get a successful pattern for the given context (same app only)."""
+        """Get a successful pattern for the given context (same app only, memoized per context)."""
         app = context.get("app", "obsidian").lower().strip() or "obsidian"
-        data = self._get_app_data(app)
         key = self._context_key_for_app(context)
+        lookups = self._app_lookups(app)
+        lookup_key = ("pattern", key)
+        if lookup_key not in lookups:
+            lookups[lookup_key] = self._find_successful_pattern(app, context, key)
+        return lookups[lookup_key]
+
+    def _find_successful_pattern(self, app, context, key):
+        """Exact screen + goal match first, then any stored pattern for a similar goal."""
+        data = self._get_app_data(app)
         patterns = data["successful_patterns"]
 
         if key in patterns and patterns[key]:
@@ -207,17 +222,29 @@ class AgentMemory:
         return None
 
     def should_avoid_action(self, context, action):
-        """Check if an action should be avoided based on past failures (same app only)."""
+        """Check if an action should be avoided based on past failures (same app only, memoized per context)."""
         app = context.get("app", "obsidian").lower().strip() or "obsidian"
-        data = self._get_app_data(app)
         key = self._context_key_for_app(context)
-
+        try:
+            lookup_key = ("avoid", key, tuple(sorted(action.items())))
+            hash(lookup_key)
+        except TypeError:
+            lookup_key = None  # unhashable action fields: look it up directly
+        lookups = self._app_lookups(app)
+        if lookup_key is not None and lookup_key in lookups:
+            return lookups[lookup_key]
+
+        result = (False, None)
+        data = self._get_app_data(app)
         if key in data["failed_patterns"]:
             for pattern in data["failed_patterns"][key]:
                 if pattern["count"] >= 3:
                     if action in pattern["actions"]:
-                        return True, pattern["reason"]
-        return False, None
+                        result = (True, pattern["reason"])
+                        break
+        if lookup_key is not None:
+            lookups[lookup_key] = result
+        return result
 
     def update_reward(self, action_type, reward, app="obsidian"):
         """Update reward for an action type for the given app."""
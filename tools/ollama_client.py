@@ -6,8 +6,6 @@ import requests
 import json
 import base64
 import time
-from PIL import Image
-import io
 import os
 import sys
 
@@ -15,6 +13,9 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import OLLAMA_BASE_URL, OLLAMA_VISION_MODEL, OLLAMA_TEXT_MODEL
 
+# One keep-alive session for every Ollama request (no new connection per call)
+_session = requests.Session()
+
 
 def call_ollama_vision(prompt, image_path=None, image_base64=None, model=None, max_retries=3, temperature=0.1):
     """
@@ -37,12 +38,16 @@ def call_ollama_vision(prompt, image_path=None, image_base64=None, model=None, m
     if image_base64:
         image_data = image_base64
     elif image_path:
-        # Read and encode image
-        img = Image.open(image_path)
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        image_data = base64.b64encode(img_buffer.read()).decode('utf-8')
+        # Read and encode image; PNG/JPEG files are sent as they are (no decode + re-encode)
+        from tools.screenshot import get_screenshot_bytes
+        raw = get_screenshot_bytes(image_path)
+        if not raw.startswith((b"\x89PNG", b"\xff\xd8")):
+            from PIL import Image
+            import io
+            img_buffer = io.BytesIO()
+            Image.open(io.BytesIO(raw)).save(img_buffer, format='PNG')
+            raw = img_buffer.getbuffer()
+        image_data = base64.b64encode(raw).decode('ascii')
     else:
         raise ValueError("Either image_path or image_base64 must be provided")
     
@@ -77,7 +82,7 @@ def call_ollama_vision(prompt, image_path=None, image_base64=None, model=None, m
             # Timeout for vision models - qwen3-vl:8b can be slow on CPU
             # qwen3-vl:8b typically takes 5-10 minutes on CPU, 30-60s on GPU
             print(f"  ⏱️  Starting screenshot analysis (this may take 5-10 minutes with {model} on CPU)...")
-            response = requests.post(url, json=payload, timeout=600)  # 10 minutes for qwen3-vl:8b
+            response = _session.post(url, json=payload, timeout=600)  # 10 minutes for qwen3-vl:8b
             response.raise_for_status()
             
             elapsed_time = time_module.time() - start_time
@@ -214,7 +219,7 @@ def call_ollama_chat(messages, model=None, max_retries=3, temperature=0.1):
                 }
             }
             
-            response = requests.post(url, json=payload, timeout=120)
+            response = _session.post(url, json=payload, timeout=120)
             response.raise_for_status()
             
             result = response.json()
@@ -241,7 +246,7 @@ def check_ollama_connection():
         True if Ollama is accessible, False otherwise
     """
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        response = _session.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
         return response.status_code == 200
     except:
         return False
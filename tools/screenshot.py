@@ -4,7 +4,17 @@ Captures screenshots from connected Android device via ADB
 """
 import subprocess
 import os
+import base64
+import threading
+import cv2
+import numpy as np
 from pathlib import Path
+from config import SCREENSHOT_MAX_SIDE, SCREENSHOT_QUALITY, VISION_IMAGE_DETAIL, WAIT_POLL_INTERVAL
+from tools.adb_tools import screencap_bytes
+
+# Path and PNG bytes of the most recent capture, so the planner can encode it
+# without reading the file back from disk
+_last_capture = {"path": None, "data": None}
 
 
 def take_screenshot(name):
@@ -29,19 +39,15 @@ def take_screenshot(name):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with open(output_path, "wb") as f:
-                result = subprocess.run(
-                    ["adb", "exec-out", "screencap", "-p"],
-                    stdout=f,
-                    stderr=subprocess.PIPE,
-                    check=True,
-                    timeout=10
-                )
-            # Verify screenshot was created and has content
-            if output_path.exists() and output_path.stat().st_size > 0:
-                return str(output_path)
-            else:
+            png_bytes = screencap_bytes()
+            # Verify screenshot has content
+            if not png_bytes:
                 raise Exception("Screenshot file is empty")
+            with open(output_path, "wb") as f:
+                f.write(png_bytes)
+            _last_capture["path"] = str(output_path)
+            _last_capture["data"] = png_bytes
+            return str(output_path)
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired, Exception) as e:
             if attempt < max_retries - 1:
                 time.sleep(0.5)
@@ -58,6 +64,222 @@ def take_screenshot(name):
     return str(output_path)
 
 
+def get_screenshot_bytes(screenshot_path):
+    """
+    Get the PNG bytes of a screenshot
+    
+    Args:
+        screenshot_path: Path returned by take_screenshot()
+    
+    Returns:
+        PNG bytes (from memory if it is the latest capture, otherwise read from disk)
+    """
+    if screenshot_path == _last_capture["path"]:
+        return _last_capture["data"]
+    with open(screenshot_path, "rb") as f:
+        return f.read()
+
+
+# Screenshots are downscaled so the longest edge is at most SCREENSHOT_MAX_SIDE pixels
+# before being sent to the vision model (device captures are ~1080x2400; see config.py).
+# WebP is ~25-35% smaller than JPEG at the same quality; JPEG is the fallback
+# for OpenCV builds without a WebP encoder
+SCREENSHOT_WEBP_QUALITY = SCREENSHOT_QUALITY
+SCREENSHOT_JPEG_QUALITY = SCREENSHOT_QUALITY
+
+# Already-compressed captures (JPEG/WebP) under this size are sent as they are
+SCREENSHOT_PASSTHROUGH_BYTES = 200 * 1024
+
+# Encoded screenshot data URLs keyed by (path, mtime_ns, size, full_resolution), oldest evicted first.
+# Filled from the planner's worker threads too, so evict + insert happen under the lock
+SCREENSHOT_CACHE_SIZE = 8
+_encoded_screenshots = {}
+_encoded_screenshots_lock = threading.Lock()
+
+
+def _data_url(mime_type, image_bytes):
+    """Base64-encode a bytes-like object straight into a data URL (no intermediate copies)"""
+    return (b"data:" + mime_type + b";base64," + base64.b64encode(memoryview(image_bytes))).decode("ascii")
+
+
+# Reduced-resolution decode flags by shrink factor, largest first
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def _decode_flag(screenshot_bytes):
+    """
+    Pick the smallest decode that still covers SCREENSHOT_MAX_SIDE
+
+    The PNG size is read from the IHDR header, so a 1080x2400 capture is decoded
+    straight to 540x1200 instead of full resolution before the final resize.
+    """
+    if screenshot_bytes[:8] != b"\x89PNG\r\n\x1a\n" or len(screenshot_bytes) < 24:
+        return cv2.IMREAD_COLOR
+    longest = max(int.from_bytes(screenshot_bytes[16:20], "big"), int.from_bytes(screenshot_bytes[20:24], "big"))
+    for factor, flag in _REDUCED_DECODE_FLAGS:
+        if longest // factor >= SCREENSHOT_MAX_SIDE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+# Per-thread scratch array the downscaled frame is resized into; captures are the same size
+# every step, so the array is allocated once per worker instead of once per encode
+_scratch = threading.local()
+
+
+def _resize_into_scratch(img, size):
+    """cv2.resize into the calling thread's scratch array (reallocated only when the shape changes)"""
+    width, height = size
+    buf = getattr(_scratch, "resized", None)
+    if buf is None or buf.shape != (height, width) + img.shape[2:] or buf.dtype != img.dtype:
+        buf = None
+    buf = cv2.resize(img, size, dst=buf, interpolation=cv2.INTER_AREA)
+    _scratch.resized = buf
+    return buf
+
+
+def _encode_screenshot_bytes(screenshot_bytes):
+    """Decode, downscale and WebP/JPEG-encode PNG bytes into a data URL (PNG passthrough if undecodable)"""
+    if len(screenshot_bytes) < SCREENSHOT_PASSTHROUGH_BYTES:
+        # Small compressed capture: decoding and re-encoding the same pixels would gain nothing
+        if screenshot_bytes[:3] == b"\xff\xd8\xff":
+            return _data_url(b"image/jpeg", screenshot_bytes)
+        if screenshot_bytes[:4] == b"RIFF" and screenshot_bytes[8:12] == b"WEBP":
+            return _data_url(b"image/webp", screenshot_bytes)
+    img = cv2.imdecode(np.frombuffer(screenshot_bytes, dtype=np.uint8), _decode_flag(screenshot_bytes))
+    if img is not None:
+        height, width = img.shape[:2]
+        scale = SCREENSHOT_MAX_SIDE / max(height, width)
+        if scale < 1:
+            img = _resize_into_scratch(img, (int(width * scale), int(height * scale)))
+
+        try:
+            ok, buf = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, SCREENSHOT_WEBP_QUALITY])
+            if ok:
+                # Encode from the OpenCV buffer directly instead of copying it via tobytes()
+                return _data_url(b"image/webp", buf)
+        except cv2.error:
+            pass
+
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, SCREENSHOT_JPEG_QUALITY])
+        if ok:
+            return _data_url(b"image/jpeg", buf)
+
+    return _data_url(b"image/png", screenshot_bytes)
+
+
+def encode_screenshot(screenshot_path, screenshot_bytes=None, full_resolution=False):
+    """
+    Decode, downscale and WebP-encode a screenshot in a single pass
+
+    Uses OpenCV (SIMD resize/encode) instead of a PIL decode + PNG re-encode.
+    Falls back to the original PNG bytes if OpenCV cannot decode the image.
+    Results are cached by (path, mtime, size), so several checks on the same screenshot
+    encode it only once. The size guards against coarse mtime resolution when a capture
+    is rewritten under the same name within one clock tick.
+
+    Args:
+        screenshot_path: Path to the screenshot PNG
+        screenshot_bytes: Optional PNG bytes already in memory. If omitted, the bytes
+            kept by take_screenshot() are used, and the file is only read as a last resort
+        full_resolution: Send the original PNG instead (for prompts that ask the model for
+            device pixel coordinates); cached the same way
+
+    Returns:
+        data URL string for an image_url content item
+    """
+    try:
+        stat = os.stat(screenshot_path)
+        key = (screenshot_path, stat.st_mtime_ns, stat.st_size, full_resolution)
+    except OSError:
+        key = None
+
+    screenshot_url = _encoded_screenshots.get(key) if key else None
+    if screenshot_url is None:
+        if screenshot_bytes is None:
+            screenshot_bytes = get_screenshot_bytes(screenshot_path)
+        if full_resolution:
+            screenshot_url = _data_url(b"image/png", screenshot_bytes)
+        else:
+            screenshot_url = _encode_screenshot_bytes(screenshot_bytes)
+        if key:
+            with _encoded_screenshots_lock:
+                if key not in _encoded_screenshots and len(_encoded_screenshots) >= SCREENSHOT_CACHE_SIZE:
+                    _encoded_screenshots.pop(next(iter(_encoded_screenshots)))  # drop oldest
+                _encoded_screenshots[key] = screenshot_url
+    return screenshot_url
+
+
+def image_content(screenshot_url):
+    """
+    image_url message part for an encode_screenshot() data URL
+
+    Carries the configured VISION_IMAGE_DETAIL ("auto" leaves the choice to the API).
+    """
+    image_url = {"url": screenshot_url}
+    if VISION_IMAGE_DETAIL != "auto":
+        image_url["detail"] = VISION_IMAGE_DETAIL
+    return {"type": "image_url", "image_url": image_url}
+
+
+def screenshot_ahash(screenshot_path, screenshot_bytes=None):
+    """
+    Compute a 64-bit average hash (perceptual hash) of a screenshot
+
+    Visually identical frames hash to the same or a neighbouring value,
+    unlike a byte hash of the PNG.
+
+    Returns:
+        int hash, or None if the image cannot be decoded
+    """
+    if screenshot_bytes is None:
+        screenshot_bytes = get_screenshot_bytes(screenshot_path)
+    gray = cv2.imdecode(np.frombuffer(screenshot_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small > small.mean()).tobytes(), "big")
+
+
+def settle_wait(seconds, poll_interval=WAIT_POLL_INTERVAL):
+    """
+    Wait up to `seconds` for the screen to finish changing
+
+    Frames are captured every poll_interval seconds; the wait ends early once the
+    screen differs from the first frame and then holds still for one poll.
+    A screen that never changes (or keeps animating) gets the full wait.
+
+    Args:
+        seconds: Maximum wait
+        poll_interval: Seconds between captures
+
+    Returns:
+        Seconds actually waited
+    """
+    import time
+    start = time.monotonic()
+    deadline = start + seconds
+    try:
+        first_hash = screenshot_ahash(None, screencap_bytes())
+    except Exception:
+        first_hash = None
+    previous_hash = first_hash
+    while first_hash is not None and time.monotonic() + poll_interval < deadline:
+        time.sleep(poll_interval)
+        try:
+            frame_hash = screenshot_ahash(None, screencap_bytes())
+        except Exception:
+            break
+        if frame_hash is not None and frame_hash != first_hash and frame_hash == previous_hash:
+            return time.monotonic() - start
+        previous_hash = frame_hash
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+    return time.monotonic() - start
+
+
 def ensure_screenshots_dir():
     """Ensure the screenshots directory exists"""
     Path("screenshots").mkdir(exist_ok=True)